@@ -47,12 +47,18 @@ if __name__ == "__main__":
         "--additional_target_names",
         nargs="+",
         help="The names of the target functions and classes to include.")
+    parser.add_argument(
+        "--mode",
+        choices=["ast", "text"],
+        default="ast",
+        help="Build mode of build_lambda_src.py.")
 
     args = parser.parse_args()
 
     comb_args = [
         "./app/aws_build/build_lambda_src.py",
-        "-s", args.sg_class, "-t", args.te_class, "-o", tmp_file
+        "-s", args.sg_class, "-t", args.te_class, "-o", tmp_file,
+        "-m", args.market_class, "--mode", args.mode
     ]
     if args.directories is None:
         args.directories = []
@@ -1,6 +1,11 @@
 import os
 import re
+import ast
+import sys
+import builtins
 import argparse
+import json
+import subprocess
 
 base_file = "./app/aws_build/_lambda_base.py"
 tmp_file = "_tmp_s.py"
@@ -58,16 +63,26 @@ def extract_imports_and_definitions(file_path, target_names, logger):
     with open(file_path, 'r', encoding='utf-8') as file:
         lines = file.readlines()
 
+    # Module level import statements only. Indented imports (try blocks,
+    # functions) and lines inside docstrings are not hoisted.
+    import_statements = {}
+    for stmt in ast.parse("".join(lines), filename=file_path).body:
+        if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            import_statements[stmt.lineno - 1] = "".join(
+                lines[stmt.lineno - 1:stmt.end_lineno])
+            for i in range(stmt.lineno, stmt.end_lineno):
+                import_statements[i] = None
+
     imports = []
     definitions = []
     inside_class = False
     current_indent_level = 0
     current_class_lines = []
 
-    for line in lines:
-        if line.strip().startswith("import ") or line.strip().startswith(
-                "from "):
-            if line not in imports and "tqdm" not in line and "matplotlib" not in line and "plotly" not in line:
+    for i, line in enumerate(lines):
+        if i in import_statements:
+            line = import_statements[i]
+            if line is not None and line not in imports and "tqdm" not in line and "matplotlib" not in line and "plotly" not in line:
                 imports.append(line)
         elif re.match(r'^\s*class\s+(\w+)\s*[\(:]', line):
             class_name = re.findall(r'^\s*class\s+(\w+)\s*[\(:]', line)[0]
@@ -142,6 +157,20 @@ def combine_files(directory, output_file, target_names):
             out_file.write(definition)
 
 
+def append_state_module(directories, output_file, module="dynamodb.py"):
+    """Append the whole state store module (DynamoDBStateStore and its codec).
+    The text mode copies only classes, so module constants would be missing.
+    """
+    for file_path in sorted(find_python_files(directories)):
+        if os.path.basename(file_path) == module:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                source = f.read()
+            with open(output_file, 'a', encoding='utf-8') as out_file:
+                out_file.write("\n\n" + source)
+            return
+    raise FileNotFoundError(f"{module} is not found in {directories}")
+
+
 def create_lamda_file(base_file, tmp_file, out_file, sg_class, te_class,
                       market_class):
     out = []
@@ -171,17 +200,440 @@ def create_lamda_file(base_file, tmp_file, out_file, sg_class, te_class,
     with open(out_file, "w") as f:
         f.write("".join(out))
 
-def main_fn(market_class, sg_class, te_class, directories, output_file, additional_target_names=None):
+class SourceFile():
+    """Top-level definitions and imports of one Python file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'r', encoding='utf-8') as f:
+            self.source = f.read()
+        self.tree = ast.parse(self.source, filename=path)
+        self.definitions = {}  # name -> top-level statement
+        self.imports = {}      # alias -> (module, name or None)
+        self.relative = {}     # alias -> imported name (another scanned file)
+        for stmt in self.tree.body:
+            if isinstance(stmt, ast.Import):
+                for alias in stmt.names:
+                    name = alias.asname or alias.name.split(".")[0]
+                    module = alias.name if alias.asname else name
+                    self.imports[name] = (module, None)
+            elif isinstance(stmt, ast.ImportFrom):
+                for alias in stmt.names:
+                    if alias.name == "*":
+                        continue
+                    if stmt.level > 0:
+                        self.relative[alias.asname or alias.name] = alias.name
+                    else:
+                        self.imports[alias.asname or alias.name] = (stmt.module, alias.name)
+            elif isinstance(stmt, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                self.definitions[stmt.name] = stmt
+            elif isinstance(stmt, (ast.Assign, ast.AnnAssign, ast.Try)):
+                # Constants and optional imports (try: import x except ImportError)
+                for name in _bound_names(stmt):
+                    self.definitions[name] = stmt
+
+    def segment(self, stmt) -> str:
+        return ast.get_source_segment(self.source, stmt)
+
+
+def _bound_names(stmt) -> set:
+    """Names a top-level statement binds in the module."""
+    if isinstance(stmt, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+        return {stmt.name}
+    names = set()
+    for node in ast.walk(stmt):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                names.add(alias.asname or alias.name.split(".")[0])
+    return names
+
+
+def _used_names(node) -> set:
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)
+            and isinstance(n.ctx, (ast.Load, ast.Del))}
+
+
+class _ImportTimeNames(ast.NodeVisitor):
+    """Names evaluated while a module is imported. Function and lambda
+    bodies run later, but decorators, defaults and annotations do not.
+    """
+
+    def __init__(self):
+        self.names = set()
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, (ast.Load, ast.Del)):
+            self.names.add(node.id)
+
+    def visit_FunctionDef(self, node):
+        for child in node.decorator_list + node.args.defaults + [
+                d for d in node.args.kw_defaults if d is not None]:
+            self.visit(child)
+        for arg in node.args.args + node.args.kwonlyargs + node.args.posonlyargs:
+            if arg.annotation is not None:
+                self.visit(arg.annotation)
+        if node.returns is not None:
+            self.visit(node.returns)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        for child in node.args.defaults:
+            self.visit(child)
+
+
+def _import_time_names(stmts) -> set:
+    visitor = _ImportTimeNames()
+    for stmt in stmts:
+        visitor.visit(stmt)
+    return visitor.names
+
+
+LAZY_MODULE_SRC = '''class _LazyModule():
+    """Module imported at the first attribute access (lambda build)."""
+
+    def __init__(self, alias, name):
+        self._alias = alias
+        self._name = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        # Later lookups of the alias find the module itself
+        globals()[self._alias] = module
+        return getattr(module, attr)
+'''
+
+
+_IMPORT_ERRORS = {"ImportError", "ModuleNotFoundError", "Exception"}
+
+
+def _is_optional_import(stmt) -> bool:
+    """True for try: import x except ImportError: x = None"""
+    if not isinstance(stmt, ast.Try) or stmt.orelse or stmt.finalbody:
+        return False
+    if not all(isinstance(s, (ast.Import, ast.ImportFrom)) for s in stmt.body):
+        return False
+    return all(h.type is None or (isinstance(h.type, ast.Name)
+                                  and h.type.id in _IMPORT_ERRORS)
+               for h in stmt.handlers)
+
+
+def _lazy_optional_import(f, stmt, import_time, logger):
+    """Source of an optional import block with its plain imports deferred
+    like top-level ones. find_spec() keeps the except branch for missing
+    modules without importing them.
+
+    Returns:
+        tuple: (source, True if a _LazyModule was written)
+    """
+    lines = f.segment(stmt).splitlines()
+    replaced = {}
+    for imp in stmt.body:
+        if not isinstance(imp, ast.Import):
+            continue
+        indent = " " * imp.col_offset
+        new = []
+        for alias in imp.names:
+            name = alias.asname or alias.name.split(".")[0]
+            module = alias.name if alias.asname else name
+            top_module = module.split(".")[0]
+            if name in import_time or top_module in sys.stdlib_module_names:
+                new.append(indent + _import_line(module, None, name))
+                continue
+            new += [f"{indent}if importlib.util.find_spec({top_module!r}) is None:",
+                    f"{indent}    raise ModuleNotFoundError({top_module!r})",
+                    f"{indent}{name} = _LazyModule({name!r}, {module!r})"]
+            logger(f"Lazy import: {module}")
+        if any("_LazyModule" in line for line in new):
+            replaced[imp.lineno - stmt.lineno] = (imp.end_lineno - stmt.lineno, new)
+    if not replaced:
+        return "\n".join(lines), False
+    out = []
+    i = 0
+    while i < len(lines):
+        if i in replaced:
+            end, new = replaced[i]
+            out += new
+            i = end + 1
+        else:
+            out.append(lines[i])
+            i += 1
+    return "\n".join(out), True
+
+
+def _import_line(module, name, alias):
+    if name is None:
+        return f"import {module}" if alias == module else f"import {module} as {alias}"
+    return f"from {module} import {name}" if alias == name else f"from {module} import {name} as {alias}"
+
+
+def build_pruned_source(base_source, directories, target_names=(), logger=print):
+    """Build the Lambda source with AST analysis.
+
+    Only the definitions reachable from the base file (and target_names) are
+    copied, superclasses and module constants of any depth included, in
+    dependency order. Imports are kept only if a copied definition uses
+    them. Plain module imports that are only used inside function bodies
+    are deferred with _LazyModule until their first use, also inside
+    optional import blocks (try: import x except ImportError: ...).
+
+    Args:
+        base_source (str): _lambda_base.py with the class names filled in
+        directories (list): directories to search for Python files
+        target_names (list): additional names to include
+
+    Returns:
+        str: source of the Lambda function
+    """
+    files = []
+    seen = set()
+    for path in sorted(find_python_files(directories)):
+        real_path = os.path.realpath(path)
+        if real_path not in seen:
+            seen.add(real_path)
+            files.append(SourceFile(path))
+    owners = {}
+    local_modules = set()  # packages / modules in the directories
+    for f in files:
+        for name in f.definitions:
+            owners.setdefault(name, []).append(f)
+        parts = os.path.normpath(os.path.splitext(f.path)[0]).split(os.sep)
+        local_modules.update(parts)
+
+    marker = "{Class src}"
+    head, tail = base_source.split(marker, 1)
+    head = head[:head.rfind("\n") + 1]
+    tail = tail[tail.find("\n") + 1:]
+    base_tree = ast.parse(head + tail)
+    base_names = set()
+    base_imports = {}
+    for stmt in base_tree.body:
+        if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            for alias in stmt.names:
+                if isinstance(stmt, ast.Import):
+                    name = alias.asname or alias.name.split(".")[0]
+                    base_imports[name] = (alias.name if alias.asname else name, None)
+                else:
+                    base_imports[alias.asname or alias.name] = (stmt.module, alias.name)
+        else:
+            base_names |= _bound_names(stmt)
+    builtin_names = set(dir(builtins))
+
+    selected = {}   # (path, name) -> (SourceFile, stmt)
+    order = []
+    imports = {}    # alias -> (module, name)
+    visiting = set()
+
+    def resolve(name, f):
+        """(SourceFile, name) of a definition, ("import", key) or None."""
+        if name in base_names:
+            return None
+        if f is not None:
+            if name in f.definitions:
+                return f, name
+            if name in f.imports:
+                module, imported = f.imports[name]
+                # from BitSysTrade.xxx import Yyy is copied like a relative import
+                if not (imported in owners and module.split(".")[0] in local_modules):
+                    return "import", f.imports[name]
+                name = imported
+            elif name in f.relative:
+                name = f.relative[name]
+        elif name in base_imports:
+            return "import", base_imports[name]
+        if name in builtin_names:
+            return None
+        candidates = owners.get(name, [])
+        if len(candidates) > 1:
+            logger(f"Warning: {name} is defined in {len(candidates)} files, "
+                   f"using {candidates[0].path}")
+        return (candidates[0], name) if candidates else None
+
+    def visit(name, f):
+        target = resolve(name, f)
+        if target is None:
+            return
+        if target[0] == "import":
+            imports[name] = target[1]
+            return
+        f, name = target
+        stmt = f.definitions[name]
+        key = (f.path, id(stmt))
+        if key in selected or key in visiting:
+            return
+        visiting.add(key)
+        for used in sorted(_used_names(stmt) - _bound_names(stmt)):
+            visit(used, f)
+        visiting.discard(key)
+        selected[key] = (f, stmt)
+        order.append(key)
+        if isinstance(stmt, ast.ClassDef):
+            logger(f"Found class: {name} ({f.path})")
+
+    for name in sorted(_used_names(base_tree)) + list(target_names):
+        visit(name, None)
+
+    definition_trees = [selected[key][1] for key in order]
+    import_time = _import_time_names(definition_trees) | _import_time_names(
+        [s for s in base_tree.body if not isinstance(s, (ast.Import, ast.ImportFrom))])
+    definitions = []
+    lazy_blocks = False
+    for key in order:
+        f, stmt = selected[key]
+        if _is_optional_import(stmt):
+            source, deferred = _lazy_optional_import(f, stmt, import_time, logger)
+            definitions.append(source)
+            lazy_blocks |= deferred
+        else:
+            definitions.append(f.segment(stmt))
+    # Names used by the base file itself
+    for name in _used_names(base_tree):
+        if name in base_imports:
+            imports[name] = base_imports[name]
+    # Imports inside definitions (try: import ...) are copied with them
+    for key in order:
+        imports = {k: v for k, v in imports.items()
+                   if k not in _bound_names(selected[key][1])}
+
+    eager = {}  # module -> names of "from module import", None for "import"
+    lazy = []
+    for alias, (module, name) in sorted(imports.items()):
+        # The standard library is cheap to import, packages are not
+        top_module = module.split(".")[0]
+        if (name is None and alias not in import_time
+                and top_module not in sys.stdlib_module_names):
+            lazy.append(f"{alias} = _LazyModule({alias!r}, {module!r})")
+            logger(f"Lazy import: {module}")
+        else:
+            eager.setdefault((module, name is None), []).append((name, alias))
+            logger(f"Import: {_import_line(module, name, alias)}")
+    if lazy:
+        eager.setdefault(("importlib", True), []).append((None, "importlib"))
+    if lazy_blocks:
+        eager.setdefault(("importlib.util", True), []).append((None, "importlib.util"))
+
+    out = []
+    for (module, plain), names in sorted(eager.items()):
+        if plain:
+            out.extend(_import_line(module, None, alias) + "\n" for _, alias in names)
+        else:
+            out.append(f"from {module} import " + ", ".join(
+                name if name == alias else f"{name} as {alias}"
+                for name, alias in names) + "\n")
+    if lazy or lazy_blocks:
+        out.append("\n\n" + LAZY_MODULE_SRC + "\n\n")
+        out.extend(line + "\n" for line in lazy)
+    out.append("\n\n")
+    for definition in definitions:
+        out.append(definition + "\n\n\n")
+    # The base file without its import statements
+    lines = (head + tail).splitlines(keepends=True)
+    skip = set()
+    for stmt in base_tree.body:
+        if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            skip.update(range(stmt.lineno - 1, stmt.end_lineno))
+    out.append("".join(line for i, line in enumerate(lines) if i not in skip).lstrip("\n"))
+    return "".join(out)
+
+
+COLD_START_SRC = '''import inspect, json, os, runpy, sys, time
+# Dummy values: _create_container() only reads them, nothing is sent
+for key in ["API_KEY", "API_SECRET", "TABLE_NAME", "PARAMS_KEY"]:
+    os.environ.setdefault(key, "cold-start")
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ.setdefault("TRADE_ENABLE", "0")
+t = time.perf_counter()
+module = runpy.run_path(sys.argv[1])
+imported = time.perf_counter() - t
+deferred = [v._name for v in module.values() if type(v).__name__ == "_LazyModule"]
+# Parameters of the signal generator and executor, as the Lambda sets them
+bases = tuple(module[name] for name in ("SignalGenerator", "TradeExecutor") if name in module)
+for value in list(module.values()):
+    if (inspect.isclass(value) and issubclass(value, bases)
+            and not inspect.isabstract(value)):
+        for key, param in value().default_param.items():
+            os.environ.setdefault(key, str(param))
+strategy, store = module["_create_container"]()
+# Every invocation needs the deferred modules, so they count to the cold start
+for name, value in list(module.items()):
+    if type(value).__name__ == "_LazyModule":
+        getattr(value, "__name__")
+module["encode_state"](strategy.get_all_dynamic())
+print(json.dumps({"import": imported, "cold_start": time.perf_counter() - t,
+                  "deferred": deferred}))
+'''
+
+
+def measure_cold_start(path, repeat=5):
+    """Median seconds to start the Lambda source path in a fresh interpreter.
+    Parameters missing from the environment are set from default_param of
+    the copied classes.
+
+    "import" only executes the file. "cold_start" also runs
+    _create_container(), imports the modules deferred by _LazyModule and
+    encodes the state once, which the first invocation always does.
+    Nothing is sent to AWS or bitFlyer.
+
+    Returns:
+        tuple: (dict of "import", "cold_start" and "deferred" (module names)
+            or None, error message or None)
+    """
+    results = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", COLD_START_SRC, path],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return None, (result.stderr.strip().splitlines() or ["failed"])[-1]
+        results.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    median = {k: sorted(r[k] for r in results)[len(results) // 2]
+              for k in ("import", "cold_start")}
+    return {**median, "deferred": results[0]["deferred"]}, None
+
+
+def read_base_source(base_file, sg_class, te_class, market_class) -> str:
+    """_lambda_base.py with the class names filled in."""
+    with open(base_file, "r", encoding="utf-8") as f:
+        base = f.read()
+    return (base.replace("{SG class}", sg_class).replace("{TE class}", te_class)
+            .replace("{Market class}", market_class))
+
+
+def create_pruned_lamda_file(base_file, out_file, sg_class, te_class,
+                             market_class, directories, target_names=()):
+    base = read_base_source(base_file, sg_class, te_class, market_class)
+    source = build_pruned_source(base, directories, target_names)
+    with open(out_file, "w", encoding="utf-8") as f:
+        f.write(source)
+    times, error = measure_cold_start(out_file)
+    if error is None:
+        print(f"Cold start of {out_file}: {times['cold_start'] * 1000:.1f} ms "
+              f"(import {times['import'] * 1000:.1f} ms, deferred to the first "
+              f"invocation: {', '.join(times['deferred']) or 'none'})")
+    else:
+        print(f"Cold start of {out_file} was not measured: {error}")
+
+
+def main_fn(market_class, sg_class, te_class, directories, output_file,
+            additional_target_names=None, mode="ast"):
+    if mode == "ast":
+        create_pruned_lamda_file(base_file, output_file, sg_class, te_class,
+                                 market_class, directories,
+                                 additional_target_names or ())
+        return
 
     classes = []
     classes.append(market_class)
     classes.append(sg_class)
     classes.append(te_class)
     classes.append("Strategy")
+    classes.append("TradeLimiterConfig")
     if additional_target_names is not None:
         classes.extend(additional_target_names)
 
     combine_files(directories, tmp_file, classes)
+    append_state_module(directories, tmp_file)
     create_lamda_file(base_file, tmp_file, output_file,
         sg_class, te_class, market_class)
     os.remove(tmp_file)
@@ -217,15 +669,14 @@ if __name__ == "__main__":
         nargs="+",
         help="The names of the target functions and classes to include.")
 
-    args = parser.parse_args()
-    classes = []
-    classes.append(args.market_class)
-    classes.append(args.sg_class)
-    classes.append(args.te_class)
-    classes.append("Strategy")
-    if args.additional_target_names is not None:
-        classes.extend(args.additional_target_names)
+    parser.add_argument(
+        "--mode",
+        choices=["ast", "text"],
+        default="ast",
+        help="ast: copy only the definitions and imports the classes reach "
+        "(AST analysis), defer heavy imports and report the cold start time. "
+        "text: copy whole classes and every import line of the files.")
 
-    combine_files(args.directories, tmp_file, classes)
-    create_lamda_file(base_file, tmp_file, args.output_file,
-        args.sg_class, args.te_class, args.market_class)
+    args = parser.parse_args()
+    main_fn(args.market_class, args.sg_class, args.te_class, args.directories,
+            args.output_file, args.additional_target_names, args.mode)
@@ -0,0 +1,468 @@
+"""Replay a price series through the generated Lambda handler locally.
+
+The handler built by build_lambda_src.py runs in this process, one
+invocation per tick, against a dict-backed DynamoDB table and a local HTTP
+server that answers like the bitFlyer API. The latency of every invocation
+and the bytes of state read / written are reported, and the signals are
+compared with BacktestStrategy.backtest() on the same prices.
+
+ex) python3 app/aws_build/replay_lambda.py -s BollingerBandsSG -t SpreadOrderExecutor \\
+        -p window_size=100 num_std_dev=1.5 reverse=1 buy_count_limit=5 one_order_quantity=0.01
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import tempfile
+import threading
+import contextlib
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+sys.path.append(".")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from build_lambda_src import base_file, build_pruned_source, read_base_source
+from src.BitSysTrade.market import BacktestMarket
+from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.data_generater import random_data
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def _attribute_size(value) -> int:
+    """Size of one attribute value in DynamoDB's item size rules."""
+    (kind, v), = value.items()
+    if kind == "S":
+        return len(v.encode("utf-8"))
+    if kind == "N":
+        # 1 byte per 2 significant digits + 1
+        return (len(v.lstrip("-").replace(".", "")) + 1) // 2 + 1
+    if kind == "B":
+        return len(v)
+    if kind in ("BOOL", "NULL"):
+        return 1
+    if kind == "L":
+        return 3 + sum(1 + _attribute_size(x) for x in v)
+    if kind == "M":
+        return 3 + sum(1 + len(k.encode("utf-8")) + _attribute_size(x)
+                       for k, x in v.items())
+    return sum(_attribute_size({kind[0]: x}) for x in v)  # SS / NS / BS
+
+
+def item_size(item: dict) -> int:
+    """Bytes of an item in DynamoDB's wire format (attribute names included)."""
+    return sum(len(k.encode("utf-8")) + _attribute_size(v) for k, v in item.items())
+
+
+def _split_actions(expression):
+    """Split "#a = :a, #b = list_append(#b, :b)" at the top-level commas."""
+    actions, depth, start = [], 0, 0
+    for i, c in enumerate(expression):
+        depth += {"(": 1, ")": -1}.get(c, 0)
+        if c == "," and depth == 0:
+            actions.append(expression[start:i])
+            start = i + 1
+    actions.append(expression[start:])
+    return actions
+
+
+class FakeDynamoDBTable():
+    """Dict-backed stand-in for boto3's Table with the calls of DynamoDBStateStore.
+
+    Items are kept in DynamoDB's wire format, so numbers come back as Decimal,
+    bytes as Binary, and values boto3 rejects (float) raise TypeError.
+    Only "attribute_not_exists(#v) OR #v = :v" conditions and SET updates
+    (with list_append) are supported. The tests use the same table.
+    """
+    VERSION_CONDITION = "attribute_not_exists(#v) OR #v = :v"
+
+    def __init__(self, partition_key: str = "id"):
+        self.partition_key = partition_key
+        self.items = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.requests = 0
+        self.reads = 0       # get_item calls
+        self.updates = []    # bytes of each update_item
+
+    def _check(self, key, condition, names, values, operation):
+        if condition is None:
+            return
+        if condition != self.VERSION_CONDITION:
+            raise NotImplementedError(condition)
+        current = self.items.get(key, {}).get(names["#v"])
+        if current is not None and _deserializer.deserialize(current) != values[":v"]:
+            raise ClientError({"Error": {"Code": "ConditionalCheckFailedException",
+                                         "Message": "The conditional request failed"}},
+                              operation)
+
+    def item(self, key):
+        """Stored item as boto3 returns it, None if missing (no request)."""
+        item = self.items.get(key)
+        if item is None:
+            return None
+        return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+    def get_item(self, Key, ConsistentRead=False):
+        self.requests += 1
+        self.reads += 1
+        item = self.items.get(Key[self.partition_key])
+        if item is None:
+            return {}
+        self.bytes_read += item_size(item)
+        return {"Item": self.item(Key[self.partition_key])}
+
+    def delete_item(self, Key):
+        self.requests += 1
+        self.items.pop(Key[self.partition_key], None)
+        return {}
+
+    def put_item(self, Item, ConditionExpression=None,
+                 ExpressionAttributeNames=None, ExpressionAttributeValues=None):
+        self.requests += 1
+        item = {k: _serializer.serialize(v) for k, v in Item.items()}
+        key = Item[self.partition_key]
+        self._check(key, ConditionExpression, ExpressionAttributeNames,
+                    ExpressionAttributeValues, "PutItem")
+        self.items[key] = item
+        self.bytes_written += item_size(item)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression=None,
+                    ExpressionAttributeNames=None, ExpressionAttributeValues=None):
+        self.requests += 1
+        names = ExpressionAttributeNames or {}
+        values = {k: _serializer.serialize(v)
+                  for k, v in (ExpressionAttributeValues or {}).items()}
+        key = Key[self.partition_key]
+        self._check(key, ConditionExpression, names, ExpressionAttributeValues,
+                    "UpdateItem")
+        if not UpdateExpression.startswith("SET "):
+            raise NotImplementedError(UpdateExpression)
+        item = dict(self.items.get(key, {self.partition_key: _serializer.serialize(key)}))
+        for action in _split_actions(UpdateExpression[4:]):
+            target, expression = (s.strip() for s in action.split("=", 1))
+            if expression.startswith("list_append("):
+                first, second = expression[len("list_append("):-1].split(",")
+                item[names[target]] = {"L": item[names[first.strip()]]["L"]
+                                       + values[second.strip()]["L"]}
+            else:
+                item[names[target]] = values[expression]
+        self.items[key] = item
+        # Only the values are sent, not the whole item
+        written = sum(_attribute_size(v) for v in values.values())
+        self.bytes_written += written
+        self.updates.append(written)
+        return {}
+
+
+class FakeBitflyerServer():
+    """Local HTTP server for the bitFlyer endpoints BitflyerMarket calls.
+
+    The ticker returns self.price. Orders are accepted and kept in
+    self.orders, and no order stays open.
+    """
+
+    def __init__(self, product_code: str = "FX_BTC_JPY"):
+        self.price = None
+        self.product_code = product_code
+        self.orders = []
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive like the real API, so requests.Session reuses the connection
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, which Nagle would delay
+            disable_nagle_algorithm = True
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                server.requests += 1
+                path = urlparse(self.path).path
+                if path == "/v1/ticker":
+                    self._send(200, {"product_code": server.product_code,
+                                     "ltp": server.price})
+                elif path in ("/v1/me/getchildorders", "/v1/me/getexecutions"):
+                    self._send(200, [])
+                else:
+                    self._send(404, {"status": -1, "error_message": path})
+
+            def do_POST(self):
+                server.requests += 1
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if urlparse(self.path).path == "/v1/me/sendchildorder":
+                    server.orders.append(body)
+                    self._send(200, {"child_order_acceptance_id":
+                                     f"JRF{len(server.orders):08d}"})
+                else:
+                    self._send(404, {"status": -1, "error_message": self.path})
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@contextlib.contextmanager
+def _environ(values):
+    saved = {k: os.environ.get(k) for k in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _env_value(value):
+    # Same conversion as _create_container()
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _record_signals(strategy, signals):
+    generate_signals = strategy.generate_signals
+
+    def record(price):
+        signal = generate_signals(price)
+        signals.append(signal)
+        return signal
+    strategy.generate_signals = record
+
+
+def _load_module(source):
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False,
+                                     encoding="utf-8") as f:
+        f.write(source)
+    try:
+        spec = importlib.util.spec_from_file_location("_replay_lambda", f.name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.remove(f.name)
+    return module
+
+
+def _percentiles(values, scale=1000):
+    """p50 / p90 / p99 / max of values * scale (seconds -> ms by default)."""
+    if len(values) == 0:
+        return {}
+    values = np.asarray(values, dtype=np.float64) * scale
+    return {"p50": float(np.percentile(values, 50)),
+            "p90": float(np.percentile(values, 90)),
+            "p99": float(np.percentile(values, 99)), "max": float(values.max())}
+
+
+def replay(source, prices, params, cold_every=0, start_cash=1e6):
+    """Run the handler of source once per price.
+
+    Args:
+        source (str): generated Lambda source (build_pruned_source())
+        prices (np.ndarray): price of each invocation
+        params (dict): environment variables of the function (static params)
+        cold_every (int): drop the warm container every cold_every
+            invocations, so the state is loaded from the table again.
+            0 keeps one container (after the first, cold invocation).
+        start_cash (float): start cash of the reference backtest
+
+    Returns:
+        dict: latency percentiles [ms] of warm / cold invocations, state
+            bytes, request counts, signals and the reference signals
+    """
+    env = {"API_KEY": "replay", "API_SECRET": "replay", "TABLE_NAME": "replay",
+           "PARAMS_KEY": "replay", "TRADE_ENABLE": "1"}
+    env.update({k: str(v) for k, v in params.items()})
+    table = FakeDynamoDBTable()
+    signals = []
+    warm, cold = [], []
+    errors = 0
+    bytes_read, bytes_written = [], []
+
+    with _environ(env), FakeBitflyerServer() as server:
+        module = _load_module(source)
+        module.boto3 = types.SimpleNamespace(resource=lambda name, **kwargs:
+                                             types.SimpleNamespace(Table=lambda n: table))
+        create_container = module._create_container
+
+        def create_replay_container():
+            strategy, store = create_container()
+            strategy.market.API_URL = server.url
+            _record_signals(strategy, signals)
+            return strategy, store
+        module._create_container = create_replay_container
+
+        for i, price in enumerate(prices):
+            if cold_every and i % cold_every == 0:
+                module._container = None
+            is_cold = module._container is None
+            server.price = float(price)
+            read, written = table.bytes_read, table.bytes_written
+            t = time.perf_counter()
+            module.lambda_handler({}, None)
+            (cold if is_cold else warm).append(time.perf_counter() - t)
+            bytes_read.append(table.bytes_read - read)
+            bytes_written.append(table.bytes_written - written)
+            # The handler prints the traceback and invalidates the store on errors
+            if module._container is None or not module._container[1].is_current:
+                errors += 1
+
+        # Same classes and parameters on BacktestStrategy
+        strategy = module._container[0]
+        reference = BacktestStrategy(BacktestMarket(np.asarray(prices, dtype=np.float64)),
+                                     type(strategy.signal_generator)(),
+                                     type(strategy.trade_executor)(),
+                                     limiter=module.TradeLimiterConfig.from_env())
+        reference.reset_all({k: _env_value(v) for k, v in os.environ.items()},
+                            start_cash)
+        expected = []
+        _record_signals(reference, expected)
+        reference.backtest()
+
+    mismatches = [i for i, (a, b) in enumerate(zip(signals, expected)) if a != b]
+    if len(signals) != len(expected):
+        mismatches.append(min(len(signals), len(expected)))
+    return {
+        "invocations": len(prices),
+        "cold_invocations": len(cold),
+        "errors": errors,
+        "latency_ms": _percentiles(warm),
+        "cold_latency_ms": _percentiles(cold),
+        "state_bytes_read": int(np.sum(bytes_read)),
+        "state_bytes_written": int(np.sum(bytes_written)),
+        "state_bytes_per_invocation": {
+            "read": _percentiles(bytes_read, scale=1),
+            "written": _percentiles(bytes_written, scale=1)},
+        "dynamodb_requests": table.requests,
+        "http_requests": server.requests,
+        "orders": len(server.orders),
+        "signals": signals,
+        "expected_signals": expected,
+        "mismatches": mismatches,
+    }
+
+
+def print_report(result):
+    def line(name, p):
+        if p:
+            print(f"{name:<16}" + "  ".join(f"{k} {v:9.3f}" for k, v in p.items()))
+    print(f"Invocations: {result['invocations']} "
+          f"(cold {result['cold_invocations']}, errors {result['errors']})")
+    line("Latency [ms]", result["latency_ms"])
+    line("Cold [ms]", result["cold_latency_ms"])
+    line("Read [B]", result["state_bytes_per_invocation"]["read"])
+    line("Written [B]", result["state_bytes_per_invocation"]["written"])
+    print(f"State bytes read / written: {result['state_bytes_read']} / "
+          f"{result['state_bytes_written']}")
+    print(f"DynamoDB requests: {result['dynamodb_requests']}, "
+          f"HTTP requests: {result['http_requests']}, orders: {result['orders']}")
+    if result["mismatches"]:
+        i = result["mismatches"][0]
+        print(f"Signals differ from BacktestStrategy at {len(result['mismatches'])} "
+              f"ticks, first at {i}")
+    else:
+        print("Signals match BacktestStrategy.backtest()")
+
+
+def read_prices(path) -> np.ndarray:
+    """Prices from .npy or a text / csv file (last column, header skipped)."""
+    if path.endswith(".npy"):
+        return np.load(path)
+    data = np.genfromtxt(path, delimiter=",", dtype=np.float64)
+    if data.ndim > 1:
+        data = data[:, -1]
+    return data[~np.isnan(data)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay prices through the Lambda handler with a fake "
+        "DynamoDB table and bitFlyer API, and compare with the backtest.")
+    parser.add_argument("-d",
+                        "--directories",
+                        nargs="+",
+                        default=["src/BitSysTrade", "my_data/custom_src"],
+                        help="The directories to search for Python files.")
+    parser.add_argument("-s",
+                        "--sg-class",
+                        help="Signal Generator Class Name.")
+    parser.add_argument("-t",
+                        "--te-class",
+                        help="Trade Executor Class Name.")
+    parser.add_argument("-m",
+                        "--market-class",
+                        default="BitflyerMarket",
+                        help="Market Class Name.")
+    parser.add_argument("-f",
+                        "--lambda-file",
+                        help="Replay this generated source instead of building one.")
+    parser.add_argument("-p",
+                        "--params",
+                        nargs="+",
+                        default=[],
+                        help="Environment variables of the function, as key=value.")
+    parser.add_argument("--data",
+                        help="Price file (.npy, or csv with the price in the last "
+                        "column). Random prices are used if not given.")
+    parser.add_argument("-n",
+                        "--length",
+                        type=int,
+                        default=2000,
+                        help="Number of random prices.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cold-every",
+                        type=int,
+                        default=0,
+                        help="Start a new container every N invocations.")
+    args = parser.parse_args()
+
+    if args.lambda_file:
+        with open(args.lambda_file, "r", encoding="utf-8") as f:
+            source = f.read()
+    elif args.sg_class is None or args.te_class is None:
+        parser.error("-s and -t are required without -f")
+    else:
+        base = read_base_source(base_file, args.sg_class, args.te_class,
+                                args.market_class)
+        directories = [d for d in args.directories if os.path.isdir(d)]
+        source = build_pruned_source(base, directories, logger=lambda message: None)
+    if args.data:
+        prices = read_prices(args.data)
+    else:
+        prices = random_data(1e7, 0.001, args.length, seed=args.seed)
+    params = dict(p.split("=", 1) for p in args.params)
+
+    result = replay(source, prices, params, cold_every=args.cold_every)
+    print_report(result)
+    raise SystemExit(1 if result["mismatches"] or result["errors"] else 0)
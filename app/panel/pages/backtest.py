@@ -10,13 +10,13 @@ import traceback
 sys.path.append(".")
 from src.BitSysTrade.market import BacktestMarket
 from src.BitSysTrade.data_loader import read_prices_from_sheets
-from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.strategy import BacktestStrategy, TradeLimiterConfig
 
 from src.BitSysTrade.signal_generator import SignalGenerator
 from src.BitSysTrade.trade_executor import TradeExecutor
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from util import LogBox, datetime_range_picker, ParameterManager, load_result_summary, datetime_interval
+from util import LogBox, LogBoxProgress, datetime_range_picker, ParameterManager, load_result_summary, datetime_interval
 
 scatter_panel = pn.pane.HoloViews()
 
@@ -157,7 +157,6 @@ def exec_backtest(event):
         datetime_range = datetime_range_picker.value
         dates, price_data = read_prices_from_sheets(DATA_PATH, datetime_range,
                                          datetime_interval.value, use_cache=True, with_date=True)
-        os.environ["ORDER_NUM_MAX"] = "10"
         target_params = param_manager.get_params()
 
         market = BacktestMarket(price_data, dates=dates, fee_rate=0, is_fx=True)
@@ -167,7 +166,9 @@ def exec_backtest(event):
         logbox.update_log("Strategy parameters:")
         logbox.update_log(f"{target_params}")
 
-        strategy = BacktestStrategy(market, signal_gene, trade_exec)
+        strategy = BacktestStrategy(market, signal_gene, trade_exec, engine="vectorized",
+                                    limiter=TradeLimiterConfig(order_num_max=10),
+                                    progress=LogBoxProgress(logbox))
         strategy.reset_all(target_params, start_cash_w.value, start_coin_w.value)
         selected_params, axis = plot_param_select_obj.value
         portfolio_result = strategy.backtest(hold_params=selected_params, axis=axis)
@@ -14,13 +14,13 @@ sys.path.append(".")
 from src.BitSysTrade.market import BacktestMarket
 from src.BitSysTrade.backtester import BayesianBacktester
 from src.BitSysTrade.data_loader import read_prices_from_sheets
-from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.strategy import BacktestStrategy, TradeLimiterConfig
 
 from src.BitSysTrade.signal_generator import SignalGenerator
 from src.BitSysTrade.trade_executor import TradeExecutor
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from util import LogBox, DataFrameLogManager, datetime_range_picker, ParameterManager, save_result_summary, datetime_interval
+from util import LogBox, LogBoxProgress, DataFrameLogManager, datetime_range_picker, ParameterManager, save_result_summary, datetime_interval
 
 logbox = LogBox()
 
@@ -51,13 +51,15 @@ df_log_queue = log_manager.get_log_queue()
 log_thread = log_manager.start_thread()
 
 # General settings grid
-general_grid = pn.GridSpec(width=600, height=20 * (3 + 1))
+general_grid = pn.GridSpec(width=600, height=20 * (4 + 1))
 general_grid[0, 0] = pn.pane.Str("n_calls")
 general_grid[0, 1] = n_calls_w = pn.widgets.IntInput(value=10, disabled=False)
 general_grid[1, 0] = pn.pane.Str("start_cash")
 general_grid[1, 1] = start_cash_w = pn.widgets.IntInput(value=int(2e5), disabled=False)
 general_grid[2, 0] = pn.pane.Str("start_coin")
 general_grid[2, 1] = start_coin_w = pn.widgets.FloatInput(value=0, disabled=False)
+general_grid[3, 0] = pn.pane.Str("n_jobs")
+general_grid[3, 1] = n_jobs_w = pn.widgets.IntInput(value=1, disabled=False)
 
 param_manager = None
 param_manager_panel = None
@@ -74,7 +76,6 @@ def exec_optimize():
         datetime_range = datetime_range_picker.value
         dates, price_data = read_prices_from_sheets(DATA_PATH, datetime_range,
                                          datetime_interval.value, use_cache=True, with_date=True)
-        os.environ["ORDER_NUM_MAX"] = "10"
         target_params = param_manager.get_params()
 
         market = BacktestMarket(price_data, fee_rate=0, is_fx=True)
@@ -84,8 +85,9 @@ def exec_optimize():
         logbox.update_log("Strategy parameters:")
         logbox.update_log(f"{target_params}")
 
-        strategy = BacktestStrategy(market, signal_gene, trade_exec)
-        backtester = BayesianBacktester(strategy)
+        strategy = BacktestStrategy(market, signal_gene, trade_exec, engine="vectorized",
+                                    limiter=TradeLimiterConfig(order_num_max=10))
+        backtester = BayesianBacktester(strategy, progress=LogBoxProgress(logbox))
 
         hline = hv.HLine(start_cash_w.value).opts(color="red", line_width=1, line_dash="dashed")
         overlay = scatter * hline
@@ -97,7 +99,8 @@ def exec_optimize():
             start_coin=start_coin_w.value,
             n_calls=n_calls_w.value,
             graph_buffer=buffer,
-            df_log_queue=df_log_queue
+            df_log_queue=df_log_queue,
+            n_jobs=n_jobs_w.value
         )
         logbox.update_log(f"Best value: {best_value}")
         save_path = save_result_summary(DATA_PATH, datetime_range, datetime_interval.value, best_param,
@@ -3,6 +3,9 @@ import os
 import panel as pn
 import traceback
 
+sys.path.append(".")
+from src.BitSysTrade.data_loader import price_data_cache, invalidate_price_cache
+
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from util import LogBox
 
@@ -22,11 +25,28 @@ def save_file(event):
 
 file_input.param.watch(save_file, 'value')
 
+def show_cache_stats(event):
+    """Show hit/miss counters and size of the price data cache."""
+    logbox.update_log(f"Price data cache: {price_data_cache.stats}")
+
+def clear_cache(event):
+    """Release all cached price data. It is loaded again on next use."""
+    n = invalidate_price_cache()
+    logbox.update_log(f"Cleared {n} cached price data")
+
+cache_stats_button = pn.widgets.Button(name="Show cache stats", button_type="default")
+cache_stats_button.on_click(show_cache_stats)
+clear_cache_button = pn.widgets.Button(name="Clear data cache", button_type="default")
+clear_cache_button.on_click(clear_cache)
+
 # Add file upload and dropdowns to the layout
 page = pn.Column(
     pn.pane.Markdown("## Upload custom classes"),
     pn.layout.Divider(margin=(-20, 0, 0, 0)),
     file_input,
+    pn.pane.Markdown("## Price data cache"),
+    pn.layout.Divider(margin=(-20, 0, 0, 0)),
+    pn.Row(cache_stats_button, clear_cache_button),
     pn.pane.Markdown("## Log"),
     pn.layout.Divider(margin=(-20, 0, 0, 0)),
     logbox.widget,
@@ -7,6 +7,8 @@ import threading
 from multiprocessing import Queue
 from skopt.space import Integer, Real, Categorical
 from bokeh.models import DatetimeTickFormatter
+from src.BitSysTrade.utils.progress import ThrottledProgress
+from src.BitSysTrade.market import FXPosition
 
 class LogBox():
     def __init__(self, width=600, height=100):
@@ -30,6 +32,12 @@ class LogBox():
         print(message)
 
 
+class LogBoxProgress(ThrottledProgress):
+    """Progress hook of backtesters writing to a LogBox."""
+    def __init__(self, logbox: LogBox, interval=1.0):
+        super().__init__(interval, write=logbox.update_log)
+
+
 class LogQueue():
     """Class to send logs to a queue."""
     def __init__(self):
@@ -163,6 +171,9 @@ def convert_to_standard_types(data):
         return data.item()
     elif isinstance(data, list):
         return [convert_to_standard_types(item) for item in data]
+    elif isinstance(data, FXPosition):
+        # yaml.dump would write a !!python/object tag that FullLoader refuses
+        return data.to_dict()
     return data
 
 def save_result_summary(data_path, data_range, data_interval, params, portfolio_result,
@@ -176,7 +187,7 @@ def save_result_summary(data_path, data_range, data_interval, params, portfolio_
         "SignalGenerator": signal_generator_name,
         "TradeExecutor": trade_executor_name,
         "params": convert_to_standard_types(params),
-        "portfolio_result": portfolio_result
+        "portfolio_result": convert_to_standard_types(portfolio_result)
     }
     now_str = now.strftime("%Y%m%d_%H%M%S")
     profit_rate_str = "{:.3f}".format(portfolio_result["profit_rate"])
@@ -3,8 +3,9 @@ import sys, os
 sys.path.append(".")
 from src.BitSysTrade.market import BacktestMarket
 from src.BitSysTrade.backtester import BayesianBacktester
+from src.BitSysTrade.utils.progress import ThrottledProgress
 from src.BitSysTrade.data_loader import read_prices_from_sheets
-from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.strategy import BacktestStrategy, TradeLimiterConfig
 
 from src.BitSysTrade.signal_generator import BollingerBandsSG
 from src.BitSysTrade.trade_executor import SpreadOrderExecutor
@@ -44,7 +45,6 @@ data_interval = 10
 # Read data for test
 price_data = read_prices_from_sheets(data_path,
                         datetime_range, data_interval, use_cache=True)
-os.environ["ORDER_NUM_MAX"] = "10"
 # Set parameters
 target_params = {
     'window_size': Integer(10, 300),
@@ -60,14 +60,15 @@ market = BacktestMarket(price_data, fee_rate=0)
 signal_gene = BollingerBandsSG()
 trade_exec = SpreadOrderExecutor()
 
-strategy = BacktestStrategy(market, signal_gene, trade_exec)
+strategy = BacktestStrategy(market, signal_gene, trade_exec, engine="vectorized",
+                            limiter=TradeLimiterConfig(order_num_max=10))
 
 print(strategy.default_param)
 
 
 if True:
     # execute optimize
-    backtester = BayesianBacktester(strategy)
+    backtester = BayesianBacktester(strategy, progress=ThrottledProgress())
 
     # Execute backtest
     best_value, best_param = backtester.backtest(target_params, start_cash, start_coin=0.01, n_calls=10)
@@ -5,9 +5,13 @@ except:
     pass
 
 from .strategy import *
+from .utils.progress import ProgressReporter
+from .signal_generator import RollingStatsTable, IndicatorCache
 try:
-    from skopt import gp_minimize
+    from skopt import gp_minimize, Optimizer
     from skopt.space import Integer, Real, Categorical
+    from skopt.utils import cook_estimator, normalize_dimensions
+    from sklearn.utils import check_random_state
 except:
     pass
 
@@ -16,20 +20,133 @@ try:
 except:
     pass
 
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+# Strategy of a worker process, set by _init_worker()
+_worker_strategy = None
+_worker_shm = None
+
+
+def _init_worker(strategy_bytes, shm_name, shape, dtype):
+    global _worker_strategy, _worker_shm
+    # Workers share the resource tracker of the parent, which unlinks the
+    # segment in StrategyPool.__exit__()
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_strategy = pickle.loads(strategy_bytes)
+    _worker_strategy.market.data = np.ndarray(shape, dtype=dtype,
+                                              buffer=_worker_shm.buf)
+
+
+def _run_worker_backtest(args):
+    param, start_cash, start_coin = args
+    _worker_strategy.reset_all(param, start_cash, start_coin)
+    return _worker_strategy.backtest()
+
+
+class StrategyPool:
+    """Process pool running backtests on copies of a strategy.
+    The price data is placed in shared memory once and every worker maps it,
+    so only the parameters and the resulting portfolio are sent per task.
+
+    Usage:
+        with StrategyPool(strategy, n_jobs=4) as pool:
+            results = pool.map(params, start_cash, start_coin)
+    """
+
+    def __init__(self, strategy: Strategy, n_jobs: int = -1):
+        self.strategy = strategy
+        self.n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        self.shm = None
+        self.executor = None
+
+    def __enter__(self):
+        market = self.strategy.market
+        data = np.ascontiguousarray(market.data, dtype=np.float64)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        np.ndarray(data.shape, dtype=data.dtype, buffer=self.shm.buf)[:] = data
+
+        # Pickle the strategy without the arrays which workers do not need
+        data_org, dates_org, hist_org = market.data, market.dates, market.hist
+        market.data, market.dates, market.hist = None, None, {}
+        try:
+            strategy_bytes = pickle.dumps(self.strategy)
+        finally:
+            market.data, market.dates, market.hist = data_org, dates_org, hist_org
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.n_jobs,
+            initializer=_init_worker,
+            initargs=(strategy_bytes, self.shm.name, data.shape, data.dtype.str))
+        return self
+
+    def submit(self, param: dict, start_cash: int, start_coin: float = 0):
+        """Run one backtest. Returns a Future of the portfolio."""
+        return self.executor.submit(_run_worker_backtest,
+                                    (param, start_cash, start_coin))
+
+    def map(self, params: list, start_cash: int, start_coin: float = 0) -> list:
+        """Run backtests and return the portfolios in the order of params."""
+        args = [(param, start_cash, start_coin) for param in params]
+        return list(self.executor.map(_run_worker_backtest, args))
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.executor.shutdown()
+        self.shm.close()
+        self.shm.unlink()
+
 
 class GridBacktester:
 
-    def __init__(self, strategy: Strategy):
+    def __init__(self, strategy: Strategy, progress: ProgressReporter = None):
         self.strategy = strategy
+        if progress is None:
+            progress = ProgressReporter()
+        self.progress = progress
 
-    def backtest(self, params: list, start_cash: int, start_coin: float = 0):
+    def backtest(self, params: list, start_cash: int, start_coin: float = 0,
+                 n_jobs: int = 1, record: str = "none", sweep: bool = False):
+        """
+        params: list of param dict
+        start_cash: int, start cash
+        start_coin: float, start coin
+        n_jobs: int, number of worker processes. 1 runs in this process,
+            -1 uses all cores. Results are in the order of params.
+        record: str, history recording level during the runs. Only the
+            portfolios are returned, so nothing is recorded by default.
+        sweep: bool, share one RollingStatsTable between the runs. Rolling
+            mean / std of each window are computed once from prefix sums
+            instead of in every run. Used by the batch path of the signal
+            generator (engine="vectorized" or "compiled"). The bands agree
+            with the normal runs up to float rounding.
+        """
         self.grid_backtest_params = params
         self.test_results = []
-        for i, param in enumerate(params):
-            print(f"Running test {i+1}/{len(params)}")
-            self.strategy.reset_all(param, start_cash, start_coin)
-            portfolio_result = self.strategy.backtest()
-            self.test_results.append(portfolio_result)
+        signal_generator = self.strategy.signal_generator
+        rolling_stats_org = signal_generator.rolling_stats
+        if sweep:
+            signal_generator.rolling_stats = RollingStatsTable()
+        try:
+            return self._backtest(params, start_cash, start_coin, n_jobs, record)
+        finally:
+            if sweep:
+                signal_generator.rolling_stats.release()
+            signal_generator.rolling_stats = rolling_stats_org
+
+    def _backtest(self, params, start_cash, start_coin, n_jobs, record):
+        with self.strategy.recording(record):
+            if n_jobs != 1:
+                with StrategyPool(self.strategy, n_jobs) as pool:
+                    self.test_results = pool.map(params, start_cash, start_coin)
+                self.progress.update(len(params), len(params), "tests finished")
+                return self.test_results
+            for i, param in enumerate(params):
+                self.strategy.reset_all(param, start_cash, start_coin)
+                portfolio_result = self.strategy.backtest()
+                self.test_results.append(portfolio_result)
+                self.progress.update(i + 1, len(params), "tests finished")
         return self.test_results
 
     def print_backtest_result(self):
@@ -43,22 +160,43 @@ class GridBacktester:
 
 
 class BayesianBacktester:
+    """
+    strategy: Strategy to optimize
+    progress: ProgressReporter receiving the result of every call
+    indicator_cache: IndicatorCache kept across the calls and backtest()
+        runs of this backtester. Defaults to a new IndicatorCache().
+    """
 
-    def __init__(self, strategy: Strategy):
+    def __init__(self, strategy: Strategy, progress: ProgressReporter = None,
+                 indicator_cache: IndicatorCache = None):
         self.strategy = strategy
+        if progress is None:
+            progress = ProgressReporter()
+        self.progress = progress
+        if indicator_cache is None:
+            indicator_cache = IndicatorCache()
+        self.indicator_cache = indicator_cache
         self.count = 0
+        self.n_finished = 0
         self.graph_buffer = None
         self.log_manager = None
         self.best = {"value": 0, "portfolio": None}
 
-    def _backtest_algorithm(self, params):
-        self.count += 1
-        print(f"Running test {self.count}/{self.n_calls}")
-        param = self.target_params
+    def _make_param(self, params):
+        param = dict(self.target_params)
         for i, k in enumerate(self.keys):
             param[k] = params[i]
+        return param
+
+    def _backtest_algorithm(self, params):
+        self.count += 1
+        param = self._make_param(params)
         self.strategy.reset_all(param, self.start_cash, self.start_coin)
         result = self.strategy.backtest()
+        return self._record_result(param, result)
+
+    def _record_result(self, param, result):
+        self.n_finished += 1
         total_value = result["total_value"]
         trade_count = result["trade_count"]
         result_str = f"param: {param}, total_value: {total_value}"
@@ -70,18 +208,48 @@ class BayesianBacktester:
             result_str += f", trade count: {trade_count}"
         except:
             pass
-        print(result_str)
+        self.progress.update(self.n_finished, self.n_calls, result_str)
         if self.graph_buffer is not None:
-            new_data = pd.DataFrame({'Times': [self.count], 'Total Value(JPY)': [total_value]})
+            new_data = pd.DataFrame({'Times': [self.n_finished], 'Total Value(JPY)': [total_value]})
             self.graph_buffer.send(new_data)
         if self.df_log_queue is not None:
-            d = param
+            d = dict(param)
             d["Trade_Count"] = trade_count
             d["Total_Value"] = total_value
             self.df_log_queue.add_log(d)
 
         return -total_value
 
+    def _optimize_batch(self, dimensions, n_calls, random_state, n_jobs, n_points):
+        """Same optimization as gp_minimize, but evaluates n_points
+        parameter sets per round on a StrategyPool (ask/tell interface).
+        """
+        rng = check_random_state(random_state)
+        space = normalize_dimensions(dimensions)
+        base_estimator = cook_estimator(
+            "GP", space=space,
+            random_state=rng.randint(0, np.iinfo(np.int32).max),
+            noise="gaussian")
+        optimizer = Optimizer(space, base_estimator, acq_optimizer="lbfgs",
+                              random_state=rng)
+
+        with StrategyPool(self.strategy, n_jobs) as pool:
+            if n_points is None:
+                n_points = pool.n_jobs
+            while len(optimizer.yi) < n_calls:
+                xs = optimizer.ask(n_points=min(n_points, n_calls - len(optimizer.yi)))
+                futures = {}
+                for i, x in enumerate(xs):
+                    self.count += 1
+                    param = self._make_param(x)
+                    futures[pool.submit(param, self.start_cash, self.start_coin)] = (i, param)
+                ys = [None] * len(xs)
+                for future in as_completed(futures):
+                    i, param = futures[future]
+                    ys[i] = self._record_result(param, future.result())
+                optimizer.tell(xs, ys)
+        return optimizer.get_result()
+
     def backtest(self,
                  target_params: dict,
                  start_cash: int,
@@ -89,7 +257,11 @@ class BayesianBacktester:
                  n_calls: int = 50,
                  random_state: int = 777,
                  graph_buffer=None,
-                 df_log_queue=None):
+                 df_log_queue=None,
+                 n_jobs: int = 1,
+                 n_points: int = None,
+                 record: str = "none",
+                 cache_indicators: bool = True):
         """
         params: dict of params. Optimization parameters should be Integer, Real or Categorical.
             example,
@@ -106,6 +278,16 @@ class BayesianBacktester:
         random_state: int, random state
         graph_buffer: Buffer object for graph
         df_log_queue: DataFrameLogManager object for log
+        n_jobs: int, number of worker processes. 1 evaluates one point at a
+            time with gp_minimize, -1 uses all cores.
+        n_points: int, number of points evaluated concurrently per round
+            when n_jobs != 1. Defaults to the number of workers.
+        record: str, history recording level during the runs. Only the
+            portfolios are used, so nothing is recorded by default.
+        cache_indicators: bool, let the batch path of the signal generator
+            (engine="vectorized" or "compiled") reuse indicator series of
+            the same windows from self.indicator_cache. Results are the same.
+            The price array is read only while the optimization runs.
         """
         self.start_cash = start_cash
         self.start_coin = start_coin
@@ -115,6 +297,8 @@ class BayesianBacktester:
         self.graph_buffer = graph_buffer
         self.df_log_queue = df_log_queue
         self.best = {"value": 0, "portfolio": None}
+        self.count = 0
+        self.n_finished = 0
         if self.graph_buffer is not None:
             self.graph_buffer.clear()
         param_ranges_variable = []
@@ -126,16 +310,30 @@ class BayesianBacktester:
                 self.keys.append(k)
 
         # execute
-        result = gp_minimize(func=self._backtest_algorithm,
-                             dimensions=param_ranges_variable,
-                             n_calls=n_calls,
-                             random_state=random_state)
+        signal_generator = self.strategy.signal_generator
+        indicator_cache_org = signal_generator.indicator_cache
+        if cache_indicators:
+            signal_generator.indicator_cache = self.indicator_cache
+        try:
+            with self.strategy.recording(record):
+                if n_jobs != 1:
+                    result = self._optimize_batch(param_ranges_variable, n_calls,
+                                                  random_state, n_jobs, n_points)
+                else:
+                    result = gp_minimize(func=self._backtest_algorithm,
+                                         dimensions=param_ranges_variable,
+                                         n_calls=n_calls,
+                                         random_state=random_state)
+        finally:
+            # The prices may be changed in place before the next call
+            self.indicator_cache.release()
+            signal_generator.indicator_cache = indicator_cache_org
 
         self.best_params = target_params
         for i, k in enumerate(self.keys):
             self.best_params[k] = result.x[i]
         self.best_value = -result.fun
-        print(f"Best Parameters: {self.best_params}")
-        print(f"Best Total Value: {self.best_value}")
+        self.progress.message(f"Best Parameters: {self.best_params}")
+        self.progress.message(f"Best Total Value: {self.best_value}")
 
         return self.best_value, self.best_params
@@ -0,0 +1,222 @@
+"""Optional compiled backend.
+
+Signal generators written as a pure per-tick update function can run their
+whole loop compiled with Numba (CPU only). The same functions run on the
+interpreter when Numba is not installed, so results do not depend on it.
+"""
+import numpy as np
+
+from .signal_generator import SignalGenerator
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+
+
+def jit(func):
+    """Compile func with numba.njit. Returns func as is without Numba."""
+    if numba is None:
+        return func
+    return numba.njit(func)
+
+
+def _signal_loop(update, prices, state, params, signals):
+    for i in range(len(prices)):
+        signal, state = update(prices[i], state, params)
+        signals[i] = signal
+    return state
+
+
+def _market_loop(prices, signals, cash, position, fee_rate, quantity,
+                 buy_count_limit, buy_count):
+    # Same float operations as BacktestMarket._execute_*_order_normal()
+    trade_count = 0
+    ok = 0
+    ng = 0
+    limited = buy_count_limit >= 0
+    for i in np.flatnonzero(signals):
+        price = prices[i]
+        if signals[i] > 0:
+            if limited and buy_count >= buy_count_limit:
+                continue
+            if cash >= quantity * price:
+                cash -= quantity * price
+                position += quantity
+                position -= quantity * fee_rate
+                trade_count += 1
+                buy_count += 1
+                ok += 1
+            else:
+                ng += 1
+        else:
+            if limited and buy_count <= 0:
+                continue
+            if position >= quantity:
+                cash += quantity * price
+                position -= quantity
+                position -= quantity * fee_rate
+                trade_count += 1
+                buy_count -= 1
+                ok += 1
+            else:
+                ng += 1
+    return cash, position, trade_count, buy_count, ok, ng
+
+
+_signal_loop_compiled = jit(_signal_loop)
+_market_loop_compiled = jit(_market_loop)
+
+
+def run_signal_kernel(update, prices, state, params):
+    """Run update() over prices.
+
+    Args:
+        update: per-tick function (price, state, params) -> (signal, state).
+            Compiled with jit() to run the loop compiled.
+        prices (np.ndarray): price series
+        state (tuple): initial state of typed scalars / arrays
+        params (np.ndarray): float64 parameters
+
+    Returns:
+        tuple: (int8 signals, final state)
+    """
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    signals = np.zeros(len(prices), dtype=np.int8)
+    # Functions compiled by jit() have py_func
+    if NUMBA_AVAILABLE and hasattr(update, "py_func"):
+        state = _signal_loop_compiled(update, prices, state, params, signals)
+    else:
+        state = _signal_loop(update, prices, state, params, signals)
+    return signals, state
+
+
+def run_market_kernel(prices, signals, cash, position, fee_rate, quantity,
+                      buy_count_limit=-1, buy_count=0):
+    """Fill market orders of a spot BacktestMarket for every signal.
+
+    Args:
+        buy_count_limit (int): maximum number of open buys like
+            SpreadOrderExecutor. Negative means no limit (NormalExecutor).
+        buy_count (int): open buys at the start
+
+    Returns:
+        tuple: (cash, position, trade_count, buy_count, ok, ng). ok / ng
+            count the executed / rejected orders.
+    """
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    signals = np.ascontiguousarray(signals, dtype=np.int8)
+    loop = _market_loop_compiled if NUMBA_AVAILABLE else _market_loop
+    cash, position, trade_count, buy_count, ok, ng = loop(
+        prices, signals, float(cash), float(position), float(fee_rate),
+        float(quantity), int(buy_count_limit), int(buy_count))
+    return float(cash), float(position), int(trade_count), int(buy_count), int(ok), int(ng)
+
+
+class CompiledSignalGenerator(SignalGenerator):
+    """Signal generator defined by typed state and a pure update function.
+
+    Subclasses define:
+        param_names (tuple): static keys passed to update() as a float64 array
+        state_names (tuple): names of the state values in self.dynamic
+        init_state(self) -> tuple: initial state of float / int scalars and
+            NumPy arrays. Keep the type of every value fixed.
+        update(price, state, params) -> (signal, state): staticmethod
+            without side effects. signal is 1 (Buy), -1 (Sell) or 0 (Hold).
+            Arrays in the state may be updated in place.
+
+    generate_signals() calls update() on the interpreter, so the class
+    also runs where Numba is not installed (e.g. AWS Lambda).
+    generate_signals_batch() runs the whole loop compiled when Numba is
+    available, which the "vectorized" and "compiled" engines of
+    BacktestStrategy use. The state is kept in self.dynamic by name, so it
+    is saved to DynamoDB like the other generators.
+    """
+    param_names = ()
+    state_names = ()
+    _SIGNAL_NAMES = ("Hold", "Buy", "Sell")
+    _kernel = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "update" in cls.__dict__:
+            update = cls.__dict__["update"]
+            # Compiled lazily at the first call, once per class
+            cls._kernel = staticmethod(jit(getattr(update, "__func__", update)))
+
+    def init_state(self) -> tuple:
+        return ()
+
+    @staticmethod
+    def update(price, state, params):
+        return 0, state
+
+    def reset_param(self, param):
+        super().reset_param(param)
+        self._set_state(self.init_state())
+
+    def _params(self) -> np.ndarray:
+        return np.array([self.static[k] for k in self.param_names],
+                        dtype=np.float64)
+
+    def _get_state(self) -> tuple:
+        return tuple(self.dynamic[k] for k in self.state_names)
+
+    def _set_state(self, state):
+        for k, v in zip(self.state_names, state):
+            self.dynamic[k] = v
+
+    def generate_signals(self, price):
+        signal, state = self.update(float(price), self._get_state(), self._params())
+        self._set_state(state)
+        return self._SIGNAL_NAMES[int(signal)]
+
+    def generate_signals_batch(self, prices):
+        update = self._kernel if self._kernel is not None else self.update
+        signals, state = run_signal_kernel(update, prices, self._get_state(),
+                                           self._params())
+        self._set_state(tuple(v.item() if isinstance(v, np.generic) else v
+                              for v in state))
+        return signals, {}
+
+
+class MACDKernelSG(CompiledSignalGenerator):
+    """MACDSG written as a compiled kernel. Signals are identical to MACDSG."""
+    param_names = ("short_window", "long_window", "signal_window")
+    state_names = ("ema_count", "emashort_values", "emalong_values",
+                   "macd_values", "signal_line_values")
+
+    @property
+    def default_param(self):
+        return {
+            "short_window": 50,
+            "long_window": 100,
+            "signal_window": 75
+        }
+
+    def init_state(self):
+        return (0.0, 0.0, 0.0, 0.0, 0.0)
+
+    @staticmethod
+    def update(price, state, params):
+        count, emashort, emalong, macd_old, signal_line_old = state
+        if count == 0:
+            return 0, (1.0, price, price, 0.0, 0.0)
+        alpha_short = 2 / (params[0] + 1.0)
+        alpha_long = 2 / (params[1] + 1.0)
+        alpha_signal = 2 / (params[2] + 1.0)
+        emashort = alpha_short * price + (1 - alpha_short) * emashort
+        emalong = alpha_long * price + (1 - alpha_long) * emalong
+        macd = emashort - emalong
+        if macd_old == 0:
+            signal_line = macd
+        else:
+            signal_line = alpha_signal * macd + (1 - alpha_signal) * signal_line_old
+        signal = 0
+        if macd_old <= signal_line_old and macd > signal_line:
+            signal = 1
+        elif macd_old >= signal_line_old and macd < signal_line:
+            signal = -1
+        return signal, (count + 1.0, emashort, emalong, macd, signal_line)
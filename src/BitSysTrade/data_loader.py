@@ -4,7 +4,15 @@ import os
 import hashlib
 import json
 import datetime
-import functools
+import bisect
+import zipfile
+import xml.etree.ElementTree as ET
+
+from .utils.cache import LRUCache
+
+# Opened price stores, shared by every user of this module in the process
+# (e.g. all panel pages). Keyed on (path, size, mtime_ns) of the workbook.
+price_data_cache = LRUCache(max_bytes=2 * 1024 ** 3)
 
 def compute_checksum(file_path: str) -> str:
     """Excelファイルのチェックサム（SHA-256）を計算する"""
@@ -14,79 +22,240 @@ def compute_checksum(file_path: str) -> str:
             hash_sha256.update(chunk)
     return hash_sha256.hexdigest()
 
-@functools.cache
-def read_prices_from_chash(file_path, use_cache=True):
-    # キャッシュファイルとチェックサムファイルのパス
-    cache_file = file_path.replace('.xlsx', '_cache.npy')
-    checksum_file = file_path.replace('.xlsx', '_checksum.json')
-
-    # チェックサムの読み込みとExcelファイルの更新確認
-    current_checksum = compute_checksum(file_path)
-    is_cache_valid = False
-
-    if os.path.exists(checksum_file):
-        with open(checksum_file, 'r') as f:
-            cached_data = json.load(f)
-            if cached_data.get("checksum") == current_checksum:
-                is_cache_valid = True
-
-    # キャッシュを使用する場合で、有効なキャッシュが存在する場合
-    if use_cache and is_cache_valid and os.path.exists(cache_file):
-        print(f"Loading data from cache: {cache_file}")
-        all_data = np.load(cache_file, allow_pickle=True).item()
-    else:
-        print(f"Reading data from Excel: {file_path}")
-        all_data = {}
+class PriceStore:
+    """Columnar price store on disk.
+    Each sheet (month) is saved as two raw .npy files, int64 timestamps
+    (ns since epoch) and float64 prices. Files are opened lazily with
+    mmap, so opening the store is instant and only the accessed months are
+    read from disk.
+
+    store[sheet_name] returns {"date": datetime64[ns] array, "price": float64 array}.
+    """
+    META_FILE = "meta.json"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.meta = {}
+        self._arrays = {}
+        meta_path = os.path.join(directory, self.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                self.meta = json.load(f)
+
+    @property
+    def sheet_names(self) -> list:
+        return sorted(self.meta.get("sheets", []))
+
+    def keys(self):
+        return self.sheet_names
+
+    def __contains__(self, sheet_name):
+        return sheet_name in self.meta.get("sheets", [])
+
+    def __iter__(self):
+        return iter(self.sheet_names)
+
+    def __len__(self):
+        return len(self.meta.get("sheets", []))
+
+    def _path(self, sheet_name, column):
+        return os.path.join(self.directory, f"{sheet_name}_{column}.npy")
+
+    def __getitem__(self, sheet_name):
+        if sheet_name not in self:
+            raise KeyError(sheet_name)
+        if sheet_name not in self._arrays:
+            dates = np.load(self._path(sheet_name, "date"), mmap_mode='r')
+            prices = np.load(self._path(sheet_name, "price"), mmap_mode='r')
+            self._arrays[sheet_name] = {"date": dates.view('datetime64[ns]'),
+                                        "price": prices}
+        return self._arrays[sheet_name]
+
+    def write_sheet(self, sheet_name: str, dates, prices):
+        """Save one sheet. Call save_meta() to make it visible."""
+        os.makedirs(self.directory, exist_ok=True)
+        columns = {
+            "date": np.asarray(dates, dtype='datetime64[ns]').view(np.int64),
+            "price": np.asarray(prices, dtype=np.float64),
+        }
+        for column, values in columns.items():
+            path = self._path(sheet_name, column)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, values)
+            os.replace(path + ".tmp", path)
+        self._arrays.pop(sheet_name, None)
+        sheets = set(self.meta.get("sheets", []))
+        sheets.add(sheet_name)
+        self.meta["sheets"] = sorted(sheets)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the sheet files of the store."""
+        return sum(os.path.getsize(self._path(sheet_name, column))
+                   for sheet_name in self.sheet_names
+                   for column in ["date", "price"])
+
+    def save_meta(self, **kwargs):
+        self.meta.update(kwargs)
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = os.path.join(self.directory, self.META_FILE)
+        with open(meta_path + ".tmp", 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+
+def read_sheet_from_excel(excel_file, sheet_name: str):
+    """Read one sheet of the price workbook as (dates, prices) arrays.
+
+    Args:
+        excel_file (str | pd.ExcelFile): workbook path or opened workbook
+        sheet_name (str): sheet name
+    """
+    df = pd.read_excel(excel_file, sheet_name=sheet_name)
+    dates = pd.to_datetime(df.iloc[:, 0]).to_numpy(dtype='datetime64[ns]')  # 1列目が日時
+    prices = df.iloc[:, 1].to_numpy(dtype=np.float64)  # 2列目が価格データ
+    return dates, prices
+
 
-        # Excelファイルから各シートの価格データを取得
-        for sheet_name in pd.ExcelFile(file_path).sheet_names:
+_XLSX_NS = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+_XLSX_RID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+
+def compute_sheet_fingerprints(file_path: str) -> dict:
+    """Fingerprint of every sheet of an xlsx file without parsing cells.
+    An xlsx file is a zip archive with one XML file per sheet, and the zip
+    directory already holds the CRC32 and size of each file. Appending rows
+    to one sheet therefore only changes the fingerprint of that sheet.
+    Returns None if the file is not an xlsx archive.
+    """
+    try:
+        with zipfile.ZipFile(file_path) as z:
+            workbook = ET.fromstring(z.read("xl/workbook.xml"))
+            rels = ET.fromstring(z.read("xl/_rels/workbook.xml.rels"))
+            targets = {r.get("Id"): r.get("Target")
+                       for r in rels.findall("rel:Relationship", _XLSX_NS)}
+            fingerprints = {}
+            for sheet in workbook.findall("main:sheets/main:sheet", _XLSX_NS):
+                target = targets[sheet.get(_XLSX_RID)]
+                member = target.lstrip("/") if target.startswith("/") else "xl/" + target
+                info = z.getinfo(member)
+                fingerprints[sheet.get("name")] = f"{info.CRC:08x}-{info.file_size}"
+            return fingerprints
+    except (zipfile.BadZipFile, KeyError, ET.ParseError):
+        return None
+
+
+def read_prices_from_chash(file_path, use_cache=True) -> PriceStore:
+    """Open the PriceStore of the workbook, updating it if needed.
+    Opened stores are kept in price_data_cache. A changed workbook has a new
+    key, so the panel sees file updates without a restart.
+    use_cache=False rebuilds the store from Excel.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if use_cache:
+        store = price_data_cache.get(key)
+        if store is not None:
+            return store
+
+    store = _update_price_store(file_path, use_cache, stat)
+    # 古いバージョンのデータを解放
+    price_data_cache.invalidate(lambda k: k[0] == key[0])
+    price_data_cache.put(key, store, store.nbytes)
+    return store
+
+
+def invalidate_price_cache(file_path: str = None) -> int:
+    """Drop opened price stores of file_path (all if None) from the cache."""
+    if file_path is None:
+        return price_data_cache.invalidate()
+    path = os.path.abspath(file_path)
+    return price_data_cache.invalidate(lambda k: k[0] == path)
+
+
+def _update_price_store(file_path, use_cache, stat) -> PriceStore:
+    """Update the PriceStore on disk.
+    If size and mtime of the workbook are unchanged the store is used as is.
+    Otherwise only the sheets whose fingerprint changed (usually the current
+    month appended by app/gas/gas.js) are read from Excel again.
+    """
+    # キャッシュ(PriceStore)のディレクトリ
+    store_dir = file_path.replace('.xlsx', '_store')
+    store = PriceStore(store_dir)
+    file_state = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    if not use_cache:
+        store.meta = {}
+    elif all(store.meta.get(k) == v for k, v in file_state.items()):
+        print(f"Loading data from cache: {store_dir}")
+        return store
+
+    fingerprints = compute_sheet_fingerprints(file_path)
+    if fingerprints is None:
+        # xlsx以外はファイル全体のチェックサムで判定
+        checksum = compute_checksum(file_path)
+        sheet_names = pd.ExcelFile(file_path).sheet_names
+        fingerprints = {sheet_name: checksum for sheet_name in sheet_names}
+    cached = store.meta.get("sheet_fingerprints", {})
+    changed = [sheet_name for sheet_name, fingerprint in fingerprints.items()
+               if cached.get(sheet_name) != fingerprint or sheet_name not in store]
+
+    if changed:
+        print(f"Reading data from Excel: {file_path}")
+        excel_file = pd.ExcelFile(file_path)
+        for sheet_name in changed:
             print(f"Loading : {sheet_name}")
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
-            all_data[sheet_name] = {}
-            all_data[sheet_name]["date"] = df.iloc[:, 0].tolist()  # 2列目が価格データ
-            all_data[sheet_name]["price"] = df.iloc[:, 1].tolist()  # 2列目が価格データ
-
-        # キャッシュとして保存
-        np.save(cache_file, all_data)
-        with open(checksum_file, 'w') as f:
-            json.dump({"checksum": current_checksum}, f)
-        print(f"Data cached to: {cache_file}")
-    return all_data
+            store.write_sheet(sheet_name, *read_sheet_from_excel(excel_file, sheet_name))
+            cached[sheet_name] = fingerprints[sheet_name]
+    # Excelから削除されたシートを除く
+    store.meta["sheets"] = sorted(fingerprints.keys())
+    store.meta["sheet_fingerprints"] = {k: cached[k] for k in fingerprints}
+    store.save_meta(**file_state)
+    print(f"Data cached to: {store_dir}")
+    return store
+
 
 def read_prices_from_sheets(file_path: str, datetime_range: list, step: int = 1,
-                            use_cache: bool = False, with_date: bool = False) -> list:
+                            use_cache: bool = False, with_date: bool = False):
+    """Read prices in [datetime_range[0], datetime_range[1]).
+    Boundaries are found with np.searchsorted on the sorted timestamps of
+    each month. A range inside one month is returned as a view of the memory
+    mapped store (no copy), otherwise the views are concatenated.
+    step is applied per sheet.
+
+    Returns:
+        np.ndarray: prices, or (dates, prices) if with_date is True
+    """
     all_data = read_prices_from_chash(file_path, use_cache)
-    # 指定したシートのデータのみ取得
+    range_start = np.datetime64(datetime_range[0], 'ns')
+    range_end = np.datetime64(datetime_range[1], 'ns')
+
+    # 指定した期間のシート(YYYYMM)のみ取得
+    sheet_names = all_data.sheet_names
+    first = bisect.bisect_left(sheet_names, datetime_range[0].strftime("%Y%m"))
+    last = bisect.bisect_right(sheet_names, datetime_range[1].strftime("%Y%m"))
+
     all_prices = []
     all_dates = []
-    start_sheet = datetime_range[0].strftime("%Y%m")
-    end_sheet = datetime_range[1].strftime("%Y%m")
-    tmp = start_sheet if start_sheet in all_data else sorted(all_data.keys())[0]
-    sheet_names = []
-    while True:
-        sheet_names.append(tmp)
-        if tmp == end_sheet or tmp == sorted(all_data.keys())[-1]:
-            break
-        tmp = (datetime.datetime.strptime(tmp, "%Y%m") + pd.DateOffset(months=1)).strftime("%Y%m")
-    datetime_format = "%Y%m%d%H%M%S"
-    for i, sheet_name in enumerate(sheet_names):
-        if sheet_name in all_data:
-            start_idx = 0
-            end_idx = len(all_data[sheet_name]["date"])
-            if i==0:
-                for idx, date in enumerate(all_data[sheet_name]["date"]):
-                    if date >= datetime_range[0]:
-                        start_idx = idx
-                        break
-            elif i==len(sheet_names)-1:
-                for idx, date in enumerate(all_data[sheet_name]["date"]):
-                    if date >= datetime_range[1]:
-                        end_idx = idx
-                        break
-            all_prices.extend(all_data[sheet_name]["price"][start_idx:end_idx:step])
-            if with_date:
-                all_dates.extend(all_data[sheet_name]["date"][start_idx:end_idx:step])
-    if with_date:
-        return all_dates, all_prices
-    return all_prices
+    for sheet_name in sheet_names[first:last]:
+        dates = all_data[sheet_name]["date"]
+        start_idx = np.searchsorted(dates, range_start, side='left')
+        end_idx = np.searchsorted(dates, range_end, side='left')
+        if start_idx >= end_idx:
+            continue
+        all_prices.append(all_data[sheet_name]["price"][start_idx:end_idx:step])
+        all_dates.append(dates[start_idx:end_idx:step])
 
+    if len(all_prices) == 0:
+        prices = np.array([], dtype=np.float64)
+        dates = np.array([], dtype='datetime64[ns]')
+    elif len(all_prices) == 1:
+        prices, dates = all_prices[0], all_dates[0]
+    else:
+        prices, dates = np.concatenate(all_prices), np.concatenate(all_dates)
+    if with_date:
+        return dates, prices
+    return prices
@@ -6,16 +6,215 @@ import requests
 import time
 import hashlib
 import hmac
+import bisect
+import itertools
+from collections import deque
 from datetime import datetime
 
 
 class Order():
 
-    def __init__(self, side, quantity, price):
+    def __init__(self, side, quantity, price, order_id=None):
         self.side = side
         self.quantity = quantity
         self.price = price
-        self.order_id = datetime.now().timestamp()
+        if order_id is None:
+            order_id = datetime.now().timestamp()
+        self.order_id = order_id
+
+
+class OrderBook():
+    """Open limit orders indexed by price.
+    Each side keeps its orders sorted by price. A buy order fills when the
+    price falls to or below its price and a sell order when the price rises
+    to or above it, so the orders crossed by a price are a contiguous run
+    of each side, found with bisect. Orders of the same price keep the
+    order they were placed in.
+    Iterating yields the open orders in the order they were placed.
+
+    The sides are plain lists, so add() and remove() find the slot in
+    O(log n) but the insert / delete shifts the list (O(n) memmove, fast
+    for the few hundred orders of a backtest). crossed() is O(log n + k)
+    for k filled orders.
+    """
+
+    def __init__(self):
+        self._prices = {"Buy": [], "Sell": []}
+        self._orders = {"Buy": [], "Sell": []}
+        self._by_id = {}
+
+    def add(self, order: Order):
+        prices = self._prices[order.side]
+        i = bisect.bisect_right(prices, order.price)
+        prices.insert(i, order.price)
+        self._orders[order.side].insert(i, order)
+        self._by_id[order.order_id] = order
+
+    def remove(self, order: Order) -> bool:
+        if self._by_id.get(order.order_id) is not order:
+            return False
+        del self._by_id[order.order_id]
+        prices = self._prices[order.side]
+        orders = self._orders[order.side]
+        i = bisect.bisect_left(prices, order.price)
+        while orders[i] is not order:
+            i += 1
+        del prices[i]
+        del orders[i]
+        return True
+
+    def get(self, order_id):
+        return self._by_id.get(order_id)
+
+    def crossed(self, price: float) -> list:
+        """Orders filled at price, in the order they were placed."""
+        buy = self._orders["Buy"][bisect.bisect_left(self._prices["Buy"], price):]
+        sell = self._orders["Sell"][:bisect.bisect_right(self._prices["Sell"], price)]
+        orders = buy + sell
+        if len(orders) > 1:
+            orders.sort(key=lambda order: order.order_id)
+        return orders
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def __contains__(self, order):
+        return self._by_id.get(order.order_id) is order
+
+
+class SignalLog():
+    """Columnar log of signals. index and price are kept in growable
+    NumPy buffers instead of a list of (index, price) tuples.
+    Iterating or indexing still yields (index, price) tuples.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._index = np.empty(capacity, dtype=np.int64)
+        self._price = np.empty(capacity, dtype=np.float64)
+        self._len = 0
+
+    def append(self, index: int, price: float):
+        if self._len == len(self._index):
+            self._index = np.resize(self._index, 2 * len(self._index) + 1)
+            self._price = np.resize(self._price, 2 * len(self._price) + 1)
+        self._index[self._len] = index
+        self._price[self._len] = price
+        self._len += 1
+
+    @property
+    def index(self) -> np.ndarray:
+        return self._index[:self._len]
+
+    @property
+    def price(self) -> np.ndarray:
+        return self._price[:self._len]
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return zip(self.index.tolist(), self.price.tolist())
+
+    def __getitem__(self, i):
+        return list(self)[i] if isinstance(i, slice) else (int(self.index[i]), float(self.price[i]))
+
+    def __eq__(self, other):
+        if isinstance(other, SignalLog):
+            return (np.array_equal(self.index, other.index)
+                    and np.array_equal(self.price, other.price))
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"SignalLog({list(self)})"
+
+
+class FXPosition():
+    """Netted FX position.
+    size is signed (+ long / - short) and cost is the signed entry value of
+    the open size, so the volume weighted average entry is cost / size and
+    the unrealized profit is price * size - cost. Every fill is O(1) and
+    the mark-to-market works on a price or an array of prices.
+
+    Args:
+        lots (bool): Also keep the open size as FIFO lots and realize
+            closes against the oldest lots first, like the per-fill position
+            list. Otherwise closes are realized against the average entry.
+            Cash + unrealized profit is the same either way.
+    """
+
+    def __init__(self, lots: bool = False):
+        self.size = 0.0
+        self.cost = 0.0
+        self.realized = 0.0
+        self.lots = deque() if lots else None
+
+    @property
+    def price(self) -> float:
+        """Average entry price of the open size."""
+        return self.cost / self.size if self.size != 0 else 0.0
+
+    def value(self, price):
+        """Unrealized profit at price."""
+        return price * self.size - self.cost
+
+    def fill(self, size: float, price: float) -> float:
+        """Apply a fill of signed size and return the realized profit."""
+        profit = 0.0
+        if self.size != 0 and (self.size > 0) != (size > 0):
+            side = 1 if self.size > 0 else -1
+            close = min(abs(size), abs(self.size))
+            if self.lots is None:
+                profit = (price - self.cost / self.size) * close * side
+                if close == abs(self.size):
+                    self.cost = 0.0
+                else:
+                    self.cost -= self.cost / self.size * close * side
+            else:
+                remaining = close
+                while remaining > 0 and self.lots:
+                    lot = self.lots[0]
+                    take = min(remaining, lot[0])
+                    profit += (price - lot[1]) * take * side
+                    self.cost -= lot[1] * take * side
+                    remaining -= take
+                    if take == lot[0]:
+                        self.lots.popleft()
+                    else:
+                        lot[0] -= take
+                if close == abs(self.size):
+                    self.cost = 0.0
+                    self.lots.clear()
+            self.size = 0.0 if close == abs(self.size) else self.size - close * side
+            size += close * side
+            self.realized += profit
+        if size != 0:
+            self.size += size
+            self.cost += size * price
+            if self.lots is not None:
+                self.lots.append([abs(size), price])
+        return profit
+
+    def to_dict(self) -> dict:
+        """Plain numbers of the position (e.g. for YAML / JSON summaries)."""
+        data = {"size": float(self.size), "price": float(self.price),
+                "cost": float(self.cost), "realized": float(self.realized)}
+        if self.lots is not None:
+            data["lots"] = [[float(size), float(price)] for size, price in self.lots]
+        return data
+
+    def __eq__(self, other):
+        if not isinstance(other, FXPosition):
+            return NotImplemented
+        return (self.size == other.size and self.cost == other.cost
+                and self.realized == other.realized
+                and (self.lots is None) == (other.lots is None)
+                and (self.lots is None or list(self.lots) == list(other.lots)))
+
+    def __repr__(self):
+        return f"FXPosition(size={self.size}, price={self.price}, realized={self.realized})"
 
 
 class Market(ABC):
@@ -73,7 +272,7 @@ class Market(ABC):
     def _checkout_position(self, order, current_positions):
         tmp_profit = 0
         if order["side"] == "BUY":
-            for current_position in current_positions:
+            for current_position in list(current_positions):
                 if current_position["side"] == "SELL":
                     if current_position["size"] > order["size"]:
                         current_position["size"] -= order["size"]
@@ -88,7 +287,7 @@ class Market(ABC):
                 if order["size"] == 0:
                     break
         else:
-            for current_position in current_positions:
+            for current_position in list(current_positions):
                 if current_position["side"] == "BUY":
                     if current_position["size"] > order["size"]:
                         current_position["size"] -= order["size"]
@@ -110,6 +309,9 @@ class Market(ABC):
     def get_open_orders(self):
         return self.order
 
+    def open_order_count(self) -> int:
+        return len(self.get_open_orders())
+
     @abstractmethod
     def cancel_order(self, order_id: int) -> bool:
         """
@@ -121,16 +323,33 @@ class Market(ABC):
 
 
 class BacktestMarket(Market):
+    """
+    Args:
+        record (str): History recording level, applied at reset_portfolio().
+            "full" records signals and per-tick total value / position.
+            "summary" records signals only.
+            "none" records nothing. The portfolio is valued on the last
+            tick only, which is all the optimizers use.
+        fx_lots (bool): Keep FIFO lots in the FX position (see FXPosition).
+    """
+
+    RECORD_LEVELS = ("none", "summary", "full")
 
     def __init__(self, data: np.ndarray,
                 dates = None,
                 fee_rate: float = 0.0015,
-                is_fx = False):
+                is_fx = False,
+                record: Literal["none", "summary", "full"] = "full",
+                fx_lots: bool = False):
         super().__init__()
         self.data = data
         self.index = 0
         self.fee_rate = fee_rate
         self.is_fx = is_fx
+        self.record = record
+        self.fx_lots = fx_lots
+        self.order = OrderBook()
+        self._order_ids = itertools.count(1)
         if dates is None:
             self.dates = np.arange(len(data))
         else:
@@ -141,45 +360,69 @@ class BacktestMarket(Market):
             "trade_count": 0,
             'cash': start_cash,
             'position': start_coin,
-            'positions_fx': [],
+            'position_fx': FXPosition(lots=self.fx_lots),
             'total_value': start_cash,
             'profit_rate': 0
         }
-        self.hist = {
-            "signals": {
-                "Buy": [],
-                "Sell": []
-            },
-            "execute_signals": {
-                "Buy": [],
-                "Sell": []
-            },
-            "total_value_hist": [],
-            "total_pos_hist": []
-        }
-        self.order = []
+        if self.record not in self.RECORD_LEVELS:
+            raise ValueError(f"record must be one of {self.RECORD_LEVELS}: {self.record}")
+        self._record_signals = self.record != "none"
+        self._record_ticks = self.record == "full"
+        self.hist = {}
+        if self._record_signals:
+            self.hist["signals"] = {
+                "Buy": SignalLog(),
+                "Sell": SignalLog()
+            }
+            self.hist["execute_signals"] = {
+                "Buy": SignalLog(),
+                "Sell": SignalLog()
+            }
+        if self._record_ticks:
+            # 1 value per tick, written at self.index
+            self.hist["total_value_hist"] = np.full(len(self.data), np.nan)
+            self.hist["total_pos_hist"] = np.full(len(self.data), np.nan)
+        self.order = OrderBook()
+        self._order_ids = itertools.count(1)
         self.index = 0
         self.start_cash = start_cash
 
     def save_history(self, price: float):
+        if not self._record_ticks and self.index != len(self.data) - 1:
+            return
         if self.is_fx:
             self.portfolio['total_value'] = self.portfolio[
-                'cash'] + self._calc_current_value(price, self.portfolio['positions_fx'])
+                'cash'] + self.portfolio['position_fx'].value(price)
         else:
             self.portfolio['total_value'] = self.portfolio[
                 'cash'] + self.portfolio['position'] * price
         self.portfolio['profit_rate'] = self.portfolio['total_value'] / self.start_cash
-        self.hist["total_value_hist"].append(self.portfolio['total_value'])
-        self.hist["total_pos_hist"].append(self.portfolio['position'])
-
-    def _calc_current_value(self, current_price, current_positions):
-        current_value = 0
-        for current_position in current_positions:
-            if current_position["side"] == "BUY":
-                current_value += (current_price - current_position["price"]) * current_position["size"]
-            else:
-                current_value += (current_position["price"] - current_price) * current_position["size"]
-        return current_value
+        if self._record_ticks:
+            self.hist["total_value_hist"][self.index] = self.portfolio['total_value']
+            self.hist["total_pos_hist"][self.index] = self.portfolio['position']
+
+    def save_history_batch(self, start: int, stop: int):
+        """Save history of ticks [start, stop) at once.
+        The portfolio must not change inside the range, so the result is the
+        same as calling save_history() for each price.
+        """
+        if not self._record_ticks:
+            # Only the last tick is valued
+            if stop != len(self.data):
+                return
+            start = max(stop - 1, 0)
+        if stop <= start:
+            return
+        prices = np.asarray(self.data[start:stop])
+        if self.is_fx:
+            total_value = self.portfolio['cash'] + self.portfolio['position_fx'].value(prices)
+        else:
+            total_value = self.portfolio['cash'] + self.portfolio['position'] * prices
+        self.portfolio['total_value'] = total_value[-1]
+        self.portfolio['profit_rate'] = self.portfolio['total_value'] / self.start_cash
+        if self._record_ticks:
+            self.hist["total_value_hist"][start:stop] = total_value
+            self.hist["total_pos_hist"][start:stop] = self.portfolio['position']
 
     def set_current_index(self, index: int):
         self.index = index
@@ -196,13 +439,15 @@ class BacktestMarket(Market):
     def get_open_orders(self):
         return self.order
 
+    def open_order_count(self) -> int:
+        # OrderBook keeps the count as orders are added and removed
+        return len(self.order)
+
     def cancel_order(self, order_id: int) -> bool:
-        orders = self.get_open_orders()
-        for order in orders:
-            if order.order_id == order_id:
-                self.order.remove(order)
-                return True
-        return False
+        order = self.order.get(order_id)
+        if order is None:
+            return False
+        return self.order.remove(order)
 
     def _calculate_margin(self, position: float, price: float, lot_size: float = 1.0, leverage: float = 1.0) -> float:
         """
@@ -213,17 +458,11 @@ class BacktestMarket(Market):
         return margin_required
 
     def _execute_order_fx(self, quantity: float, price: float, side) -> bool:
-        # order = {"side": "BUY", "size": 0, "price": 0}
-        current_position = 0
-        for pos in self.portfolio['positions_fx']:
-            if pos["side"] == "BUY":
-                current_position += pos["size"]
-            else:
-                current_position -= pos["size"]
-        tmp_position = current_position + quantity
+        position = self.portfolio['position_fx']
+        tmp_position = position.size + quantity
         if self.portfolio['cash'] >= self._calculate_margin(tmp_position, price):
-            order = {"size": quantity, "price": price, "side": side}
-            self.portfolio['cash'] += self._checkout_position(order, self.portfolio['positions_fx'])
+            size = quantity if side == "BUY" else -quantity
+            self.portfolio['cash'] += position.fill(size, price)
             self.portfolio["trade_count"] += 1
             return True
         else:
@@ -270,29 +509,30 @@ class BacktestMarket(Market):
     def place_market_order(self, side: Literal['Buy', 'Sell'],
                            quantity: float) -> bool:
         price = self.get_current_price()
-        self.hist["signals"][side].append((self.index, price))
+        if self._record_signals:
+            self.hist["signals"][side].append(self.index, price)
         if side == 'Buy':
             ret = self._execute_buy_order(quantity, price)
         elif side == 'Sell':
             ret = self._execute_sell_order(quantity, price)
         else:
             ret = False
-        if ret:
-            self.hist["execute_signals"][side].append((self.index, price))
+        if ret and self._record_signals:
+            self.hist["execute_signals"][side].append(self.index, price)
         return ret
 
     def place_limit_order(self, side: Literal['Buy', 'Sell'], quantity: float,
                           price: float) -> bool:
-        self.order.append(Order(side, quantity, price))
+        self.order.add(Order(side, quantity, price, next(self._order_ids)))
         return True
 
     def check_order(self):
+        if len(self.order) == 0:
+            return
         price = self.get_current_price()
-        for order in self.order:
-            if (order.side == "Sell" and price >= order.price) or \
-               (order.side == "Buy" and price <= order.price):
-                if self.place_market_order(order.side, order.quantity):
-                    self.order.remove(order)
+        for order in self.order.crossed(price):
+            if self.place_market_order(order.side, order.quantity):
+                self.order.remove(order)
 
 
 class BitflyerMarket(Market):
@@ -303,6 +543,9 @@ class BitflyerMarket(Market):
         self.secret = None
         self.API_URL = 'https://api.bitflyer.jp'
         self.product_code = 'FX_BTC_JPY'
+        # Keep-alive connections are reused while the object lives
+        # (warm Lambda containers)
+        self.session = requests.Session()
 
     def set_apikey(self, apikey, secret):
         self.apikey = apikey
@@ -326,7 +569,7 @@ class BitflyerMarket(Market):
         body = json.dumps(order_data)
         headers = self.header('POST', endpoint=endpoint, body=body)
 
-        res = requests.post(order_url, headers=headers, data=body)
+        res = self.session.post(order_url, headers=headers, data=body)
         if 'child_order_acceptance_id' in res.json():
             return True
         else:
@@ -352,7 +595,7 @@ class BitflyerMarket(Market):
         body = json.dumps(order_data)
         headers = self.header('POST', endpoint=endpoint, body=body)
 
-        res = requests.post(order_url, headers=headers, data=body)
+        res = self.session.post(order_url, headers=headers, data=body)
         if 'child_order_acceptance_id' in res.json():
             return True
         else:
@@ -394,7 +637,7 @@ class BitflyerMarket(Market):
 
         headers = self.header('GET', endpoint=endpoint_for_header, body="")
 
-        response = requests.get(self.API_URL + endpoint,
+        response = self.session.get(self.API_URL + endpoint,
                                 headers=headers,
                                 params=params)
         orders = response.json()
@@ -416,7 +659,7 @@ class BitflyerMarket(Market):
 
         headers = self.header('GET', endpoint=endpoint_for_header, body="")
 
-        response = requests.get(self.API_URL + endpoint,
+        response = self.session.get(self.API_URL + endpoint,
                                 headers=headers,
                                 params=params)
         orders = response.json()
@@ -424,8 +667,9 @@ class BitflyerMarket(Market):
 
     def get_current_price(self):
         # 現在の市場価格を取得
-        endpoint = '/v1/ticker?product_code={self.product_code}'
-        response = requests.get(self.API_URL + endpoint)
+        endpoint = '/v1/ticker'
+        response = self.session.get(self.API_URL + endpoint,
+                                    params={'product_code': self.product_code})
         price = float(response.json()['ltp'])
         return price
 
@@ -448,7 +692,7 @@ class BitflyerMarket(Market):
 
         headers = self.header('GET', endpoint=endpoint_for_header, body="")
 
-        response = requests.get(self.API_URL + endpoint,
+        response = self.session.get(self.API_URL + endpoint,
                                 headers=headers,
                                 params=params)
         executions = response.json()
@@ -1,10 +1,263 @@
+import functools
+import hashlib
+import math
 import numpy as np
-from tqdm import tqdm
 from abc import ABC, abstractmethod
 from typing import Literal
 import os
 
+from .utils.cache import LRUCache
+
+# Integer codes used by the batch (vectorized) signal path
+SIGNAL_CODES = {"Hold": 0, "Buy": 1, "Sell": -1}
+SIGNAL_NAMES = {v: k for k, v in SIGNAL_CODES.items()}
+
+# Upper bound of elements materialized at once by sliding window reductions
+_BATCH_CHUNK_ELEMENTS = 1 << 22
+
+
+@functools.cache
+def _load_lfilter():
+    """scipy.signal.lfilter, or None if scipy is not installed.
+    Imported on first use so that importing this module (e.g. in the Lambda)
+    does not load scipy.
+    """
+    try:
+        from scipy.signal import lfilter
+    except ImportError:
+        return None
+    return lfilter
+
+
+def _rolling_reduce(values, window, func):
+    """Apply func(view, axis=1) to every full sliding window of values.
+    Rows are processed in chunks so that memory stays bounded even for
+    large windows. Each row is reduced exactly like func(values[i:i+window]).
+    """
+    view = np.lib.stride_tricks.sliding_window_view(values, window)
+    out = np.empty(len(view), dtype=np.float64)
+    step = max(1, _BATCH_CHUNK_ELEMENTS // window)
+    for start in range(0, len(view), step):
+        out[start:start + step] = func(view[start:start + step], axis=1)
+    return out
+
+
+def _fingerprint(prices) -> str:
+    """Hash of the dtype, shape and values of an array."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str((prices.dtype.str, prices.shape)).encode())
+    digest.update(np.ascontiguousarray(prices).data)
+    return digest.hexdigest()
+
+
+class _ArrayFingerprint():
+    """_fingerprint() of the last array, memoized by identity.
+    The array is read only until release() or the next array, so it can
+    not be changed in place while its old hash is reused. Writes through
+    another view of the same memory are not detected.
+    """
+
+    def __init__(self):
+        self._array = None
+        self._value = None
+        self._locked = False
+
+    def __call__(self, prices) -> str:
+        if self._array is not prices:
+            self.release()
+            self._value = _fingerprint(prices)
+            # Holding the array keeps its identity valid
+            self._array = prices
+            if prices.flags.writeable:
+                prices.flags.writeable = False
+                self._locked = True
+        return self._value
+
+    def release(self):
+        """Make the array writable again and forget its hash."""
+        if self._locked:
+            self._array.flags.writeable = True
+        self._array = None
+        self._value = None
+        self._locked = False
+
+
+class RollingStatsTable():
+    """Prefix sum / prefix sum of squares of one price series, shared by the
+    runs of a parameter sweep (GridBacktester.backtest(sweep=True)).
+    The table is built once per series. The rolling mean / std of a window
+    is then derived in O(N) and cached, so runs that only differ in
+    thresholds such as num_std_dev or reverse reuse it.
+    The values equal np.mean / np.std of each window up to float rounding.
+    Integer tables hold the truncated prices and their window sums are exact.
+
+    Args:
+        max_bytes (int): memory budget of the cached window statistics.
+            Least recently used windows are evicted.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024**2):
+        self.max_bytes = max_bytes
+        self._fingerprint = _ArrayFingerprint()
+        self._source = None
+        self._tables = {}
+        self._cache = LRUCache(max_bytes)
+
+    def __getstate__(self):
+        # Rebuilt by each worker process instead of being pickled
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_bytes"])
+
+    def _table(self, prices, integer):
+        # Identified by content: a new array at the address of a freed one
+        # (e.g. a temporary of np.asarray) must not get the old tables
+        source = self._fingerprint(prices)
+        if self._source != source:
+            self._source = source
+            self._tables = {}
+            self._cache.invalidate()
+        if integer not in self._tables:
+            if integer:
+                values = prices.astype(np.int64)
+                center = int(np.mean(values)) if len(values) > 0 else 0
+            else:
+                values = prices
+                center = float(np.mean(values)) if len(values) > 0 else 0.0
+            # Centering keeps the sums small and the variance accurate
+            x = values - center
+            dtype = np.int64 if integer else np.float64
+            prefix = np.zeros(len(x) + 1, dtype=dtype)
+            prefix_sq = np.zeros(len(x) + 1, dtype=dtype)
+            np.cumsum(x, out=prefix[1:])
+            # int64 may wrap around, but differences of the prefix sums
+            # are exact while the window sum itself fits in int64
+            np.cumsum(x * x, out=prefix_sq[1:])
+            max_sq = int(np.abs(x).max()) ** 2 if integer and len(x) > 0 else 0
+            self._tables[integer] = (prefix, prefix_sq, center, max_sq)
+        return self._tables[integer]
+
+    def rolling(self, prices, window, integer=False):
+        """Mean and std of every full window of prices, like
+        _rolling_reduce(prices, window, np.mean / np.std).
+        The std of float tables loses digits on very short windows, because
+        the prefix sums of squares cancel. Integer tables are exact.
+
+        Returns:
+            tuple | None: (mean, std), or None if the window sums of an
+                integer table can overflow int64.
+        """
+        prefix, prefix_sq, center, max_sq = self._table(prices, integer)
+        key = (integer, window)
+        stats = self._cache.get(key)
+        if stats is None:
+            if window * max_sq >= 2 ** 63:
+                return None
+            total = (prefix[window:] - prefix[:-window]).astype(np.float64)
+            total_sq = (prefix_sq[window:] - prefix_sq[:-window]).astype(np.float64)
+            mean = total / window
+            var = np.maximum(total_sq / window - mean * mean, 0.0)
+            stats = (mean + center, np.sqrt(var))
+            self._cache.put(key, stats, 2 * mean.nbytes)
+        return stats
+
+    def release(self):
+        """Make the last price array writable again (see _ArrayFingerprint)."""
+        self._fingerprint.release()
+
+    def expanding(self, prices, stop, integer=False):
+        """Mean and std of prices[:i + 1] for i in range(stop)."""
+        prefix, prefix_sq, center, max_sq = self._table(prices, integer)
+        key = (integer, "expanding", stop)
+        stats = self._cache.get(key)
+        if stats is None:
+            if stop * max_sq >= 2 ** 63:
+                return None
+            count = np.arange(1, stop + 1)
+            mean = prefix[1:stop + 1].astype(np.float64) / count
+            var = np.maximum(prefix_sq[1:stop + 1].astype(np.float64) / count
+                             - mean * mean, 0.0)
+            stats = (mean + center, np.sqrt(var))
+            self._cache.put(key, stats, 2 * mean.nbytes)
+        return stats
+
+
+class IndicatorCache():
+    """Indicator series of the batch paths, kept across backtests.
+    Keys are (dataset fingerprint, indicator kind, window params), so an
+    optimization that revisits the same windows with other thresholds
+    computes every distinct series once (BayesianBacktester).
+    Cached arrays are read only and identical to a fresh computation.
+
+    Args:
+        max_bytes (int): memory budget. Least recently used series are
+            evicted.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024**2):
+        self.max_bytes = max_bytes
+        self._cache = LRUCache(max_bytes)
+        self._fingerprint = _ArrayFingerprint()
+
+    def __getstate__(self):
+        # Each worker process fills its own cache
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_bytes"])
+
+    def fingerprint(self, prices) -> str:
+        """Hash of the price values. Memoized for the last array, which is
+        read only until release() (changing it in place raises instead of
+        returning stale indicators).
+        """
+        return self._fingerprint(prices)
+
+    def release(self):
+        """Make the last price array writable again. The next call hashes it."""
+        self._fingerprint.release()
+
+    def get(self, prices, kind: str, params: tuple, compute):
+        """Cached compute() of prices.
+
+        Args:
+            prices (np.ndarray): price series
+            kind (str): indicator name
+            params (tuple): every parameter the indicator depends on
+            compute (callable): () -> np.ndarray or tuple of np.ndarray
+
+        Returns:
+            np.ndarray | tuple: read only array(s)
+        """
+        key = (self.fingerprint(prices), kind, params)
+        value = self._cache.get(key)
+        if value is None:
+            value = compute()
+            arrays = value if isinstance(value, tuple) else (value,)
+            for a in arrays:
+                a.flags.writeable = False
+            self._cache.put(key, value, sum(a.nbytes for a in arrays))
+        return value
+
+    def clear(self):
+        self._cache.invalidate()
+        self._fingerprint.release()
+
+    @property
+    def stats(self) -> dict:
+        return self._cache.stats
+
+
 class SignalGenerator(ABC):
+    # Empty so that subclasses declaring __slots__ get no __dict__
+    __slots__ = ()
+    # RollingStatsTable set during a sweep. Batch paths read rolling
+    # statistics from it instead of recomputing them.
+    rolling_stats = None
+    # IndicatorCache shared by the runs of an optimization
+    indicator_cache = None
+
     def __init__(self):
         self.dynamic = {}
         self.static = self.default_param
@@ -21,6 +274,50 @@ class SignalGenerator(ABC):
     def generate_signals(self, price):
         pass
 
+    def generate_signals_batch(self, prices):
+        """Generate signals for a whole price series at once.
+        Override this to give the generator a vectorized path. The result
+        must match calling generate_signals() for every price in order.
+
+        Args:
+            prices (np.ndarray): price series
+
+        Returns:
+            tuple | None: (signals, states). signals is an int8 array of
+                SIGNAL_CODES, states is a dict of per-tick indicator arrays.
+                None if the generator has no vectorized path.
+        """
+        return None
+
+    def _indicator(self, prices, kind, params, compute):
+        """compute() through indicator_cache when it is set.
+        params must hold every value the result depends on.
+        """
+        if self.indicator_cache is None:
+            return compute()
+        return self.indicator_cache.get(prices, kind, params, compute)
+
+    def _rolling_mean_std(self, prices, window, integer=False):
+        """(mean, std) of every full window of prices (int64-truncated if
+        integer), from rolling_stats when it is set.
+        """
+        if self.rolling_stats is not None:
+            stats = self.rolling_stats.rolling(prices, window, integer)
+            if stats is not None:
+                return stats
+
+        def compute():
+            values = prices.astype(np.int64) if integer else prices
+            return (_rolling_reduce(values, window, np.mean),
+                    _rolling_reduce(values, window, np.std))
+        return self._indicator(prices, "rolling_mean_std", (window, integer), compute)
+
+    def _rolling_mean(self, prices, window):
+        if self.rolling_stats is not None:
+            return self._rolling_mean_std(prices, window)[0]
+        return self._indicator(prices, "rolling_mean", (window,),
+                               lambda: _rolling_reduce(prices, window, np.mean))
+
 class MovingAverageCrossoverSG(SignalGenerator):
     @property
     def default_param(self):
@@ -60,8 +357,157 @@ class MovingAverageCrossoverSG(SignalGenerator):
         else:
             return "Hold"
 
+    def generate_signals_batch(self, prices):
+        prices = np.asarray(prices, dtype=np.float64)
+        n = len(prices)
+        short_window = self.static["short_window"]
+        long_window = self.static["long_window"]
+        short_mavg = np.full(n, np.nan)
+        long_mavg = np.full(n, np.nan)
+        signals = np.zeros(n, dtype=np.int8)
+
+        if n >= long_window + 1:
+            # Tick i sees price_hist = prices[i - long_window:i + 1]
+            ticks = np.arange(long_window, n)
+            # Slices are clipped to price_hist like in generate_signals()
+            short_len = min(short_window, long_window + 1)
+            short_old_len = min(short_window, long_window)
+            short_cur = self._rolling_mean(prices, short_len)[ticks - short_len + 1]
+            short_old = self._rolling_mean(prices, short_old_len)[ticks - short_old_len]
+            long_all = self._rolling_mean(prices, long_window)
+            long_cur = long_all[ticks - long_window + 1]
+            long_old = long_all[ticks - long_window]
+
+            short_mavg[long_window:] = short_cur
+            long_mavg[long_window:] = long_cur
+            buy = (short_cur > long_cur) & (short_old < long_old) & (long_cur > long_old)
+            sell = ~buy & (short_cur < long_cur) & (short_old > long_old)
+            signals[long_window:][buy] = SIGNAL_CODES["Buy"]
+            signals[long_window:][sell] = SIGNAL_CODES["Sell"]
+
+            self.dynamic["short_mavg"] = short_cur[-1]
+            self.dynamic["long_mavg"] = long_cur[-1]
+            self.dynamic["price_hist"] = prices[-long_window:].copy()
+        elif n > 0:
+            self.dynamic["price_hist"] = np.append(self.dynamic["price_hist"], prices)
+        return signals, {"short_mavg": short_mavg, "long_mavg": long_mavg}
+
+
+class IncrementalMovingAverageCrossoverSG(MovingAverageCrossoverSG):
+    """MovingAverageCrossoverSG with O(1) work per tick.
+    The last long_window + 1 prices are kept in a preallocated ring buffer and
+    the short/long window sums are updated with the entering and leaving
+    price. The previous averages are the sums of the previous tick, so no
+    mean is recomputed. The sums are rebuilt from the buffer once per buffer
+    length to stop float drift, which keeps the cost amortized O(1).
+    The whole state lives in self.dynamic and can be saved to DynamoDB.
+    """
+
+    def reset_param(self, param):
+        super().reset_param(param)
+        self._load_ring(np.array([]))
+
+    def _windows(self):
+        long_window = int(self.static["long_window"])
+        short_window = min(int(self.static["short_window"]), long_window)
+        return short_window, long_window
+
+    def _load_ring(self, ordered_prices):
+        """Rebuild the ring buffer state from prices in time order."""
+        short_window, long_window = self._windows()
+        size = long_window + 1
+        ordered_prices = np.asarray(ordered_prices, dtype=np.float64)[-size:]
+        ring = np.zeros(size)
+        ring[:len(ordered_prices)] = ordered_prices
+        self.dynamic["price_hist"] = ring
+        self.dynamic["price_hist_head"] = len(ordered_prices) % size
+        self.dynamic["price_hist_len"] = len(ordered_prices)
+        self.dynamic["short_sum"] = float(np.sum(ordered_prices[-short_window:]))
+        self.dynamic["long_sum"] = float(np.sum(ordered_prices[-long_window:]))
+        self.dynamic["sum_resync"] = 0
+
+    def _check_ring(self):
+        """Make the restored state usable.
+        Arrays read back from DynamoDB are read only, and the state may come
+        from MovingAverageCrossoverSG or from different windows.
+        """
+        ring = self.dynamic["price_hist"]
+        if "price_hist_head" not in self.dynamic:
+            self._load_ring(ring)
+        elif len(ring) != self._windows()[1] + 1:
+            head = self.dynamic["price_hist_head"]
+            length = self.dynamic["price_hist_len"]
+            self._load_ring(np.roll(ring, -head)[len(ring) - length:])
+        elif not ring.flags.writeable:
+            self.dynamic["price_hist"] = np.array(ring)
+
+    def generate_signals(self, price):
+        self._check_ring()
+        dynamic = self.dynamic
+        short_window, long_window = self._windows()
+        ring = dynamic["price_hist"]
+        size = len(ring)
+        head = dynamic["price_hist_head"]
+        count = dynamic["price_hist_len"]
+
+        short_sum_old = dynamic["short_sum"]
+        long_sum_old = dynamic["long_sum"]
+        # 窓から外れる価格を差し引き、新しい価格を加える
+        if count >= short_window:
+            dynamic["short_sum"] -= ring[(head - short_window) % size]
+        if count >= long_window:
+            dynamic["long_sum"] -= ring[(head - long_window) % size]
+        dynamic["short_sum"] += price
+        dynamic["long_sum"] += price
+        ring[head] = price
+        dynamic["price_hist_head"] = (head + 1) % size
+        dynamic["price_hist_len"] = count = min(count + 1, size)
+
+        dynamic["sum_resync"] += 1
+        if dynamic["sum_resync"] >= size:
+            ordered = np.roll(ring, -dynamic["price_hist_head"])[size - count:]
+            dynamic["short_sum"] = float(np.sum(ordered[-short_window:]))
+            dynamic["long_sum"] = float(np.sum(ordered[-long_window:]))
+            dynamic["sum_resync"] = 0
+
+        if count < size:
+            return "Hold"  # Not enough data for calculation
+
+        dynamic["short_mavg"] = short_mavg = dynamic["short_sum"] / short_window
+        dynamic["long_mavg"] = long_mavg = dynamic["long_sum"] / long_window
+        short_mavg_old = short_sum_old / short_window
+        long_mavg_old = long_sum_old / long_window
+
+        if short_mavg > long_mavg and short_mavg_old < long_mavg_old and long_mavg > long_mavg_old:
+            return 'Buy'
+        elif short_mavg < long_mavg and short_mavg_old > long_mavg_old:
+            return 'Sell'
+        else:
+            return "Hold"
+
+    def generate_signals_batch(self, prices):
+        result = super().generate_signals_batch(prices)
+        # MovingAverageCrossoverSG leaves the window in time order
+        if len(prices) > 0:
+            self._load_ring(self.dynamic["price_hist"])
+        return result
+
 
 class MACDSG(SignalGenerator):
+    # The EMA state lives in slots while signals are generated. It is
+    # written to the dynamic dict only when the dict is read, e.g. by
+    # Strategy.get_all_dynamic() before saving to DynamoDB, and read back
+    # when a dict is assigned (Strategy.set_all_dynamic()).
+    __slots__ = ("static", "rolling_stats", "indicator_cache",
+                 "_dynamic", "_prices", "_emashort", "_emalong", "_macd",
+                 "_signal_line", "_macd_old", "_signal_line_old")
+
+    def __init__(self):
+        # The slots hide the class defaults of SignalGenerator
+        self.rolling_stats = None
+        self.indicator_cache = None
+        super().__init__()
+
     @property
     def default_param(self):
         return {
@@ -70,65 +516,176 @@ class MACDSG(SignalGenerator):
             "signal_window": 75
         }
 
+    @property
+    def dynamic(self):
+        d = self._dynamic
+        d["prices"] = self._prices
+        d["emashort_values"] = self._emashort
+        d["emalong_values"] = self._emalong
+        d["macd_values"] = self._macd
+        d["signal_line_values"] = self._signal_line
+        if self._prices is not None:
+            d["macd_values_old"] = self._macd_old
+            d["signal_line_values_old"] = self._signal_line_old
+        return d
+
+    @dynamic.setter
+    def dynamic(self, d):
+        self._dynamic = d
+        self._prices = d.get("prices")
+        self._emashort = d.get("emashort_values")
+        self._emalong = d.get("emalong_values")
+        self._macd = d.get("macd_values")
+        self._signal_line = d.get("signal_line_values")
+        self._macd_old = d.get("macd_values_old")
+        self._signal_line_old = d.get("signal_line_values_old")
+
     def reset_param(self, param):
         super().reset_param(param)
-        self.dynamic["count"] = 0
-        self.dynamic["prices"] = None
-        self.dynamic["emashort_values"] = None
-        self.dynamic["emalong_values"] = None
-        self.dynamic["macd_values"] = None
-        self.dynamic["signal_line_values"] = None
+        self._dynamic["count"] = 0
+        self._dynamic.pop("macd_values_old", None)
+        self._dynamic.pop("signal_line_values_old", None)
+        self._prices = None
+        self._emashort = None
+        self._emalong = None
+        self._macd = None
+        self._signal_line = None
+        self._macd_old = None
+        self._signal_line_old = None
 
     def _calculate_ema(self, current_price, previous_ema, window):
         alpha = 2 / (window + 1.0)
         return alpha * current_price + (1 - alpha) * previous_ema
 
     def generate_signals(self, price):
-        if self.dynamic["prices"] is None:
+        if self._prices is None:
             # Initialize
             emashort = emalong = price
             macd = signal_line = 0.0
         else:
             # calcurate EMA
-            emashort = self._calculate_ema(price,
-                                           self.dynamic["emashort_values"],
+            emashort = self._calculate_ema(price, self._emashort,
                                            self.static["short_window"])
-            emalong = self._calculate_ema(price,
-                                          self.dynamic["emalong_values"],
+            emalong = self._calculate_ema(price, self._emalong,
                                           self.static["long_window"])
 
             # calcurate MACD
             macd = emashort - emalong
 
             # calucurate signal line
-            if self.dynamic["macd_values"] == 0:
+            if self._macd == 0:
                 signal_line = macd
             else:
                 signal_line = self._calculate_ema(
-                    macd, self.dynamic["signal_line_values"],
-                    self.static["signal_window"])
+                    macd, self._signal_line, self.static["signal_window"])
 
-        self.dynamic["prices"] = price
-
-        self.dynamic["emashort_values"] = emashort
-        self.dynamic["emalong_values"] = emalong
-        self.dynamic["macd_values_old"] = self.dynamic["macd_values"]
-        self.dynamic["macd_values"] = macd
-        self.dynamic["signal_line_values_old"] = self.dynamic[
-            "signal_line_values"]
-        self.dynamic["signal_line_values"] = signal_line
+        self._prices = price
+        self._emashort = emashort
+        self._emalong = emalong
+        macd_old = self._macd_old = self._macd
+        self._macd = macd
+        signal_line_old = self._signal_line_old = self._signal_line
+        self._signal_line = signal_line
 
         # generate signal
         signal = "Hold"
-        if self.dynamic["macd_values_old"] is not None:
-            if self.dynamic["macd_values_old"] <= self.dynamic[
-                    "signal_line_values_old"] and macd > signal_line:
+        if macd_old is not None:
+            if macd_old <= signal_line_old and macd > signal_line:
                 signal = "Buy"
-            elif self.dynamic["macd_values_old"] >= self.dynamic[
-                    "signal_line_values_old"] and macd < signal_line:
+            elif macd_old >= signal_line_old and macd < signal_line:
                 signal = "Sell"
         return signal
 
+    def _ema_batch(self, lfilter, prices, alpha, first):
+        """EMA of prices[1:] starting from first, with a recursive filter.
+        lfilter runs alpha * x + (1 - alpha) * y, the same operations as
+        _calculate_ema(), so the values are identical.
+        """
+        out, _ = lfilter([alpha], [1.0, -(1 - alpha)], prices[1:],
+                         zi=[(1 - alpha) * first])
+        return out
+
+    def _ema_values(self, prices):
+        """EMA short / long, MACD and signal line of every tick."""
+        n = len(prices)
+        alpha_short = 2 / (self.static["short_window"] + 1.0)
+        alpha_long = 2 / (self.static["long_window"] + 1.0)
+        alpha_signal = 2 / (self.static["signal_window"] + 1.0)
+        emashort_values = np.empty(n)
+        emalong_values = np.empty(n)
+        macd_values = np.empty(n)
+        signal_line_values = np.empty(n)
+        emashort_values[0] = emalong_values[0] = prices[0]
+        macd_values[0] = signal_line_values[0] = 0.0
+
+        lfilter = _load_lfilter()
+        if lfilter is not None:
+            emashort_values[1:] = self._ema_batch(lfilter, prices, alpha_short, prices[0])
+            emalong_values[1:] = self._ema_batch(lfilter, prices, alpha_long, prices[0])
+            macd_values[1:] = emashort_values[1:] - emalong_values[1:]
+            # The signal line restarts from MACD after a MACD of exactly 0,
+            # which the filter can not express
+            if n < 3 or not (macd_values[1:-1] == 0).any():
+                if n > 1:
+                    signal_line_values[1] = macd_values[1]
+                    signal_line_values[2:] = self._ema_batch(
+                        lfilter, macd_values[1:], alpha_signal, macd_values[1])
+                return emashort_values, emalong_values, macd_values, signal_line_values
+
+        # EMA is recursive, so run the same float operations as
+        # generate_signals() on plain floats to keep the results identical.
+        price_list = prices.tolist()
+        emashort = emalong = price_list[0]
+        macd = signal_line = 0.0
+        for i in range(1, n):
+            price = price_list[i]
+            emashort = alpha_short * price + (1 - alpha_short) * emashort
+            emalong = alpha_long * price + (1 - alpha_long) * emalong
+            macd_old = macd
+            macd = emashort - emalong
+            if macd_old == 0:
+                signal_line = macd
+            else:
+                signal_line = alpha_signal * macd + (1 - alpha_signal) * signal_line
+            emashort_values[i] = emashort
+            emalong_values[i] = emalong
+            macd_values[i] = macd
+            signal_line_values[i] = signal_line
+        return emashort_values, emalong_values, macd_values, signal_line_values
+
+    def generate_signals_batch(self, prices):
+        prices = np.asarray(prices, dtype=np.float64)
+        n = len(prices)
+        signals = np.zeros(n, dtype=np.int8)
+        if n == 0:
+            return signals, {}
+        windows = (self.static["short_window"], self.static["long_window"],
+                   self.static["signal_window"])
+        emashort_values, emalong_values, macd_values, signal_line_values = \
+            self._indicator(prices, "macd", windows, lambda: self._ema_values(prices))
+
+        macd_old = macd_values[:-1]
+        signal_line_old = signal_line_values[:-1]
+        buy = (macd_old <= signal_line_old) & (macd_values[1:] > signal_line_values[1:])
+        sell = ~buy & (macd_old >= signal_line_old) & (macd_values[1:] < signal_line_values[1:])
+        signals[1:][buy] = SIGNAL_CODES["Buy"]
+        signals[1:][sell] = SIGNAL_CODES["Sell"]
+
+        # 逐次処理と同じ最終状態を残す
+        self._prices = prices[-1].item()
+        self._emashort = emashort_values[-1].item()
+        self._emalong = emalong_values[-1].item()
+        self._macd_old = macd_values[-2].item() if n > 1 else None
+        self._macd = macd_values[-1].item()
+        self._signal_line_old = signal_line_values[-2].item() if n > 1 else None
+        self._signal_line = signal_line_values[-1].item()
+        return signals, {
+            "emashort_values": emashort_values,
+            "emalong_values": emalong_values,
+            "macd_values": macd_values,
+            "signal_line_values": signal_line_values,
+        }
+
 class BollingerBandsSG(SignalGenerator):
     @property
     def default_param(self):
@@ -181,6 +738,9 @@ class BollingerBandsSG(SignalGenerator):
         if len(self.dynamic['prices']) < self.static['window_size']:
             return "Hold"  # データが十分にない場合はシグナルを出さない
 
+        return self._judge_signal(price)
+
+    def _judge_signal(self, price):
         # シグナルを判定
         #print(self.static.keys(), "reverse" in self.static.keys(), os.environ["reverse"] == "1", str(self.static["reverse"]))
         if price > self.dynamic['upper_band']:
@@ -194,4 +754,137 @@ class BollingerBandsSG(SignalGenerator):
             else:
                 return "Buy"   # 下限を割ったら買いシグナル
         else:
-            return "Hold"  # それ以外は保持
\ No newline at end of file
+            return "Hold"  # それ以外は保持
+
+    def generate_signals_batch(self, prices):
+        prices = np.asarray(prices, dtype=np.float64)
+        n = len(prices)
+        window = int(self.static['window_size'])
+        num_std_dev = self.static['num_std_dev']
+        # generate_signals() keeps the truncated integer prices
+        int_prices = prices.astype(np.int64)
+
+        upper_band = np.full(n, np.nan)
+        lower_band = np.full(n, np.nan)
+        # ウィンドウが埋まるまでは、それまでの全価格で計算
+        warmup = min(window - 1, n)
+        expanding = None
+        if self.rolling_stats is not None and warmup > 1:
+            expanding = self.rolling_stats.expanding(prices, warmup, integer=True)
+        if expanding is None and warmup > 1:
+            def compute():
+                return (np.array([np.mean(int_prices[:i + 1]) for i in range(warmup)]),
+                        np.array([np.std(int_prices[:i + 1]) for i in range(warmup)]))
+            expanding = self._indicator(prices, "expanding_mean_std", (warmup,), compute)
+        if expanding is not None:
+            mean, std_dev = expanding
+            upper_band[1:warmup] = (mean + num_std_dev * std_dev)[1:]
+            lower_band[1:warmup] = (mean - num_std_dev * std_dev)[1:]
+        if n >= window and window >= 2:
+            mean, std_dev = self._rolling_mean_std(prices, window, integer=True)
+            upper_band[window - 1:] = mean + num_std_dev * std_dev
+            lower_band[window - 1:] = mean - num_std_dev * std_dev
+
+        signals = np.zeros(n, dtype=np.int8)
+        if n >= window:
+            if "reverse" in self.static.keys() and str(int(self.static["reverse"])) == "1":
+                upper_code, lower_code = SIGNAL_CODES["Buy"], SIGNAL_CODES["Sell"]
+            else:
+                upper_code, lower_code = SIGNAL_CODES["Sell"], SIGNAL_CODES["Buy"]
+            body = slice(window - 1, n)
+            signals[body][prices[body] > upper_band[body]] = upper_code
+            signals[body][prices[body] < lower_band[body]] = lower_code
+
+        # 逐次処理と同じ最終状態を残す
+        if n > 0:
+            self.dynamic['prices'] = int_prices[-window:]
+            last_upper, last_lower = upper_band[-1], lower_band[-1]
+            self.dynamic['upper_band'] = None if np.isnan(last_upper) else last_upper
+            self.dynamic['lower_band'] = None if np.isnan(last_lower) else last_lower
+        return signals, {'upper_band': upper_band, 'lower_band': lower_band}
+
+
+class IncrementalBollingerBandsSG(BollingerBandsSG):
+    """BollingerBandsSG with O(1) work per tick.
+    The window is kept in a fixed size ring buffer together with the running
+    sum and sum of squares of the (integer) prices, so window_size does not
+    affect the cost of a tick. Integer sums are exact, so the bands only
+    differ from BollingerBandsSG in the last bits of the float result.
+    The whole state lives in self.dynamic and can be saved to DynamoDB.
+    """
+
+    def reset_param(self, param):
+        super().reset_param(param)
+        self._load_ring(np.array([], dtype=np.int64))
+
+    def _load_ring(self, ordered_prices):
+        """Rebuild the ring buffer state from prices in time order."""
+        window = int(self.static['window_size'])
+        ordered_prices = np.asarray(ordered_prices, dtype=np.int64)[-window:]
+        ring = np.zeros(window, dtype=np.int64)
+        ring[:len(ordered_prices)] = ordered_prices
+        self.dynamic['prices'] = ring
+        self.dynamic['prices_head'] = len(ordered_prices) % window
+        self.dynamic['prices_len'] = len(ordered_prices)
+        self.dynamic['sum'] = int(ordered_prices.sum())
+        self.dynamic['squared_sum'] = sum(int(p) * int(p) for p in ordered_prices)
+
+    def _check_ring(self):
+        """Make the restored state usable.
+        Arrays read back from DynamoDB are read only, and the state may come
+        from BollingerBandsSG or from a different window_size.
+        """
+        prices = self.dynamic['prices']
+        window = int(self.static['window_size'])
+        if 'prices_head' not in self.dynamic:
+            self._load_ring(prices)
+        elif len(prices) != window:
+            head = self.dynamic['prices_head']
+            length = self.dynamic['prices_len']
+            ordered = np.roll(prices, -head)[len(prices) - length:]
+            self._load_ring(ordered)
+        elif not prices.flags.writeable or prices.dtype != np.int64:
+            self.dynamic['prices'] = np.array(prices, dtype=np.int64)
+
+    def generate_signals(self, price):
+        self._check_ring()
+        dynamic = self.dynamic
+        window = len(dynamic['prices'])
+        head = dynamic['prices_head']
+        new_price = int(price)
+
+        # ウィンドウが埋まっている場合は最も古い価格を差し引く
+        if dynamic['prices_len'] == window:
+            old_price = int(dynamic['prices'][head])
+            dynamic['sum'] -= old_price
+            dynamic['squared_sum'] -= old_price * old_price
+        else:
+            dynamic['prices_len'] += 1
+        dynamic['prices'][head] = new_price
+        dynamic['prices_head'] = (head + 1) % window
+        dynamic['sum'] += new_price
+        dynamic['squared_sum'] += new_price * new_price
+
+        n = dynamic['prices_len']
+        if n < 2:
+            dynamic['upper_band'] = None
+            dynamic['lower_band'] = None
+            return "Hold"
+
+        mean = dynamic['sum'] / n
+        # n^2 * variance を整数で計算してから割る
+        variance = (n * dynamic['squared_sum'] - dynamic['sum'] ** 2) / (n * n)
+        std_dev = math.sqrt(max(variance, 0.0))
+        dynamic['upper_band'] = mean + self.static['num_std_dev'] * std_dev
+        dynamic['lower_band'] = mean - self.static['num_std_dev'] * std_dev
+
+        if n < self.static['window_size']:
+            return "Hold"
+        return self._judge_signal(price)
+
+    def generate_signals_batch(self, prices):
+        result = super().generate_signals_batch(prices)
+        # BollingerBandsSG leaves the window in time order
+        if len(prices) > 0:
+            self._load_ring(self.dynamic['prices'])
+        return result
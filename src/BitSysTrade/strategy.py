@@ -1,8 +1,48 @@
 import numpy as np
-from tqdm import tqdm
 from typing import Literal
+from contextlib import contextmanager
 import os
 
+from .signal_generator import SIGNAL_NAMES
+from .utils.progress import ProgressReporter
+
+
+class TradeLimiterConfig():
+    """Settings of Strategy.trade_limiter().
+
+    Args:
+        trade_enable (bool): Execute trades at all.
+        order_num_max (int): Trades are executed only while the number of
+            open orders is below this.
+    """
+
+    def __init__(self, trade_enable: bool = True, order_num_max: int = 99999):
+        self.trade_enable = trade_enable
+        self.order_num_max = order_num_max
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """Load TRADE_ENABLE and ORDER_NUM_MAX (AWS env).
+        TRADE_ENABLE is required, so that a misconfigured function fails
+        instead of trading. A missing ORDER_NUM_MAX keeps the default.
+
+        Raises:
+            KeyError: TRADE_ENABLE is not set
+        """
+        if environ is None:
+            environ = os.environ
+        config = cls(trade_enable=str(environ["TRADE_ENABLE"]) == "1")
+        if "ORDER_NUM_MAX" in environ:
+            config.order_num_max = int(float(environ["ORDER_NUM_MAX"]))
+        return config
+
+    def allows(self, open_order_count: int) -> bool:
+        return self.trade_enable and self.order_num_max > open_order_count
+
+    def __repr__(self):
+        return (f"TradeLimiterConfig(trade_enable={self.trade_enable}, "
+                f"order_num_max={self.order_num_max})")
+
 
 class Strategy():
     """Trading Strategy
@@ -11,12 +51,16 @@ class Strategy():
         ABC (_type_): _description_
     """
 
-    def __init__(self, market, signal_generator, trade_executor):
+    def __init__(self, market, signal_generator, trade_executor,
+                 limiter: TradeLimiterConfig = None):
         self.market = market
         self.signal_generator = signal_generator
         self.trade_executor = trade_executor
         self.trade_executor.set_market(self.market)
         self.dynamic = {}
+        if limiter is None:
+            limiter = TradeLimiterConfig()
+        self.limiter = limiter
 
     @property
     def default_param(self) -> dict:
@@ -75,12 +119,67 @@ class Strategy():
         self.trade_executor.execute_trade(price, signal)
 
     def trade_limiter(self) -> bool:
-        orders = self.market.get_open_orders()
-        ret = (os.environ["TRADE_ENABLE"] == "1"
-               and int(os.environ["ORDER_NUM_MAX"]) > len(orders))
-        return ret
+        return self.limiter.allows(self.market.open_order_count())
 
 class BacktestStrategy(Strategy):
+    # Ticks between two progress updates of the loop engine
+    PROGRESS_CHUNK = 100000
+
+    def __init__(self, market, signal_generator, trade_executor,
+                 engine: Literal["loop", "vectorized", "compiled"] = "loop",
+                 limiter: TradeLimiterConfig = None,
+                 progress: ProgressReporter = None):
+        """
+        Args:
+            engine (str): "loop" runs every tick in Python. "vectorized"
+                generates all signals with generate_signals_batch() and only
+                visits ticks with a signal. It falls back to "loop" when the
+                signal generator has no batch path, the trade executor
+                may place limit orders or a hold_params key is not one of
+                the batch indicator arrays. With the batch path, hold_params
+                are float arrays with NaN where the indicator is undefined.
+                "compiled" is "vectorized", but runs with record="none" on a
+                spot market also fill the orders in the compiled market
+                kernel when the trade executor supports it
+                (TradeExecutor.market_kernel_params()). See compiled.py.
+            limiter (TradeLimiterConfig): Trade limiter settings. Backtests
+                never read the environment variables.
+            progress (ProgressReporter): Progress hook, updated every
+                PROGRESS_CHUNK ticks. Reports nothing by default.
+        """
+        super().__init__(market, signal_generator, trade_executor, limiter)
+        self.engine = engine
+        if progress is None:
+            progress = ProgressReporter()
+        self.progress = progress
+
+    @property
+    def record(self) -> str:
+        """History recording level of the market ("none", "summary" or "full").
+        hold_params are only collected with "full".
+        """
+        return self.market.record
+
+    @record.setter
+    def record(self, level: Literal["none", "summary", "full"]):
+        self.market.record = level
+
+    @contextmanager
+    def recording(self, level: Literal["none", "summary", "full"]):
+        """Temporarily change the recording level.
+
+        Usage:
+            with strategy.recording("none"):
+                strategy.reset_all(param, start_cash)
+                portfolio = strategy.backtest()
+        """
+        level_org = self.record
+        self.record = level
+        try:
+            yield self
+        finally:
+            self.record = level_org
+
     def backtest(self, hold_params=[], axis=None):
         """Running a back test
         Backtest flow is
@@ -96,29 +195,104 @@ class BacktestStrategy(Strategy):
         self.market.set_current_index(0)
         self.hold_params = {}
         self.axis = axis
+        if self.record != "full":
+            hold_params = []
         for p in hold_params:
             self.hold_params[p] = []
-        if not "TRADE_ENABLE" in os.environ.keys():
-            os.environ["TRADE_ENABLE"] = "1"
-        if not "ORDER_NUM_MAX" in os.environ.keys():
-            os.environ["ORDER_NUM_MAX"] = "99999"
-
-        for i in tqdm(range(len(self.market))):
-            self.dynamic["count"] += 1
-            self.market.set_current_index(self.dynamic["count"] - 1)
-            price = self.market.get_current_price()
-            signal = self.generate_signals(price)
-            if self.trade_limiter():
-                self.execute_trade(price, signal)
-            self.market.check_order()
-            self.market.save_history(price)
-            for p in hold_params:
-                if p in self.signal_generator.dynamic.keys():
-                    self.hold_params[p].append(self.signal_generator.dynamic[p])
-                elif p in self.trade_executor.dynamic.keys():
-                    self.hold_params[p].append(self.trade_executor.dynamic[p])
+
+        if (self.engine in ("vectorized", "compiled")
+                and self.trade_executor.market_order_only):
+            batch = self.signal_generator.generate_signals_batch(
+                np.asarray(self.market.data))
+            if batch is not None:
+                signals, states = batch
+                if all(p in states for p in hold_params):
+                    for p in hold_params:
+                        self.hold_params[p] = states[p]
+                    if not (self.engine == "compiled" and self._backtest_kernel(signals)):
+                        self._backtest_batch(signals)
+                    return self.market.portfolio
+                # Indicator not available as array. Restart from a clean state.
+                self.signal_generator.reset_param(self.signal_generator.static)
+
+        # Same as trade_limiter(), resolved once per run
+        order_num_max = self.limiter.order_num_max if self.limiter.trade_enable else 0
+        n = len(self.market)
+        # The progress hook is called per chunk, not per tick
+        for start in range(0, n, self.PROGRESS_CHUNK):
+            stop = min(start + self.PROGRESS_CHUNK, n)
+            for i in range(start, stop):
+                self.dynamic["count"] += 1
+                self.market.set_current_index(self.dynamic["count"] - 1)
+                price = self.market.get_current_price()
+                signal = self.generate_signals(price)
+                if order_num_max > self.market.open_order_count():
+                    self.execute_trade(price, signal)
+                self.market.check_order()
+                self.market.save_history(price)
+                if hold_params:
+                    self._save_hold_params(hold_params)
+            self.progress.update(stop, n, "ticks")
         return self.market.portfolio
 
+    def _save_hold_params(self, hold_params):
+        for p in hold_params:
+            if p in self.signal_generator.dynamic.keys():
+                self.hold_params[p].append(self.signal_generator.dynamic[p])
+            elif p in self.trade_executor.dynamic.keys():
+                self.hold_params[p].append(self.trade_executor.dynamic[p])
+
+    def _backtest_batch(self, signals: np.ndarray):
+        """Simulate fills only on ticks that have a signal.
+        Without limit orders the portfolio can only change on those ticks, so
+        the history between them is saved with array operations.
+        """
+        # Open orders never exist here, so the limiter result is constant
+        trade_enable = self.trade_limiter()
+        last = 0
+        if trade_enable:
+            for i in np.flatnonzero(signals):
+                self.market.save_history_batch(last, i)
+                self.market.set_current_index(i)
+                self.execute_trade(self.market.get_current_price(),
+                                   SIGNAL_NAMES[int(signals[i])])
+                last = i
+        self.market.save_history_batch(last, len(self.market))
+        self.market.set_current_index(max(len(self.market) - 1, 0))
+        self.dynamic["count"] = len(self.market)
+
+    def _backtest_kernel(self, signals: np.ndarray) -> bool:
+        """Fill the orders in the compiled market kernel.
+        Only the final portfolio is produced, so this needs record="none".
+
+        Returns:
+            bool: False if the kernel can not simulate this run
+        """
+        market = self.market
+        kernel_params = self.trade_executor.market_kernel_params()
+        if (kernel_params is None or market.is_fx or self.record != "none"
+                or len(market) == 0):
+            return False
+        # Numba is imported only when this engine is used
+        from .compiled import run_market_kernel
+
+        if not self.trade_limiter():
+            signals = np.zeros_like(signals)
+        quantity, buy_count_limit, buy_count = kernel_params
+        portfolio = market.portfolio
+        cash, position, trade_count, buy_count, ok, ng = run_market_kernel(
+            np.asarray(market.data), signals, portfolio['cash'],
+            portfolio['position'], market.fee_rate, quantity,
+            buy_count_limit, buy_count)
+        portfolio['cash'] = cash
+        portfolio['position'] = position
+        portfolio['trade_count'] += trade_count
+        self.trade_executor.set_market_kernel_result(buy_count, ok, ng)
+        market.set_current_index(len(market) - 1)
+        market.save_history(market.get_current_price())
+        self.dynamic["count"] = len(market)
+        return True
+
     def reset_all(self, param: dict, start_cash: int, start_coin: float = 0):
         """Reset parameter and portfolio
         Must be called before the backtest is executed.
@@ -141,30 +315,16 @@ class BacktestStrategy(Strategy):
             save_graph: bool = True, width=1200, height=800):
         graph_obj = None
 
-        buy_signals = [
-            signal[1] for signal in self.backtest_history["signals"]["Buy"]
-        ]
-        buy_signals_pos = [
-            signal[0] for signal in self.backtest_history["signals"]["Buy"]
-        ]
-        sell_signals = [
-            signal[1] for signal in self.backtest_history["signals"]["Sell"]
-        ]
-        sell_signals_pos = [
-            signal[0] for signal in self.backtest_history["signals"]["Sell"]
-        ]
-        exe_buy_signals = [
-            signal[1] for signal in self.backtest_history["execute_signals"]["Buy"]
-        ]
-        exe_buy_signals_pos = [
-            signal[0] for signal in self.backtest_history["execute_signals"]["Buy"]
-        ]
-        exe_sell_signals = [
-            signal[1] for signal in self.backtest_history["execute_signals"]["Sell"]
-        ]
-        exe_sell_signals_pos = [
-            signal[0] for signal in self.backtest_history["execute_signals"]["Sell"]
-        ]
+        signals = self.backtest_history["signals"]
+        execute_signals = self.backtest_history["execute_signals"]
+        buy_signals = signals["Buy"].price
+        buy_signals_pos = signals["Buy"].index
+        sell_signals = signals["Sell"].price
+        sell_signals_pos = signals["Sell"].index
+        exe_buy_signals = execute_signals["Buy"].price
+        exe_buy_signals_pos = execute_signals["Buy"].index
+        exe_sell_signals = execute_signals["Sell"].price
+        exe_sell_signals_pos = execute_signals["Sell"].index
         dates = self.market.dates
         price_data = self.market.data
         value_hist = self.backtest_history["total_value_hist"]
@@ -308,7 +468,7 @@ class BacktestStrategy(Strategy):
                 i = 0
                 for k, v in self.hold_params.items():
                     if self.axis is not None and self.axis[i] == "Additional":
-                        tmp_v = [x for x in v if x is not None]
+                        tmp_v = [x for x in v if x is not None and not np.isnan(x)]
                         if additional_max is None:
                             additional_max = max(tmp_v)
                         else:
@@ -380,27 +540,27 @@ class BacktestStrategy(Strategy):
 
             if len(buy_signals_pos) != 0:
                 # 買いシグナルのマーカー
-                buy_signals_pos_dates = [dates[i] for i in buy_signals_pos]
+                buy_signals_pos_dates = np.asarray(dates)[buy_signals_pos]
                 graphs.append(hv.Scatter((buy_signals_pos_dates, buy_signals), label="buy_signals").opts(
                     marker='circle', size=20, line_color='blue',
                     fill_color=None, alpha=0.5))
 
             if len(exe_buy_signals_pos) != 0:
                 # 実行された買いシグナルのマーカー
-                exe_buy_signals_pos_dates = [dates[i] for i in exe_buy_signals_pos]
+                exe_buy_signals_pos_dates = np.asarray(dates)[exe_buy_signals_pos]
                 graphs.append(hv.Scatter((exe_buy_signals_pos_dates, exe_buy_signals), label="exe_buy_signals").opts(
                     marker='circle', size=20, line_color='gray', color='blue', alpha=0.5))
 
             if len(sell_signals_pos) != 0:
                 # 売りシグナルのマーカー
-                sell_signals_pos_dates = [dates[i] for i in sell_signals_pos]
+                sell_signals_pos_dates = np.asarray(dates)[sell_signals_pos]
                 graphs.append(hv.Scatter((sell_signals_pos_dates, sell_signals), label="sell_signals").opts(
                     marker='circle', size=20, line_color='red',
                     fill_color=None, alpha=0.5))
 
             if len(exe_sell_signals_pos) != 0:
                 # 実行された売りシグナルのマーカー
-                exe_sell_signals_pos_dates = [dates[i] for i in exe_sell_signals_pos]
+                exe_sell_signals_pos_dates = np.asarray(dates)[exe_sell_signals_pos]
                 graphs.append(hv.Scatter((exe_sell_signals_pos_dates, exe_sell_signals), label="exe_sell_signals").opts(
                     marker='circle', size=20, line_color='gray', color='red', alpha=0.5))
 
@@ -1,10 +1,21 @@
 import numpy as np
-from tqdm import tqdm
 from abc import ABC, abstractmethod
 from typing import Literal
 import os
 
 class TradeExecutor(ABC):
+    # True if the executor only places market orders. Such executors can be
+    # driven by the vectorized backtest engine, which skips ticks without signal.
+    market_order_only = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # The flag describes execute_trade() of the class that sets it. A subclass
+        # overriding execute_trade() may place limit orders, so it runs on the
+        # loop engine unless it sets the flag again itself.
+        if "execute_trade" in cls.__dict__ and "market_order_only" not in cls.__dict__:
+            cls.market_order_only = False
+
     def __init__(self):
         self.dynamic = {}
         self.static = self.default_param
@@ -23,6 +34,20 @@ class TradeExecutor(ABC):
     def set_market(self, market):
         self.market = market
 
+    def market_kernel_params(self):
+        """Parameters of the compiled market kernel (compiled.run_market_kernel).
+        Override in executors the kernel can simulate.
+
+        Returns:
+            tuple | None: (quantity, buy_count_limit, buy_count), or None if
+                the kernel can not simulate this executor.
+        """
+        return None
+
+    def set_market_kernel_result(self, buy_count, ok, ng):
+        """Store the state after a compiled market kernel run."""
+        pass
+
     def save_trade_count(self, result):
         """Save count of result trade to self.dynamic
 
@@ -39,6 +64,8 @@ class TradeExecutor(ABC):
             self.dynamic['trade_count_ng'] += 1
 
 class NormalExecutor(TradeExecutor):
+    market_order_only = True
+
     def reset_param(self, param):
         super().reset_param(param)
 
@@ -53,7 +80,14 @@ class NormalExecutor(TradeExecutor):
             self.market.place_market_order(signal,
                                            self.static["one_order_quantity"])
 
+    def market_kernel_params(self):
+        if type(self).execute_trade is not NormalExecutor.execute_trade:
+            return None
+        return self.static["one_order_quantity"], -1, 0
+
 class SpreadOrderExecutor(TradeExecutor):
+    market_order_only = True
+
     def reset_param(self, param):
         super().reset_param(param)
         self.dynamic['buy_count'] = 0
@@ -77,4 +111,17 @@ class SpreadOrderExecutor(TradeExecutor):
                                            self.static["one_order_quantity"])
             if result:
                 self.dynamic['buy_count'] -= 1
-            self.save_trade_count(result)
\ No newline at end of file
+            self.save_trade_count(result)
+
+    def market_kernel_params(self):
+        if type(self).execute_trade is not SpreadOrderExecutor.execute_trade:
+            return None
+        return (self.static["one_order_quantity"],
+                int(self.static['buy_count_limit']), self.dynamic['buy_count'])
+
+    def set_market_kernel_result(self, buy_count, ok, ng):
+        self.dynamic['buy_count'] = buy_count
+        if ok + ng > 0:
+            # Same keys as save_trade_count()
+            self.dynamic['trade_count_ok'] = self.dynamic.get('trade_count_ok', 0) + ok
+            self.dynamic['trade_count_ng'] = self.dynamic.get('trade_count_ng', 0) + ng
@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Least recently used cache bounded by the total size in bytes.
+    Thread safe, so panel callbacks running in parallel can share one instance.
+
+    Args:
+        max_bytes (int): upper limit of the sum of the item sizes
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value and mark it as recently used."""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, nbytes: int):
+        """Add a value. Least recently used values are evicted to stay
+        within max_bytes. A value larger than max_bytes is not cached.
+        """
+        with self._lock:
+            if key in self._items:
+                self.current_bytes -= self._items.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._items[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._items.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def invalidate(self, match=None) -> int:
+        """Remove values. match(key) selects the keys to remove, all if None.
+
+        Returns:
+            int: number of removed values
+        """
+        with self._lock:
+            keys = [k for k in self._items if match is None or match(k)]
+            for k in keys:
+                self.current_bytes -= self._items.pop(k)[1]
+            return len(keys)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "items": len(self._items),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -1,8 +1,155 @@
 import boto3
 import base64
 import math
+import uuid
+import struct
+import zlib
 import numpy as np
 
+# The whole item except the partition key is saved in this Binary attribute
+STATE_ATTRIBUTE = "state"
+# Blob header: magic, codec version, compression (0: none, 1: zlib)
+STATE_MAGIC = b"BST"
+STATE_VERSION = 1
+_COMPRESS_MIN_BYTES = 256
+
+# Value tags of the binary codec
+_NIL, _FALSE, _TRUE, _INT, _BIGINT, _FLOAT, _STR, _LIST, _DICT, _ARRAY = range(10)
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+
+def _encode_value(value, out):
+    if value is None:
+        out.append(_NIL)
+    elif isinstance(value, (bool, np.bool_)):
+        out.append(_TRUE if value else _FALSE)
+    elif isinstance(value, (int, np.integer)):
+        value = int(value)
+        if -2**63 <= value < 2**63:
+            out.append(_INT)
+            out += _I64.pack(value)
+        else:
+            # BollingerBands の二乗和などは int64 を超えることがある
+            data = value.to_bytes((value.bit_length() + 8) // 8, "little", signed=True)
+            out.append(_BIGINT)
+            out += _U32.pack(len(data)) + data
+    elif isinstance(value, (float, np.floating)):
+        out.append(_FLOAT)
+        out += _F64.pack(value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        out.append(_STR)
+        out += _U32.pack(len(data)) + data
+    elif isinstance(value, np.ndarray) and value.dtype.kind in "biuf":
+        dtype = value.dtype.newbyteorder("<").str.encode("ascii")
+        out.append(_ARRAY)
+        out += bytes([len(dtype)]) + dtype + bytes([value.ndim])
+        out += struct.pack(f"<{value.ndim}Q", *value.shape)
+        out += np.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<")).tobytes()
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        out.append(_LIST)
+        out += _U32.pack(len(value))
+        for item in value:
+            _encode_value(item, out)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        out += _U32.pack(len(value))
+        for k, v in value.items():
+            _encode_value(str(k), out)
+            _encode_value(v, out)
+    else:
+        raise TypeError(f"Type {type(value)} is not supported")
+
+
+def _decode_value(buf, pos):
+    tag = buf[pos]
+    pos += 1
+    if tag == _NIL:
+        return None, pos
+    elif tag == _FALSE:
+        return False, pos
+    elif tag == _TRUE:
+        return True, pos
+    elif tag == _INT:
+        return _I64.unpack_from(buf, pos)[0], pos + 8
+    elif tag == _BIGINT:
+        size = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        return int.from_bytes(buf[pos:pos + size], "little", signed=True), pos + size
+    elif tag == _FLOAT:
+        return _F64.unpack_from(buf, pos)[0], pos + 8
+    elif tag == _STR:
+        size = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        return bytes(buf[pos:pos + size]).decode("utf-8"), pos + size
+    elif tag == _ARRAY:
+        dtype = np.dtype(bytes(buf[pos + 1:pos + 1 + buf[pos]]).decode("ascii"))
+        pos += 1 + buf[pos]
+        ndim = buf[pos]
+        shape = struct.unpack_from(f"<{ndim}Q", buf, pos + 1)
+        pos += 1 + 8 * ndim
+        count = math.prod(shape)
+        array = np.frombuffer(buf, dtype=dtype, count=count, offset=pos).reshape(shape)
+        return array, pos + count * dtype.itemsize
+    elif tag == _LIST:
+        size = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        items = []
+        for _ in range(size):
+            item, pos = _decode_value(buf, pos)
+            items.append(item)
+        return items, pos
+    elif tag == _DICT:
+        size = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        items = {}
+        for _ in range(size):
+            k, pos = _decode_value(buf, pos)
+            items[k], pos = _decode_value(buf, pos)
+        return items, pos
+    else:
+        raise ValueError(f"Unknown tag {tag} in state blob")
+
+
+def encode_state(data: dict) -> bytes:
+    """Pack a dict into one versioned binary blob.
+    Arrays are stored as raw little endian buffers tagged with the dtype,
+    scalars with fixed size tags. The blob is zlib compressed when it helps.
+    """
+    out = bytearray()
+    _encode_value(data, out)
+    compression = 0
+    if len(out) >= _COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(out, 1)
+        if len(compressed) < len(out):
+            out, compression = compressed, 1
+    return STATE_MAGIC + bytes([STATE_VERSION, compression]) + bytes(out)
+
+
+def decode_state(blob) -> dict:
+    """Unpack a blob of encode_state(). Arrays are writable."""
+    blob = bytes(blob)
+    if blob[:len(STATE_MAGIC)] != STATE_MAGIC:
+        raise ValueError("Not a state blob")
+    version, compression = blob[len(STATE_MAGIC)], blob[len(STATE_MAGIC) + 1]
+    if version > STATE_VERSION:
+        raise ValueError(f"State blob version {version} is not supported")
+    payload = blob[len(STATE_MAGIC) + 2:]
+    if compression == 1:
+        payload = zlib.decompress(payload)
+    # bytearray makes the decoded arrays writable
+    data, _ = _decode_value(bytearray(payload), 0)
+    return data
+
+
+def is_state_blob(value) -> bool:
+    """True if value is a Binary attribute written by encode_state()."""
+    value = getattr(value, "value", value)
+    return isinstance(value, (bytes, bytearray)) and value[:len(STATE_MAGIC)] == STATE_MAGIC
+
+
 def convert_numpy_array_to_dynamodb(np_array, chunk_size_kb=400):
     # Numpy配列をバイト列に変換
     array_bytes = np_array.tobytes()
@@ -23,7 +170,10 @@ def convert_numpy_array_to_dynamodb(np_array, chunk_size_kb=400):
 
 def revert_numpy_array_from_dynamodb(data, dtype):
     # パートを結合
-    combined_base64 = b''.join([data[str(i)].value for i in range(len(data))])
+    # Lambda の旧形式は文字列、こちらの旧形式は Binary で保存されている
+    combined_base64 = b''.join([chunk.encode('utf-8') if isinstance(chunk, str)
+                                else _binary(chunk)
+                                for chunk in (data[str(i)] for i in range(len(data)))])
 
     # Base64デコード
     array_bytes = base64.b64decode(combined_base64)
@@ -83,16 +233,17 @@ def revert_from_dynamodb(data):
 
 def save_to_dynamodb(table: object, item: dict, partition_key: str):
     """save to dynamoDB
+    Everything except the partition key is saved as one binary blob
+    (encode_state()) in the STATE_ATTRIBUTE attribute.
 
     Args:
         table (object): DynamoDB table
         item (dict): save data
         partition_key (str): partition key of yuor table
     """
-    item_converted = {k: convert_for_dynamodb(v) for k, v in item.items()}
-    item_converted[partition_key] = item[partition_key]
-    
-    table.put_item(Item=item_converted)
+    state = {k: v for k, v in item.items() if k != partition_key}
+    table.put_item(Item={partition_key: item[partition_key],
+                         STATE_ATTRIBUTE: encode_state(state)})
 
 def read_from_dynamodb(table: object, key_value, partition_key: str) -> dict:
     """read from dynamoDB
@@ -109,10 +260,253 @@ def read_from_dynamodb(table: object, key_value, partition_key: str) -> dict:
     response = table.get_item(Key=key)
     item = response.get('Item')
     if item:
-        return {k: v if k == partition_key else revert_from_dynamodb(v) for k, v in item.items()}
+        return _revert_item(item, partition_key)
     else:
         return None
 
+
+def _revert_item(item, partition_key):
+    if is_state_blob(item.get(STATE_ATTRIBUTE)):
+        data = decode_state(getattr(item[STATE_ATTRIBUTE], "value", item[STATE_ATTRIBUTE]))
+        data[partition_key] = item[partition_key]
+        return data
+    # Items saved by convert_for_dynamodb() before the binary codec
+    return {k: v if k == partition_key else revert_from_dynamodb(v) for k, v in item.items()}
+
+
+# Longest append / number of replaced values written as a delta
+_DELTA_MAX_VALUES = 16
+# Heads without a version were written before versions or by save_to_dynamodb()
+_VERSION_CONDITION = "attribute_not_exists(#v) OR #v = :v"
+
+
+def _array_delta(old, new):
+    """Change from old to new as a small op, or None if there is none.
+    ["s", indices, values]: values replaced in place (ring buffers)
+    ["a", drop, values]: drop values from the head, then append (windows)
+    """
+    if old is None or old.dtype != new.dtype:
+        return None
+    if old.shape == new.shape and np.array_equal(old, new):
+        return ["s", np.array([], dtype=np.int64), new[:0]]
+    if old.ndim != 1 or new.ndim != 1:
+        return None
+    if len(old) == len(new):
+        changed = np.flatnonzero(old != new)
+        if len(changed) <= _DELTA_MAX_VALUES:
+            return ["s", changed, new[changed]]
+    for append in range(1, min(_DELTA_MAX_VALUES, len(new)) + 1):
+        drop = len(old) + append - len(new)
+        if 0 <= drop <= len(old) and np.array_equal(old[drop:], new[:len(new) - append]):
+            return ["a", drop, new[len(new) - append:]]
+    return None
+
+
+def _apply_array_delta(array, op):
+    if op[0] == "s":
+        array = array.copy()
+        array[op[1]] = op[2]
+        return array
+    return np.concatenate([array[op[1]:], op[2]])
+
+
+class DynamoDBStateStore:
+    """State of one strategy saved as a snapshot plus a log of deltas.
+
+    Items (partition key only):
+        key: head with gen, snapshot (token of the snapshot item), scalars
+            (blob of the values that are not arrays) and deltas (list of
+            blobs with the array changes).
+        key#snapshot#<token>: full state of generation gen. Every
+            compaction writes a new item with a random token.
+
+    save() writes the changes of the arrays since the last save as one
+    delta with a single UpdateItem on the head. 1-D arrays that got values
+    appended to a sliding window or a few values replaced (ring buffer)
+    fit in a delta, so the write size does not grow with the window size.
+    When the head would exceed max_head_bytes, or an array changed
+    otherwise, the state is compacted into a new snapshot item and the
+    head switches to it. The previous snapshot is deleted after the switch.
+    Snapshots are never overwritten, so two containers compacting at the
+    same time can not mix their states: the head write of one of them
+    fails and its snapshot is deleted. A failed compaction leaves the
+    previous generation readable. Deleting needs dynamodb:DeleteItem; if
+    it fails, the old snapshot is only left behind.
+
+    The head has a version that every save increments with a conditional
+    write. After a successful load() or save() the caller's state is the
+    saved one (is_current), so a warm Lambda container can skip load().
+    A write that fails, e.g. because another container saved in between,
+    invalidates the store and the next call has to load() again.
+
+    Heads written by save_to_dynamodb() are read as well and replaced at
+    the next save.
+
+    Args:
+        table (object): DynamoDB table
+        key (str): partition key value of the head
+        partition_key (str): partition key of the table
+        max_head_bytes (int): size budget of the deltas and scalars in the
+            head. 1 KB keeps an UpdateItem within one write unit.
+    """
+
+    def __init__(self, table: object, key: str, partition_key: str = "id",
+                 max_head_bytes: int = 900):
+        self.table = table
+        self.key = key
+        self.partition_key = partition_key
+        self.max_head_bytes = max_head_bytes
+        self._gen = None
+        self._version = None
+        self._arrays = {}
+        self._log_bytes = 0
+        self._snapshot = None
+
+    @property
+    def is_current(self) -> bool:
+        """True while the last load() / save() state is the saved one."""
+        return self._version is not None
+
+    def invalidate(self):
+        """Forget the saved state. The next save() compacts."""
+        self._gen = None
+        self._version = None
+        self._arrays = {}
+        self._log_bytes = 0
+        self._snapshot = None
+
+    def _snapshot_key(self, head):
+        if "snapshot" in head:
+            return f"{self.key}#snapshot#{head['snapshot']}"
+        # Heads written before the snapshots had tokens used two slots
+        return f"{self.key}#snapshot{int(head['gen']) % 2}"
+
+    def _delete(self, key):
+        try:
+            self.table.delete_item(Key={self.partition_key: key})
+        except Exception as e:
+            print(f"Snapshot {key} was not deleted: {e!r}")
+
+    def _get(self, key):
+        response = self.table.get_item(Key={self.partition_key: key},
+                                       ConsistentRead=True)
+        return response.get("Item")
+
+    def load(self) -> dict:
+        """Read the state. None if nothing is saved.
+
+        Another container may compact between the reads of the head and
+        the snapshot and delete the snapshot. The head is then read again
+        once, since it points to the new snapshot.
+
+        Raises:
+            ValueError: the snapshot of the head is still missing
+        """
+        self.invalidate()
+        for _ in range(2):
+            item = self._get(self.key)
+            if item is None:
+                self._version = 0
+                return None
+            if "gen" not in item:
+                state = _revert_item(item, self.partition_key)
+                state.pop(self.partition_key, None)
+                self._version = 0
+                return state
+
+            gen = int(item["gen"])
+            snapshot_key = self._snapshot_key(item)
+            snapshot = self._get(snapshot_key)
+            if snapshot is not None and int(snapshot["gen"]) == gen:
+                break
+        else:
+            raise ValueError(f"Snapshot of generation {gen} is missing")
+        state = decode_state(_binary(snapshot[STATE_ATTRIBUTE]))
+        arrays = {k: v for k, v in state.items() if isinstance(v, np.ndarray)}
+        log_bytes = 0
+        for delta in item["deltas"]:
+            delta = _binary(delta)
+            log_bytes += len(delta)
+            for k, op in decode_state(delta).items():
+                if op[0] == "r":
+                    arrays.pop(k, None)
+                else:
+                    arrays[k] = _apply_array_delta(arrays[k], op)
+        self._gen = gen
+        self._snapshot = snapshot_key
+        self._version = int(item.get("version", 0))
+        self._arrays = {k: v.copy() for k, v in arrays.items()}
+        self._log_bytes = log_bytes
+        return {**arrays, **decode_state(_binary(item["scalars"]))}
+
+    def save(self, state: dict):
+        """Write the state as a delta of the last load() / save()."""
+        state = {k: v for k, v in state.items() if k != self.partition_key}
+        arrays = {k: v for k, v in state.items() if isinstance(v, np.ndarray)}
+        scalars = encode_state({k: v for k, v in state.items() if k not in arrays})
+        version = self._version or 0
+        try:
+            ops = self._array_ops(arrays) if self._gen is not None else None
+            if ops is not None:
+                delta = encode_state(ops)
+                if self._log_bytes + len(delta) + len(scalars) <= self.max_head_bytes:
+                    self.table.update_item(
+                        Key={self.partition_key: self.key},
+                        UpdateExpression="SET #d = list_append(#d, :d), #s = :s, #v = :n",
+                        ConditionExpression=_VERSION_CONDITION,
+                        ExpressionAttributeNames={"#d": "deltas", "#s": "scalars",
+                                                  "#v": "version"},
+                        ExpressionAttributeValues={":d": [delta], ":s": scalars,
+                                                   ":v": version, ":n": version + 1})
+                    self._log_bytes += len(delta)
+                    self._arrays = {k: v.copy() for k, v in arrays.items()}
+                    self._version = version + 1
+                    return
+            self._compact(state, arrays, scalars, version)
+        except Exception:
+            # The saved state is unknown, e.g. another container wrote it
+            self.invalidate()
+            raise
+
+    def _array_ops(self, arrays):
+        ops = {k: ["r"] for k in self._arrays if k not in arrays}
+        for k, new in arrays.items():
+            op = _array_delta(self._arrays.get(k), new)
+            if op is None:
+                return None
+            if op[0] != "s" or len(op[1]) > 0:
+                ops[k] = op
+        return ops
+
+    def _compact(self, state, arrays, scalars, version):
+        gen = 0 if self._gen is None else self._gen + 1
+        head = {self.partition_key: self.key, "gen": gen, "snapshot": uuid.uuid4().hex,
+                "version": version + 1, "scalars": scalars, "deltas": []}
+        snapshot_key = self._snapshot_key(head)
+        self.table.put_item(Item={self.partition_key: snapshot_key, "gen": gen,
+                                  STATE_ATTRIBUTE: encode_state(state)})
+        # Switching the head commits the new generation
+        try:
+            self.table.put_item(Item=head,
+                                ConditionExpression=_VERSION_CONDITION,
+                                ExpressionAttributeNames={"#v": "version"},
+                                ExpressionAttributeValues={":v": version})
+        except Exception:
+            self._delete(snapshot_key)
+            raise
+        if self._snapshot is not None:
+            self._delete(self._snapshot)
+        self._gen = gen
+        self._snapshot = snapshot_key
+        self._version = version + 1
+        self._arrays = {k: v.copy() for k, v in arrays.items()}
+        self._log_bytes = 0
+
+
+def _binary(value):
+    # boto3 returns Binary attributes wrapped in boto3.dynamodb.types.Binary
+    return getattr(value, "value", value)
+
 def get_dynamodb_table(table_name: str, aws_access_key_id: str, aws_secret_access_key: str, region_name: str = 'ap-northeast-1') -> object:
     """get dynamobd table
 
@@ -0,0 +1,49 @@
+import time
+
+
+class ProgressReporter:
+    """Progress / log hook of backtests and backtesters.
+    The default does nothing, so a sweep of many short runs pays no
+    terminal I/O. Subclasses override write().
+
+    update() reports progress and may be dropped by throttling.
+    message() is always delivered (start / best result etc.).
+    """
+
+    def update(self, current: int, total: int, text: str = None):
+        pass
+
+    def message(self, text: str):
+        self.write(text)
+
+    def write(self, text: str):
+        pass
+
+
+class ThrottledProgress(ProgressReporter):
+    """Write progress at most once per interval seconds.
+    The last update (current == total) is always written.
+
+    Args:
+        interval (float): minimum seconds between two updates
+        write (callable): output function. Defaults to print.
+    """
+
+    def __init__(self, interval: float = 1.0, write=None):
+        self.interval = interval
+        self._write = print if write is None else write
+        self._last = None
+
+    def update(self, current: int, total: int, text: str = None):
+        now = time.monotonic()
+        if (current < total and self._last is not None
+                and now - self._last < self.interval):
+            return
+        self._last = now
+        line = f"[{current}/{total}]"
+        if text is not None:
+            line += f" {text}"
+        self.write(line)
+
+    def write(self, text: str):
+        self._write(text)
@@ -0,0 +1,32 @@
+import sys
+sys.path.append(".")
+sys.path.append("app/aws_build")
+import pytest
+from replay_lambda import FakeDynamoDBTable
+
+# Environment variables of the Lambda function in the handler tests
+LAMBDA_ENV = {
+    "API_KEY": "key",
+    "API_SECRET": "secret",
+    "TABLE_NAME": "table",
+    "PARAMS_KEY": "params",
+    "TRADE_ENABLE": "1",
+    "window_size": "20",
+    "num_std_dev": "1.0",
+    "reverse": "0",
+    "buy_count_limit": "3",
+    "one_order_quantity": "0.01",
+}
+
+
+@pytest.fixture
+def table():
+    """Dict-backed DynamoDB table of the replay harness."""
+    return FakeDynamoDBTable()
+
+
+@pytest.fixture
+def lambda_env(monkeypatch):
+    for k, v in LAMBDA_ENV.items():
+        monkeypatch.setenv(k, v)
+    return LAMBDA_ENV
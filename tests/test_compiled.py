@@ -0,0 +1,78 @@
+import sys
+sys.path.append(".")
+import numpy as np
+import pytest
+from src.BitSysTrade import compiled
+from src.BitSysTrade.compiled import MACDKernelSG, run_signal_kernel
+from src.BitSysTrade.market import BacktestMarket
+from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.signal_generator import MACDSG, BollingerBandsSG
+from src.BitSysTrade.trade_executor import NormalExecutor, SpreadOrderExecutor
+from src.BitSysTrade.data_generater import random_data
+
+price_data = random_data(1e7, 0.001, 5000, seed=555)
+param = {
+    "short_window": 12,
+    "long_window": 26,
+    "signal_window": 9,
+    "window_size": 100,
+    "num_std_dev": 1.5,
+    "reverse": 1,
+    "buy_count_limit": 5,
+    "one_order_quantity": 0.01
+}
+
+
+def test_kernel_signals_match_macd():
+    expected = MACDSG()
+    expected.reset_param(param)
+    expected_signals, _ = expected.generate_signals_batch(price_data)
+
+    sg = MACDKernelSG()
+    sg.reset_param(param)
+    signals, _ = sg.generate_signals_batch(price_data)
+    np.testing.assert_array_equal(signals, expected_signals)
+    assert sg.dynamic["macd_values"] == expected.dynamic["macd_values"]
+
+    # Interpreter path and streaming path
+    state = MACDKernelSG().init_state()
+    py_signals, _ = run_signal_kernel(MACDKernelSG.update, price_data, state,
+                                      sg._params())
+    np.testing.assert_array_equal(py_signals, expected_signals)
+    streaming = MACDKernelSG()
+    streaming.reset_param(param)
+    names = [streaming.generate_signals(p) for p in price_data[:1000]]
+    assert names == [{0: "Hold", 1: "Buy", -1: "Sell"}[int(s)]
+                     for s in expected_signals[:1000]]
+
+
+def test_market_kernel_interpreter_matches_compiled():
+    signals = np.random.default_rng(0).integers(-1, 2, len(price_data)).astype(np.int8)
+    args = (price_data, signals, 1e6, 0.1, 0.001, 0.01, 5, 0)
+    expected = compiled._market_loop(*args)
+    assert compiled.run_market_kernel(*args) == expected
+
+
+@pytest.mark.parametrize("executor_class", [NormalExecutor, SpreadOrderExecutor])
+@pytest.mark.parametrize("sg_class", [MACDKernelSG, BollingerBandsSG])
+def test_compiled_engine_matches_vectorized(sg_class, executor_class):
+    results = []
+    for engine in ["vectorized", "compiled"]:
+        market = BacktestMarket(price_data, fee_rate=0.001, record="none")
+        strategy = BacktestStrategy(market, sg_class(), executor_class(),
+                                    engine=engine)
+        strategy.reset_all(param, 1e6, 0.1)
+        results.append((strategy.backtest(), strategy.trade_executor.dynamic,
+                        strategy.dynamic["count"]))
+    assert results[0][0]["trade_count"] > 0
+    assert results[0] == results[1]
+
+
+def test_compiled_engine_keeps_history_with_full_record():
+    market = BacktestMarket(price_data, fee_rate=0.001)
+    strategy = BacktestStrategy(market, MACDKernelSG(), SpreadOrderExecutor(),
+                                engine="compiled")
+    strategy.reset_all(param, 1e6, 0.1)
+    strategy.backtest()
+    assert not np.isnan(market.hist["total_value_hist"]).any()
+    assert len(market.hist["execute_signals"]["Buy"]) > 0
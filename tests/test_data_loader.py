@@ -0,0 +1,145 @@
+import sys
+sys.path.append(".")
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from src.BitSysTrade.data_loader import (read_prices_from_chash,
+    read_prices_from_sheets, invalidate_price_cache, price_data_cache)
+
+
+def make_workbook(path, months):
+    """Create a price workbook with one sheet per month (1 row / hour)."""
+    with pd.ExcelWriter(path) as writer:
+        for month in months:
+            start = datetime.datetime.strptime(month, "%Y%m")
+            dates = pd.date_range(start, start + pd.DateOffset(months=1),
+                                  freq="h", inclusive="left")
+            prices = 1e7 + np.arange(len(dates), dtype=np.float64) + int(month) * 1e3
+            pd.DataFrame({"date": dates, "price": prices}).to_excel(
+                writer, sheet_name=month, index=False)
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    invalidate_price_cache()
+    path = str(tmp_path / "prices.xlsx")
+    make_workbook(path, ["202411", "202412", "202501"])
+    yield path
+    invalidate_price_cache()
+
+
+def expected_range(path, datetime_range, step):
+    df = pd.concat([pd.read_excel(path, sheet_name=s)
+                    for s in ["202411", "202412", "202501"]])
+    df = df[(df.iloc[:, 0] >= datetime_range[0]) & (df.iloc[:, 0] < datetime_range[1])]
+    return df.iloc[:, 0].to_numpy(dtype="datetime64[ns]"), df.iloc[:, 1].to_numpy()
+
+
+def test_price_store_is_memory_mapped(workbook):
+    store = read_prices_from_chash(workbook, True)
+    assert store.sheet_names == ["202411", "202412", "202501"]
+    sheet = store["202412"]
+    assert isinstance(sheet["price"], np.memmap)
+    assert sheet["date"].dtype == np.dtype("datetime64[ns]")
+    assert sheet["price"].dtype == np.float64
+    assert len(sheet["price"]) == 31 * 24
+
+
+def test_read_prices_from_sheets_across_sheets(workbook):
+    datetime_range = (datetime.datetime(2024, 11, 20, 12, 0),
+                      datetime.datetime(2025, 1, 10, 0, 0))
+    dates, prices = read_prices_from_sheets(workbook, datetime_range, 1,
+                                            use_cache=True, with_date=True)
+    exp_dates, exp_prices = expected_range(workbook, datetime_range, 1)
+    np.testing.assert_array_equal(dates, exp_dates)
+    np.testing.assert_array_equal(prices, exp_prices)
+
+
+def test_read_prices_from_sheets_within_one_sheet(workbook):
+    datetime_range = (datetime.datetime(2024, 12, 3, 5, 30),
+                      datetime.datetime(2024, 12, 20, 0, 0))
+    dates, prices = read_prices_from_sheets(workbook, datetime_range, 1,
+                                            use_cache=True, with_date=True)
+    exp_dates, exp_prices = expected_range(workbook, datetime_range, 1)
+    np.testing.assert_array_equal(dates, exp_dates)
+    np.testing.assert_array_equal(prices, exp_prices)
+    # A range inside one month is a view of the store
+    assert isinstance(prices.base, np.memmap) or isinstance(prices, np.memmap)
+
+
+def test_read_prices_from_sheets_step_and_bounds(workbook):
+    datetime_range = (datetime.datetime(2024, 1, 1), datetime.datetime(2026, 1, 1))
+    prices = read_prices_from_sheets(workbook, datetime_range, 10, use_cache=True)
+    expected = np.concatenate([
+        pd.read_excel(workbook, sheet_name=s).iloc[::10, 1].to_numpy()
+        for s in ["202411", "202412", "202501"]])
+    np.testing.assert_array_equal(prices, expected)
+
+    empty = read_prices_from_sheets(
+        workbook, (datetime.datetime(2023, 1, 1), datetime.datetime(2023, 2, 1)), 1,
+        use_cache=True)
+    assert len(empty) == 0
+
+
+def test_only_changed_sheets_are_read_again(workbook, monkeypatch):
+    from src.BitSysTrade import data_loader
+
+    read_prices_from_chash(workbook, True)
+    read_sheets = []
+    read_sheet_org = data_loader.read_sheet_from_excel
+
+    def read_sheet(excel_file, sheet_name):
+        read_sheets.append(sheet_name)
+        return read_sheet_org(excel_file, sheet_name)
+    monkeypatch.setattr(data_loader, "read_sheet_from_excel", read_sheet)
+
+    # Unchanged file: no sheet is read
+    invalidate_price_cache()
+    read_prices_from_chash(workbook, True)
+    assert read_sheets == []
+
+    # Append rows to the last month only, like app/gas/gas.js
+    dfs = {s: pd.read_excel(workbook, sheet_name=s) for s in ["202411", "202412", "202501"]}
+    extra = pd.DataFrame({"date": [datetime.datetime(2025, 2, 1, 0, 30)], "price": [1.5e7]})
+    dfs["202501"] = pd.concat([dfs["202501"], extra.set_axis(dfs["202501"].columns, axis=1)])
+    with pd.ExcelWriter(workbook) as writer:
+        for s, df in dfs.items():
+            df.to_excel(writer, sheet_name=s, index=False)
+
+    invalidate_price_cache()
+    store = read_prices_from_chash(workbook, True)
+    assert read_sheets == ["202501"]
+    assert store["202501"]["price"][-1] == 1.5e7
+    assert len(store["202411"]["price"]) == 30 * 24
+
+
+def test_price_data_cache(workbook):
+    store = read_prices_from_chash(workbook, True)
+    hits = price_data_cache.stats["hits"]
+    assert read_prices_from_chash(workbook, True) is store
+    assert price_data_cache.stats["hits"] == hits + 1
+    assert price_data_cache.stats["bytes"] == store.nbytes > 0
+
+    # A modified workbook is a new key and replaces the old store
+    make_workbook(workbook, ["202411", "202412"])
+    new_store = read_prices_from_chash(workbook, True)
+    assert new_store is not store
+    assert new_store.sheet_names == ["202411", "202412"]
+    assert len(price_data_cache) == 1
+    assert invalidate_price_cache(workbook) == 1
+    assert len(price_data_cache) == 0
+
+
+def test_lru_cache_byte_limit():
+    from src.BitSysTrade.utils.cache import LRUCache
+    cache = LRUCache(max_bytes=100)
+    cache.put("a", 1, 40)
+    cache.put("b", 2, 40)
+    assert cache.get("a") == 1
+    cache.put("c", 3, 40)  # evicts "b", the least recently used
+    assert "b" not in cache and "a" in cache and "c" in cache
+    cache.put("d", 4, 1000)  # larger than the limit
+    assert "d" not in cache
+    assert cache.stats == {"items": 2, "bytes": 80, "max_bytes": 100,
+                           "hits": 1, "misses": 0, "evictions": 1}
@@ -0,0 +1,72 @@
+import sys
+sys.path.append(".")
+import numpy as np
+import pytest
+from src.BitSysTrade.market import BacktestMarket, FXPosition
+
+
+def list_value(price, positions):
+    value = 0
+    for position in positions:
+        if position["side"] == "BUY":
+            value += (price - position["price"]) * position["size"]
+        else:
+            value += (position["price"] - price) * position["size"]
+    return value
+
+
+def random_fills(seed, n=500):
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 5, n) * np.where(rng.random(n) < 0.5, -1, 1)
+    prices = 100 + rng.integers(-20, 20, n)
+    return sizes.astype(float), prices.astype(float)
+
+
+@pytest.mark.parametrize("lots", [False, True])
+def test_fx_position_matches_position_list(lots):
+    market = BacktestMarket(np.zeros(1))
+    position = FXPosition(lots=lots)
+    positions = []
+    cash_list = cash = 0.0
+    for size, price in zip(*random_fills(0)):
+        order = {"size": abs(size), "price": price,
+                 "side": "BUY" if size > 0 else "SELL"}
+        profit_list = market._checkout_position(order, positions)
+        profit = position.fill(size, price)
+        if lots:
+            # Same FIFO matching as the list
+            assert profit == profit_list
+        cash_list += profit_list
+        cash += profit
+        net = sum(p["size"] if p["side"] == "BUY" else -p["size"] for p in positions)
+        assert position.size == net
+        for p in [80., 100., 120.]:
+            assert cash + position.value(p) == pytest.approx(
+                cash_list + list_value(p, positions))
+    assert position.realized == cash
+
+
+def test_fx_position_average_entry():
+    position = FXPosition()
+    position.fill(1, 100)
+    position.fill(3, 104)
+    assert position.price == 103
+    assert position.fill(-2, 110) == 14
+    assert (position.size, position.price) == (2, 103)
+    # Close and reverse in one fill
+    assert position.fill(-3, 100) == -6
+    assert (position.size, position.price) == (-1, 100)
+    np.testing.assert_array_equal(position.value(np.array([90., 110.])), [10, -10])
+
+
+@pytest.mark.parametrize("lots", [False, True])
+def test_fx_position_to_dict_loads_from_yaml(lots):
+    yaml = pytest.importorskip("yaml")
+    position = FXPosition(lots=lots)
+    position.fill(1, 100)
+    position.fill(np.float64(3), np.float64(104))
+    summary = {"portfolio_result": {"position_fx": position.to_dict()}}
+    loaded = yaml.load(yaml.dump(summary), Loader=yaml.FullLoader)
+    assert loaded["portfolio_result"]["position_fx"]["size"] == 4
+    assert loaded["portfolio_result"]["position_fx"]["price"] == 103
+    assert ("lots" in loaded["portfolio_result"]["position_fx"]) == lots
@@ -0,0 +1,102 @@
+import sys
+sys.path.append(".")
+import numpy as np
+from src.BitSysTrade.signal_generator import (BollingerBandsSG,
+    IncrementalBollingerBandsSG, MovingAverageCrossoverSG,
+    IncrementalMovingAverageCrossoverSG)
+from src.BitSysTrade.data_generater import random_data
+
+price_data = random_data(1e7, 0.002, 3000, seed=111)
+bb_param = {"window_size": 200, "num_std_dev": 1.2, "reverse": 0}
+ma_param = {"short_window": 5, "long_window": 40}
+
+
+def run(sg, prices, key="upper_band"):
+    signals, values = [], []
+    for price in prices:
+        signals.append(sg.generate_signals(price))
+        values.append(sg.dynamic.get(key))
+    return signals, values
+
+
+def restore(dynamic):
+    """Imitate the state read back from DynamoDB (read only arrays)."""
+    restored = {}
+    for k, v in dynamic.items():
+        if isinstance(v, np.ndarray):
+            v = np.frombuffer(v.tobytes(), dtype=v.dtype)
+        restored[k] = v
+    return restored
+
+
+def test_incremental_bollinger_bands_matches_reference():
+    reference = BollingerBandsSG()
+    reference.reset_param(bb_param)
+    incremental = IncrementalBollingerBandsSG()
+    incremental.reset_param(bb_param)
+    ref_signals, ref_bands = run(reference, price_data)
+    signals, bands = run(incremental, price_data)
+    assert signals == ref_signals
+    assert bands[0] is None
+    np.testing.assert_allclose(bands[1:], ref_bands[1:], rtol=1e-12)
+    assert len(incremental.dynamic["prices"]) == bb_param["window_size"]
+
+
+def test_incremental_bollinger_bands_restore_state():
+    first, second = price_data[:1000], price_data[1000:]
+    continuous = IncrementalBollingerBandsSG()
+    continuous.reset_param(bb_param)
+    run(continuous, first)
+
+    resumed = IncrementalBollingerBandsSG()
+    resumed.reset_param(bb_param)
+    resumed.dynamic = restore(continuous.dynamic)
+    assert run(resumed, second) == run(continuous, second)
+
+
+def test_incremental_bollinger_bands_reads_reference_state():
+    reference = BollingerBandsSG()
+    reference.reset_param(bb_param)
+    run(reference, price_data[:1000])
+
+    incremental = IncrementalBollingerBandsSG()
+    incremental.reset_param(bb_param)
+    incremental.dynamic = restore(reference.dynamic)
+    ref_signals, _ = run(reference, price_data[1000:])
+    signals, _ = run(incremental, price_data[1000:])
+    assert signals == ref_signals
+
+
+def test_incremental_moving_average_matches_reference():
+    reference = MovingAverageCrossoverSG()
+    reference.reset_param(ma_param)
+    incremental = IncrementalMovingAverageCrossoverSG()
+    incremental.reset_param(ma_param)
+    ref_signals, ref_mavg = run(reference, price_data, "long_mavg")
+    signals, mavg = run(incremental, price_data, "long_mavg")
+    assert signals == ref_signals
+    assert "Buy" in signals and "Sell" in signals
+    warm_up = ma_param["long_window"]
+    assert mavg[:warm_up] == ref_mavg[:warm_up] == [None] * warm_up
+    np.testing.assert_allclose(mavg[warm_up:], ref_mavg[warm_up:], rtol=1e-12)
+    assert len(incremental.dynamic["price_hist"]) == ma_param["long_window"] + 1
+
+
+def test_incremental_moving_average_restore_state():
+    first, second = price_data[:1000], price_data[1000:]
+    continuous = IncrementalMovingAverageCrossoverSG()
+    continuous.reset_param(ma_param)
+    run(continuous, first)
+
+    resumed = IncrementalMovingAverageCrossoverSG()
+    resumed.reset_param(ma_param)
+    resumed.dynamic = restore(continuous.dynamic)
+    assert run(resumed, second) == run(continuous, second)
+
+    reference = MovingAverageCrossoverSG()
+    reference.reset_param(ma_param)
+    run(reference, first)
+    from_reference = IncrementalMovingAverageCrossoverSG()
+    from_reference.reset_param(ma_param)
+    from_reference.dynamic = restore(reference.dynamic)
+    assert run(from_reference, second)[0] == run(reference, second)[0]
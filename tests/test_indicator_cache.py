@@ -0,0 +1,103 @@
+import sys
+sys.path.append(".")
+import numpy as np
+import pytest
+from src.BitSysTrade.signal_generator import (
+    IndicatorCache, BollingerBandsSG, MovingAverageCrossoverSG, MACDSG)
+from src.BitSysTrade.market import BacktestMarket
+from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.trade_executor import SpreadOrderExecutor
+from src.BitSysTrade.data_generater import random_data
+
+price_data = random_data(1e7, 0.001, 3000, seed=888)
+param = {
+    "short_window": 20,
+    "long_window": 50,
+    "signal_window": 9,
+    "window_size": 100,
+    "num_std_dev": 1.5,
+    "reverse": 1,
+    "buy_count_limit": 5,
+    "one_order_quantity": 0.01
+}
+
+
+def test_values_are_computed_once_per_key():
+    cache = IndicatorCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.arange(10.0)
+
+    first = cache.get(price_data, "kind", (1,), compute)
+    assert cache.get(price_data.copy(), "kind", (1,), compute) is first
+    assert not first.flags.writeable
+    cache.get(price_data, "kind", (2,), compute)
+    cache.get(price_data[:100], "kind", (1,), compute)
+    assert len(calls) == 3
+
+
+def test_memoized_prices_can_not_be_changed_in_place():
+    cache = IndicatorCache()
+    prices = price_data.copy()
+    fingerprint = cache.fingerprint(prices)
+    with pytest.raises(ValueError):
+        prices[0] = 0.0
+    cache.release()
+    prices[0] = 0.0
+    assert cache.fingerprint(prices) != fingerprint
+
+
+def test_memory_budget():
+    cache = IndicatorCache(max_bytes=3 * 80)
+    for i in range(10):
+        cache.get(price_data, "kind", (i,), lambda: np.zeros(10))
+    assert cache.stats["items"] == 3
+    assert cache.stats["evictions"] == 7
+
+
+@pytest.mark.parametrize("sg_class", [BollingerBandsSG, MovingAverageCrossoverSG, MACDSG])
+def test_cached_batch_matches(sg_class):
+    cache = IndicatorCache()
+    for num_std_dev in [1.0, 2.0]:
+        p = dict(param, num_std_dev=num_std_dev)
+        expected = sg_class()
+        expected.reset_param(p)
+        expected_signals, expected_states = expected.generate_signals_batch(price_data)
+
+        sg = sg_class()
+        sg.indicator_cache = cache
+        sg.reset_param(p)
+        signals, states = sg.generate_signals_batch(price_data)
+        np.testing.assert_array_equal(signals, expected_signals)
+        for k in expected_states:
+            np.testing.assert_array_equal(states[k], expected_states[k])
+    assert cache.stats["hits"] > 0
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_bayesian_backtester_results_do_not_change(n_jobs):
+    from skopt.space import Integer, Real
+    from src.BitSysTrade.backtester import BayesianBacktester
+
+    target_params = {
+        "window_size": Integer(10, 12),
+        "num_std_dev": Real(0.5, 3.0),
+        "reverse": 1,
+        "buy_count_limit": 5,
+        "one_order_quantity": 0.01
+    }
+    results = []
+    for cache_indicators in [False, True]:
+        strategy = BacktestStrategy(BacktestMarket(price_data, fee_rate=0.001),
+                                    BollingerBandsSG(), SpreadOrderExecutor(),
+                                    engine="vectorized")
+        backtester = BayesianBacktester(strategy)
+        results.append(backtester.backtest(dict(target_params), 1e6, 0.1, n_calls=10,
+                                           n_jobs=n_jobs,
+                                           cache_indicators=cache_indicators))
+        assert strategy.signal_generator.indicator_cache is None
+    assert results[0] == results[1]
+    if n_jobs == 1:
+        assert backtester.indicator_cache.stats["hits"] > 0
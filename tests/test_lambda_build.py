@@ -0,0 +1,191 @@
+import subprocess
+import sys
+sys.path.append(".")
+sys.path.append("app/aws_build")
+import types
+import numpy as np
+from build_lambda_src import (build_pruned_source, measure_cold_start,
+                              extract_imports_and_definitions)
+from src.BitSysTrade.signal_generator import BollingerBandsSG
+from src.BitSysTrade.data_generater import random_data
+
+with open("app/aws_build/_lambda_base.py", encoding="utf-8") as f:
+    base_source = f.read()
+
+custom_sg = '''
+import numpy as np
+import pandas as pd
+from BitSysTrade.signal_generator import BollingerBandsSG
+
+
+class WrappedBandsSG(BollingerBandsSG):
+    class Threshold():
+        value = 0.5
+
+    def generate_signals(self, price):
+        import math
+        signal = super().generate_signals(price)
+        return signal if math.isfinite(price) else "Hold"
+
+
+class UnusedSG(WrappedBandsSG):
+    def frame(self):
+        return pd.DataFrame()
+'''
+
+
+optional_sg = '''
+from BitSysTrade.signal_generator import BollingerBandsSG
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+try:
+    import package_that_is_not_installed
+except ImportError:
+    package_that_is_not_installed = None
+
+
+class OptionalSG(BollingerBandsSG):
+    def generate_signals(self, price):
+        if package_that_is_not_installed is not None:
+            return "Hold"
+        return pd.isna(price) and "Hold" or super().generate_signals(price)
+'''
+
+
+def build(sg_class, te_class="SpreadOrderExecutor", directories=("src/",)):
+    base = (base_source.replace("{SG class}", sg_class)
+            .replace("{TE class}", te_class)
+            .replace("{Market class}", "BitflyerMarket"))
+    return build_pruned_source(base, list(directories), logger=lambda m: None)
+
+
+def top_level_imports(source):
+    return [line for line in source.splitlines() if line.startswith(("import ", "from "))]
+
+
+def test_only_reachable_definitions_and_imports():
+    source = build("IncrementalBollingerBandsSG")
+    compile(source, "lambda.py", "exec")
+    # Superclasses of any depth are copied, other generators are not
+    for name in ["SignalGenerator", "BollingerBandsSG", "IncrementalBollingerBandsSG",
+                 "TradeExecutor", "Market", "BitflyerMarket", "Strategy"]:
+        assert f"\nclass {name}(" in source
+    assert "class MACDSG(" not in source and "class BacktestStrategy(" not in source
+    imports = "\n".join(top_level_imports(source))
+    for module in ["pandas", "scipy", "holoviews", "skopt", "numba", "requests", "numpy"]:
+        assert module not in imports
+    assert "np = _LazyModule('np', 'numpy')" in source
+
+
+def test_nested_classes_and_custom_directories(tmp_path):
+    (tmp_path / "custom_sg.py").write_text(custom_sg, encoding="utf-8")
+    source = build("WrappedBandsSG", directories=["src/", str(tmp_path)])
+    assert "class Threshold():" in source
+    assert "class UnusedSG(" not in source
+    assert "pandas" not in source
+    namespace = {}
+    exec(compile(source, "lambda.py", "exec"), namespace)
+    prices = random_data(1e7, 0.002, 200, seed=1)
+    signals = []
+    for sg in [namespace["WrappedBandsSG"](), BollingerBandsSG()]:
+        sg.reset_param({"window_size": 20, "num_std_dev": 1.0, "reverse": 0})
+        signals.append([sg.generate_signals(p) for p in prices])
+    assert signals[0] == signals[1] and "Buy" in signals[0]
+    assert namespace["WrappedBandsSG"].Threshold.value == 0.5
+
+
+class FakeSession:
+    def __init__(self, prices):
+        self.prices = iter(prices)
+
+    def get(self, url, params=None, headers=None):
+        body = {"ltp": next(self.prices)} if url.endswith("/v1/ticker") else []
+        return types.SimpleNamespace(json=lambda: body)
+
+    def post(self, url, headers=None, data=None):
+        return types.SimpleNamespace(json=lambda: {"child_order_acceptance_id": "1"})
+
+
+def test_built_handler_runs(lambda_env, table, tmp_path):
+    source = build("BollingerBandsSG")
+    path = tmp_path / "lambda.py"
+    path.write_text(source, encoding="utf-8")
+    times, error = measure_cold_start(str(path), repeat=1)
+    assert error is None
+    assert times["cold_start"] > times["import"] > 0
+    assert sorted(times["deferred"]) == ["boto3", "numpy", "requests"]
+
+    namespace = {}
+    exec(compile(source, "lambda.py", "exec"), namespace)
+    assert type(namespace["np"]).__name__ == "_LazyModule"
+    resource = types.SimpleNamespace(Table=lambda name: table)
+    namespace["boto3"] = types.SimpleNamespace(resource=lambda name: resource)
+    strategy, store = namespace["_container"] = namespace["_create_container"]()
+    strategy.market.session = FakeSession([1e7 + i * 1000 for i in range(30)])
+    for _ in range(30):
+        namespace["lambda_handler"]({}, None)
+    assert namespace["np"] is np
+    assert store.is_current
+    assert len(strategy.signal_generator.dynamic["prices"]) == 20
+
+
+def test_text_mode_hoists_only_module_imports(tmp_path):
+    path = tmp_path / "sg.py"
+    path.write_text('''import numpy as np
+from typing import (Literal,
+                    Optional)
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
+
+class DocSG():
+    """Signals.
+    from the docstring, not an import
+    import neither
+    """
+''', encoding="utf-8")
+    imports, definitions = extract_imports_and_definitions(str(path), ["DocSG"],
+                                                           lambda m: None)
+    assert imports == ["import numpy as np\n",
+                       "from typing import (Literal,\n                    Optional)\n"]
+    assert "    from the docstring, not an import\n" in definitions
+
+
+def test_optional_imports_are_deferred(tmp_path):
+    (tmp_path / "optional_sg.py").write_text(optional_sg, encoding="utf-8")
+    source = build("OptionalSG", directories=["src/", str(tmp_path)])
+    assert "pd = _LazyModule('pd', 'pandas')" in source
+    assert "pandas" not in "\n".join(top_level_imports(source))
+    namespace = {}
+    exec(compile(source, "lambda.py", "exec"), namespace)
+    assert type(namespace["pd"]).__name__ == "_LazyModule"
+    assert namespace["package_that_is_not_installed"] is None
+    sg = namespace["OptionalSG"]()
+    sg.reset_param({"window_size": 20, "num_std_dev": 1.0, "reverse": 0})
+    assert sg.generate_signals(1e7) == "Hold"
+    assert namespace["pd"].__name__ == "pandas"
+
+
+def test_macd_lambda_does_not_load_scipy(tmp_path):
+    path = tmp_path / "lambda.py"
+    path.write_text(build("MACDSG"), encoding="utf-8")
+    code = ("import runpy, sys; runpy.run_path(sys.argv[1]); "
+            "print('scipy' in sys.modules)")
+    result = subprocess.run([sys.executable, "-c", code, str(path)],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_cold_start_sets_default_parameters(monkeypatch, tmp_path):
+    for key in [*BollingerBandsSG().default_param, "buy_count_limit",
+                "one_order_quantity"]:
+        monkeypatch.delenv(key, raising=False)
+    path = tmp_path / "lambda.py"
+    path.write_text(build("IncrementalBollingerBandsSG"), encoding="utf-8")
+    times, error = measure_cold_start(str(path), repeat=1)
+    assert error is None
+    assert times["cold_start"] > times["import"] > 0
@@ -0,0 +1,120 @@
+import sys
+sys.path.append(".")
+import types
+import numpy as np
+from src.BitSysTrade.market import Market
+from src.BitSysTrade.strategy import Strategy, TradeLimiterConfig
+from src.BitSysTrade.signal_generator import BollingerBandsSG
+from src.BitSysTrade.trade_executor import SpreadOrderExecutor
+from src.BitSysTrade.utils.dynamodb import DynamoDBStateStore
+from src.BitSysTrade.data_generater import random_data
+
+prices = random_data(1e7, 0.002, 60, seed=321)
+
+
+class FakeMarket(Market):
+    prices = iter(())
+
+    def set_apikey(self, apikey, secret):
+        pass
+
+    def get_current_price(self):
+        return float(next(FakeMarket.prices))
+
+    def place_market_order(self, side, quantity):
+        return True
+
+    def place_limit_order(self, side, quantity, price):
+        return True
+
+    def get_open_orders(self):
+        return []
+
+    def cancel_order(self, order_id):
+        return True
+
+
+def new_container(table):
+    """Namespace of the generated handler, as in a new Lambda container."""
+    with open("app/aws_build/_lambda_base.py", encoding="utf-8") as f:
+        source = f.read()
+    source = (source.replace("{Class src}", "")
+              .replace("{Market class}", "FakeMarket")
+              .replace("{SG class}", "BollingerBandsSG")
+              .replace("{TE class}", "SpreadOrderExecutor"))
+    namespace = {"FakeMarket": FakeMarket, "Strategy": Strategy,
+                 "TradeLimiterConfig": TradeLimiterConfig,
+                 "BollingerBandsSG": BollingerBandsSG,
+                 "SpreadOrderExecutor": SpreadOrderExecutor,
+                 "DynamoDBStateStore": DynamoDBStateStore}
+    exec(compile(source, "_lambda_base.py", "exec"), namespace)
+    resource = types.SimpleNamespace(Table=lambda name: table)
+    namespace["boto3"] = types.SimpleNamespace(resource=lambda name: resource)
+    return namespace
+
+
+def test_warm_container_skips_reads(lambda_env, table):
+    FakeMarket.prices = iter(prices)
+    container = new_container(table)
+    for _ in range(40):
+        container["lambda_handler"]({}, None)
+    strategy, store = container["_container"]
+    assert table.reads == 1
+    assert store.is_current
+
+    # A cold container running once in between makes the next write fail
+    other = new_container(table)
+    other["lambda_handler"]({}, None)
+    container["lambda_handler"]({}, None)
+    assert not store.is_current
+    reads = table.reads
+    container["lambda_handler"]({}, None)
+    assert table.reads > reads and store.is_current
+
+    # The state equals the one of a single strategy that saw every price
+    # except the one whose write was rejected
+    expected = BollingerBandsSG()
+    expected.reset_param({"window_size": 20.0, "num_std_dev": 1.0, "reverse": 0.0})
+    for price in np.delete(prices[:43], 41):
+        expected.generate_signals(price)
+    state = DynamoDBStateStore(table, "params").load()
+    np.testing.assert_array_equal(state["prices"], expected.dynamic["prices"])
+    assert state["upper_band"] == expected.dynamic["upper_band"]
+
+
+def test_failed_load_skips_the_trade(lambda_env, table):
+    FakeMarket.prices = iter(prices)
+    container = new_container(table)
+    for _ in range(5):
+        container["lambda_handler"]({}, None)
+    head = table.item("params")
+    get_item = table.get_item
+
+    class SnapshotLostTable:
+        """The snapshot of the head can not be read, even after a retry."""
+        def __getattr__(self, name):
+            return getattr(table, name)
+
+        def get_item(self, Key, **kwargs):
+            if "#snapshot" in Key["id"]:
+                return {}
+            return get_item(Key=Key, **kwargs)
+
+    lost = SnapshotLostTable()
+    other = new_container(lost)
+    other["lambda_handler"]({}, None)
+    strategy, store = other["_container"]
+    # No price was read, nothing was traded or saved
+    assert not store.is_current
+    assert table.item("params") == head
+    assert float(next(FakeMarket.prices)) == prices[5]
+
+    # Once the snapshot is readable the next invocation continues the state
+    store.table = table
+    other["lambda_handler"]({}, None)
+    expected = BollingerBandsSG()
+    expected.reset_param({"window_size": 20.0, "num_std_dev": 1.0, "reverse": 0.0})
+    for price in np.delete(prices[:7], 5):
+        expected.generate_signals(price)
+    np.testing.assert_array_equal(strategy.signal_generator.dynamic["prices"],
+                                  expected.dynamic["prices"])
@@ -0,0 +1,53 @@
+import sys
+sys.path.append(".")
+sys.path.append("app/aws_build")
+import pytest
+from botocore.exceptions import ClientError
+from build_lambda_src import base_file, build_pruned_source, read_base_source
+from replay_lambda import replay
+from src.BitSysTrade.data_generater import random_data
+
+prices = random_data(1e7, 0.002, 150, seed=777)
+params = {
+    "window_size": 20,
+    "num_std_dev": 1.0,
+    "reverse": 0,
+    "buy_count_limit": 3,
+    "one_order_quantity": 0.01,
+}
+
+
+def test_fake_table_behaves_like_boto3(table):
+    table.put_item(Item={"id": "k", "version": 1, "deltas": [b"a"], "s": b"x"})
+    with pytest.raises(TypeError):
+        table.put_item(Item={"id": "f", "value": 0.5})
+    names = {"#d": "deltas", "#s": "s", "#v": "version"}
+    table.update_item(Key={"id": "k"},
+                      UpdateExpression="SET #d = list_append(#d, :d), #s = :s, #v = :n",
+                      ConditionExpression="attribute_not_exists(#v) OR #v = :v",
+                      ExpressionAttributeNames=names,
+                      ExpressionAttributeValues={":d": [b"b"], ":s": b"y", ":v": 1, ":n": 2})
+    item = table.get_item(Key={"id": "k"})["Item"]
+    assert [d.value for d in item["deltas"]] == [b"a", b"b"] and item["version"] == 2
+    with pytest.raises(ClientError):
+        table.put_item(Item={"id": "k", "version": 5},
+                       ConditionExpression="attribute_not_exists(#v) OR #v = :v",
+                       ExpressionAttributeNames={"#v": "version"},
+                       ExpressionAttributeValues={":v": 1})
+    assert table.bytes_read > 0 and table.bytes_written > 0
+
+
+def test_replay_matches_backtest(capsys):
+    base = read_base_source(base_file, "BollingerBandsSG", "SpreadOrderExecutor",
+                            "BitflyerMarket")
+    source = build_pruned_source(base, ["src/BitSysTrade"], logger=lambda m: None)
+    result = replay(source, prices, params, cold_every=50)
+    assert result["errors"] == 0
+    assert result["mismatches"] == []
+    assert result["signals"] == result["expected_signals"]
+    assert len(result["signals"]) == len(prices)
+    assert "Buy" in result["signals"] and result["orders"] > 0
+    assert result["cold_invocations"] == 3
+    # Cold containers read the state written by the previous one
+    assert result["state_bytes_read"] > 0 and result["state_bytes_written"] > 0
+    assert set(result["latency_ms"]) == {"p50", "p90", "p99", "max"}
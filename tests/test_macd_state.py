@@ -0,0 +1,87 @@
+import subprocess
+import sys
+sys.path.append(".")
+import pickle
+import numpy as np
+import pytest
+from src.BitSysTrade import signal_generator
+from src.BitSysTrade.signal_generator import MACDSG
+from src.BitSysTrade.market import BacktestMarket
+from src.BitSysTrade.strategy import Strategy
+from src.BitSysTrade.trade_executor import SpreadOrderExecutor
+from src.BitSysTrade.data_generater import random_data
+
+price_data = random_data(1e7, 0.002, 3000, seed=666)
+param = {
+    "short_window": 12,
+    "long_window": 26,
+    "signal_window": 9,
+    "buy_count_limit": 5,
+    "one_order_quantity": 0.01
+}
+
+
+def make_strategy():
+    strategy = Strategy(BacktestMarket(price_data), MACDSG(), SpreadOrderExecutor())
+    strategy.reset_param(param)
+    return strategy
+
+
+def test_state_is_exported_and_restored():
+    strategy = make_strategy()
+    for price in price_data[:1000]:
+        strategy.generate_signals(price)
+    saved = dict(strategy.get_all_dynamic())
+    assert saved["macd_values"] == strategy.signal_generator._macd
+    assert "macd_values_old" in saved
+
+    # Same as the Lambda handler: new instance, then restore the dict
+    restored = make_strategy()
+    restored.dynamic = pickle.loads(pickle.dumps(saved))
+    restored.set_all_dynamic()
+    signals = [strategy.generate_signals(p) for p in price_data[1000:]]
+    assert [restored.generate_signals(p) for p in price_data[1000:]] == signals
+    assert restored.get_all_dynamic() == strategy.get_all_dynamic()
+
+
+@pytest.mark.parametrize("use_filter", [True, False])
+@pytest.mark.parametrize("prices", [
+    price_data,
+    # MACD is exactly 0 on flat prices, which restarts the signal line
+    np.concatenate([np.full(50, 1e7), price_data[:500], np.full(50, 1e7)]),
+    price_data[:2],
+])
+def test_batch_paths_match_streaming(monkeypatch, use_filter, prices):
+    if not use_filter:
+        monkeypatch.setattr(signal_generator, "_load_lfilter", lambda: None)
+    elif signal_generator._load_lfilter() is None:
+        pytest.skip("scipy is not installed")
+    streaming = MACDSG()
+    streaming.reset_param(param)
+    expected = [streaming.generate_signals(p) for p in prices]
+
+    batch = MACDSG()
+    batch.reset_param(param)
+    signals, states = batch.generate_signals_batch(prices)
+    assert [signal_generator.SIGNAL_NAMES[int(s)] for s in signals] == expected
+    assert states["signal_line_values"][-1] == streaming.dynamic["signal_line_values"]
+    assert batch.dynamic == streaming.dynamic
+
+
+def test_state_has_no_instance_dict():
+    sg = MACDSG()
+    assert not hasattr(sg, "__dict__")
+    sg.reset_param(param)
+    sg.generate_signals(price_data[0])
+    restored = pickle.loads(pickle.dumps(sg))
+    assert restored.dynamic == sg.dynamic
+    assert restored.static == sg.static
+
+
+def test_import_does_not_load_scipy():
+    code = ("import sys; sys.path.append('.'); "
+            "import src.BitSysTrade.signal_generator; "
+            "print('scipy' in sys.modules)")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                         text=True, check=True).stdout
+    assert out.strip() == "False"
@@ -0,0 +1,63 @@
+import sys
+sys.path.append(".")
+import numpy as np
+from src.BitSysTrade.market import BacktestMarket, Order, OrderBook
+
+
+def test_crossed_orders_match_linear_scan():
+    rng = np.random.default_rng(0)
+    book = OrderBook()
+    orders = []
+    for i in range(200):
+        order = Order("Buy" if rng.random() < 0.5 else "Sell", 1,
+                      float(rng.integers(90, 110)), i)
+        book.add(order)
+        orders.append(order)
+    for order in orders[::3]:
+        assert book.remove(order)
+        assert not book.remove(order)
+    orders = orders[1::3] + orders[2::3]
+    orders.sort(key=lambda order: order.order_id)
+    assert list(book) == orders
+    for price in range(85, 115):
+        expected = [o for o in orders
+                    if (o.side == "Sell" and price >= o.price)
+                    or (o.side == "Buy" and price <= o.price)]
+        assert book.crossed(price) == expected
+
+
+def test_check_order_fills_every_crossed_order():
+    prices = np.array([100., 100., 95., 105., 100.])
+    market = BacktestMarket(prices, fee_rate=0)
+    market.reset_portfolio(10000, 10)
+    # Removing while iterating used to skip every other filled order
+    for price in [98, 97, 96]:
+        market.place_limit_order("Buy", 1, price)
+    market.place_limit_order("Buy", 1, 90)
+    for price in [102, 103]:
+        market.place_limit_order("Sell", 1, price)
+    market.check_order()
+    assert len(market.get_open_orders()) == 6
+
+    market.set_current_index(2)
+    market.check_order()
+    assert [o.price for o in market.get_open_orders()] == [90, 102, 103]
+    assert market.portfolio["position"] == 13
+
+    market.set_current_index(3)
+    market.check_order()
+    assert [o.price for o in market.get_open_orders()] == [90]
+    assert market.portfolio["position"] == 11
+    assert list(market.hist["execute_signals"]["Buy"].index) == [2, 2, 2]
+
+
+def test_cancel_order_by_id():
+    market = BacktestMarket(np.array([100.]))
+    market.reset_portfolio(10000, 0)
+    market.place_limit_order("Buy", 1, 90)
+    market.place_limit_order("Buy", 1, 90)
+    first, second = market.get_open_orders()
+    assert first.order_id != second.order_id
+    assert market.cancel_order(first.order_id)
+    assert not market.cancel_order(first.order_id)
+    assert list(market.get_open_orders()) == [second]
@@ -0,0 +1,59 @@
+import sys
+sys.path.append(".")
+from src.BitSysTrade.market import BacktestMarket
+from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.signal_generator import BollingerBandsSG
+from src.BitSysTrade.trade_executor import SpreadOrderExecutor
+from src.BitSysTrade.backtester import GridBacktester
+from src.BitSysTrade.data_generater import random_data
+
+price_data = random_data(1e7, 0.001, 3000, seed=111)
+params = [{"window_size": w, "num_std_dev": 1.5, "reverse": 1,
+           "buy_count_limit": 5, "one_order_quantity": 0.01}
+          for w in [20, 50, 100, 200]]
+
+
+def create_strategy():
+    market = BacktestMarket(price_data, fee_rate=0.001)
+    return BacktestStrategy(market, BollingerBandsSG(), SpreadOrderExecutor(),
+                            engine="vectorized")
+
+
+def test_grid_backtest_parallel_matches_serial():
+    serial = GridBacktester(create_strategy()).backtest(params, 1e6, 0.1)
+    backtester = GridBacktester(create_strategy())
+    parallel = backtester.backtest(params, 1e6, 0.1, n_jobs=2)
+    assert parallel == serial
+    assert len(set(r["trade_count"] for r in parallel)) > 1
+    # The strategy of the caller keeps its data
+    assert len(backtester.strategy.market.data) == len(price_data)
+
+
+class ListLog:
+    def __init__(self):
+        self.rows = []
+
+    def add_log(self, row):
+        self.rows.append(row)
+
+
+def test_bayesian_backtest_batch_mode():
+    from skopt.space import Integer, Real
+    from src.BitSysTrade.backtester import BayesianBacktester
+
+    target_params = {
+        "window_size": Integer(10, 200),
+        "num_std_dev": Real(0.5, 3.0),
+        "reverse": 1,
+        "buy_count_limit": 5,
+        "one_order_quantity": 0.01
+    }
+    log = ListLog()
+    backtester = BayesianBacktester(create_strategy())
+    best_value, best_param = backtester.backtest(target_params, 1e6, 0.1,
+                                                 n_calls=12, n_jobs=2,
+                                                 n_points=4, df_log_queue=log)
+    assert len(log.rows) == 12
+    assert best_value == max(row["Total_Value"] for row in log.rows)
+    assert backtester.best["value"] == best_value
+    assert "Trade_Count" not in best_param
@@ -0,0 +1,58 @@
+import sys
+sys.path.append(".")
+from src.BitSysTrade.market import BacktestMarket
+from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.signal_generator import BollingerBandsSG
+from src.BitSysTrade.trade_executor import SpreadOrderExecutor
+from src.BitSysTrade.backtester import GridBacktester
+from src.BitSysTrade.utils.progress import ProgressReporter, ThrottledProgress
+from src.BitSysTrade.data_generater import random_data
+
+price_data = random_data(1e7, 0.001, 2500, seed=444)
+param = {
+    "window_size": 100,
+    "num_std_dev": 1.5,
+    "reverse": 1,
+    "buy_count_limit": 5,
+    "one_order_quantity": 0.01
+}
+
+
+class ListProgress(ProgressReporter):
+    def __init__(self):
+        self.updates = []
+
+    def update(self, current, total, text=None):
+        self.updates.append((current, total))
+
+
+def test_throttled_progress():
+    lines = []
+    progress = ThrottledProgress(interval=60, write=lines.append)
+    for i in range(1, 11):
+        progress.update(i, 10, "runs")
+    progress.message("done")
+    assert lines == ["[1/10] runs", "[10/10] runs", "done"]
+
+
+def test_loop_reports_per_chunk(capsys):
+    progress = ListProgress()
+    strategy = BacktestStrategy(BacktestMarket(price_data), BollingerBandsSG(),
+                                SpreadOrderExecutor(), progress=progress)
+    strategy.PROGRESS_CHUNK = 1000
+    strategy.reset_all(param, 1e6)
+    strategy.backtest()
+    assert progress.updates == [(1000, 2500), (2000, 2500), (2500, 2500)]
+    assert strategy.dynamic["count"] == 2500
+
+
+def test_grid_backtester_is_silent_by_default(capsys):
+    strategy = BacktestStrategy(BacktestMarket(price_data), BollingerBandsSG(),
+                                SpreadOrderExecutor())
+    GridBacktester(strategy).backtest([param, param], 1e6)
+    captured = capsys.readouterr()
+    assert captured.out == "" and captured.err == ""
+
+    progress = ListProgress()
+    GridBacktester(strategy, progress).backtest([param, param], 1e6)
+    assert progress.updates == [(1, 2), (2, 2)]
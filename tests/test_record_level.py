@@ -0,0 +1,69 @@
+import sys
+sys.path.append(".")
+import numpy as np
+import pytest
+from src.BitSysTrade.market import BacktestMarket
+from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.signal_generator import BollingerBandsSG
+from src.BitSysTrade.trade_executor import SpreadOrderExecutor
+from src.BitSysTrade.backtester import GridBacktester
+from src.BitSysTrade.data_generater import random_data
+
+price_data = random_data(1e7, 0.001, 3000, seed=222)
+param = {
+    "window_size": 100,
+    "num_std_dev": 1.5,
+    "reverse": 1,
+    "buy_count_limit": 5,
+    "one_order_quantity": 0.01
+}
+
+
+def make_strategy(engine, is_fx, record="full"):
+    market = BacktestMarket(price_data, fee_rate=0.001, is_fx=is_fx,
+                            record=record)
+    return BacktestStrategy(market, BollingerBandsSG(), SpreadOrderExecutor(),
+                            engine=engine)
+
+
+@pytest.mark.parametrize("is_fx", [False, True])
+@pytest.mark.parametrize("engine", ["loop", "vectorized"])
+@pytest.mark.parametrize("record", ["none", "summary"])
+def test_reduced_record_keeps_portfolio(record, engine, is_fx):
+    full = make_strategy(engine, is_fx)
+    full.reset_all(param, 1e6, 0.1)
+    expected = full.backtest(hold_params=["upper_band"])
+
+    strategy = make_strategy(engine, is_fx, record)
+    strategy.reset_all(param, 1e6, 0.1)
+    portfolio = strategy.backtest(hold_params=["upper_band"])
+    assert portfolio == expected
+    assert strategy.hold_params == {}
+    if record == "none":
+        assert strategy.backtest_history == {}
+    else:
+        hist = strategy.backtest_history
+        assert set(hist) == {"signals", "execute_signals"}
+        assert hist["signals"] == full.backtest_history["signals"]
+        assert hist["execute_signals"] == full.backtest_history["execute_signals"]
+
+
+def test_recording_context_restores_level():
+    strategy = make_strategy("loop", False)
+    with strategy.recording("none"):
+        assert strategy.market.record == "none"
+    assert strategy.record == "full"
+    strategy.record = "partial"
+    with pytest.raises(ValueError):
+        strategy.reset_all(param, 1e6)
+
+
+def test_grid_backtester_does_not_record():
+    strategy = make_strategy("loop", False)
+    results = GridBacktester(strategy).backtest([param], 1e6, 0.1)
+    assert strategy.backtest_history == {}
+    assert strategy.record == "full"
+
+    strategy.reset_all(param, 1e6, 0.1)
+    assert strategy.backtest() == results[0]
+    assert not np.isnan(strategy.backtest_history["total_value_hist"]).any()
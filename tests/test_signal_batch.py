@@ -0,0 +1,49 @@
+import sys
+sys.path.append(".")
+import numpy as np
+import pytest
+from src.BitSysTrade.signal_generator import (MovingAverageCrossoverSG, MACDSG,
+    BollingerBandsSG, SIGNAL_CODES)
+from src.BitSysTrade.data_generater import random_data
+
+price_data = random_data(1e7, 0.002, 3000, seed=111)
+
+cases = [
+    (MovingAverageCrossoverSG, {"short_window": 20, "long_window": 60},
+     ["short_mavg", "long_mavg"]),
+    (MovingAverageCrossoverSG, {"short_window": 5, "long_window": 200},
+     ["short_mavg", "long_mavg"]),
+    (MACDSG, {"short_window": 12, "long_window": 26, "signal_window": 9},
+     ["emashort_values", "emalong_values", "macd_values", "signal_line_values"]),
+    (BollingerBandsSG, {"window_size": 50, "num_std_dev": 1.0, "reverse": 0},
+     ["upper_band", "lower_band"]),
+    (BollingerBandsSG, {"window_size": 50, "num_std_dev": 1.0, "reverse": 1},
+     ["upper_band", "lower_band"]),
+]
+
+
+@pytest.mark.parametrize("sg_class, param, keys", cases)
+def test_batch_matches_streaming(sg_class, param, keys):
+    streaming = sg_class()
+    streaming.reset_param(param)
+    expected_signals = []
+    expected_states = {k: [] for k in keys}
+    for price in price_data:
+        expected_signals.append(SIGNAL_CODES[streaming.generate_signals(price)])
+        for k in keys:
+            v = streaming.dynamic.get(k)
+            expected_states[k].append(np.nan if v is None else v)
+
+    batch = sg_class()
+    batch.reset_param(param)
+    signals, states = batch.generate_signals_batch(price_data)
+
+    assert signals.dtype == np.int8
+    assert np.count_nonzero(signals) > 0
+    np.testing.assert_array_equal(signals, expected_signals)
+    for k in keys:
+        # MovingAverageCrossoverSG only sets the averages after warm up
+        body = ~np.isnan(states[k])
+        np.testing.assert_array_equal(states[k][body], np.array(expected_states[k])[body])
+    for k, v in streaming.dynamic.items():
+        np.testing.assert_array_equal(batch.dynamic[k], v)
@@ -0,0 +1,230 @@
+import sys
+sys.path.append(".")
+import numpy as np
+import pytest
+from botocore.exceptions import ClientError
+from src.BitSysTrade.utils.dynamodb import (
+    encode_state, decode_state, convert_for_dynamodb, save_to_dynamodb,
+    read_from_dynamodb, STATE_ATTRIBUTE, DynamoDBStateStore)
+from src.BitSysTrade.signal_generator import (
+    BollingerBandsSG, IncrementalBollingerBandsSG, MovingAverageCrossoverSG)
+from src.BitSysTrade.data_generater import random_data
+
+state = {
+    "count": 3,
+    "big": 10 ** 20,
+    "negative": -5,
+    "ratio": 0.1,
+    "enabled": True,
+    "band": None,
+    "name": "状態",
+    "prices": np.arange(1000, dtype=np.int64) * 10 ** 6,
+    "values": np.linspace(0.0, 1.0, 7),
+    "matrix": np.ones((2, 3), dtype=np.float32),
+    "empty": np.array([], dtype=np.float64),
+    "hobbies": ["reading", 1, 2.5],
+    "nested": {"a": {"b": [None, False]}},
+    "np_scalar": np.float64(1.5),
+}
+
+
+def assert_state_equal(actual, expected):
+    assert actual.keys() == expected.keys()
+    for k, v in expected.items():
+        if isinstance(v, np.ndarray):
+            assert actual[k].dtype == v.dtype
+            np.testing.assert_array_equal(actual[k], v)
+        else:
+            assert actual[k] == v
+            assert type(actual[k]) is (float if isinstance(v, np.floating) else type(v))
+
+
+def test_round_trip():
+    blob = encode_state(state)
+    assert blob[:3] == b"BST"
+    decoded = decode_state(blob)
+    assert_state_equal(decoded, state)
+    decoded["prices"][0] = 1  # writable
+
+
+def test_blob_is_smaller_than_old_format():
+    data = {"prices": np.full(5000, 10 ** 7, dtype=np.int64)}
+    old_size = sum(len(c) for c in convert_for_dynamodb(data["prices"])["LI"].values())
+    assert len(encode_state(data)) < old_size / 10
+
+
+def test_unknown_version_is_rejected():
+    blob = bytearray(encode_state({"a": 1}))
+    blob[3] = 99
+    with pytest.raises(ValueError):
+        decode_state(bytes(blob))
+
+
+def test_table_round_trip_and_old_items(table):
+    save_to_dynamodb(table, {"id": "key", **state}, "id")
+    assert set(table.item("key")) == {"id", STATE_ATTRIBUTE}
+    assert_state_equal(read_from_dynamodb(table, "key", "id"), {"id": "key", **state})
+
+    old = {"id": "old", "count": 3, "prices": np.arange(5)}
+    table.put_item(Item={k: v if k == "id" else convert_for_dynamodb(v)
+                         for k, v in old.items()})
+    restored = read_from_dynamodb(table, "old", "id")
+    assert restored["count"] == 3
+    np.testing.assert_array_equal(restored["prices"], old["prices"])
+
+
+def load_lambda_functions():
+    """Namespace of the Lambda source built from _lambda_base.py."""
+    sys.path.append("app/aws_build")
+    from build_lambda_src import base_file, build_pruned_source, read_base_source
+    base = read_base_source(base_file, "BollingerBandsSG", "NormalExecutor",
+                            "BitflyerMarket")
+    source = build_pruned_source(base, ["src/BitSysTrade"], ["read_from_dynamodb"],
+                                 logger=lambda message: None)
+    namespace = {}
+    exec(compile(source, "lambda.py", "exec"), namespace)
+    return namespace
+
+
+def test_lambda_copy_reads_both_formats(table):
+    lambda_fn = load_lambda_functions()
+    save_to_dynamodb(table, {"id": "key", **state}, "id")
+    restored = lambda_fn["read_from_dynamodb"](table, "key", "id")
+    assert_state_equal(restored, {"id": "key", **state})
+
+    # Old Lambda items hold base64 text chunks
+    old = {"count": 3, "ratio": 0.5, "prices": np.arange(5.0)}
+    item = {k: convert_for_dynamodb(v) for k, v in old.items()}
+    item["prices"]["LF"] = {k: v.decode("utf-8") for k, v in item["prices"]["LF"].items()}
+    table.put_item(Item={"id": "old", **item})
+    restored = lambda_fn["DynamoDBStateStore"](table, "old").load()
+    assert restored["count"] == 3 and restored["ratio"] == 0.5
+    np.testing.assert_array_equal(restored["prices"], old["prices"])
+
+
+prices = random_data(1e7, 0.002, 700, seed=999)
+
+
+@pytest.mark.parametrize("sg_class", [BollingerBandsSG, IncrementalBollingerBandsSG,
+                                      MovingAverageCrossoverSG])
+def test_store_writes_deltas(sg_class, table):
+    param = {"window_size": 300, "num_std_dev": 1.5, "reverse": 1,
+             "short_window": 20, "long_window": 300}
+    expected = sg_class()
+    expected.reset_param(param)
+    sg = sg_class()
+    sg.reset_param(param)
+    for price in prices:
+        # Every invocation starts from DynamoDB like the Lambda handler
+        store = DynamoDBStateStore(table, "key")
+        state = store.load()
+        if state is not None:
+            sg.dynamic = state
+        assert sg.generate_signals(price) == expected.generate_signals(price)
+        store.save(sg.dynamic)
+
+    restored = DynamoDBStateStore(table, "key").load()
+    assert_state_equal(restored, expected.dynamic)
+    # Deltas stay small while the window (300 prices, 2.4 KB) fills up and slides
+    assert len(table.updates) > len(prices) * 0.8
+    assert max(table.updates) <= 300
+    # Old snapshots are deleted after the head switched
+    assert len(table.items) == 2 and table.item("key")["snapshot"]
+
+
+def test_store_reads_old_items_and_survives_failed_compaction(table):
+    save_to_dynamodb(table, {"id": "key", "count": 1, "prices": np.arange(3)}, "id")
+    store = DynamoDBStateStore(table, "key")
+    state = store.load()
+    assert state["count"] == 1 and "id" not in state
+    store.save({"count": 2, "prices": np.arange(4)})
+    assert int(table.item("key")["gen"]) == 0
+    store.save({"count": 3, "prices": np.arange(5)})
+    assert len(table.item("key")["deltas"]) == 1
+
+    # Compaction fails after the new snapshot was written
+    put_item = table.put_item
+
+    def failing_put_item(Item, **kwargs):
+        if Item["id"] == "key":
+            raise RuntimeError("throttled")
+        put_item(Item, **kwargs)
+    table.put_item = failing_put_item
+    with pytest.raises(RuntimeError):
+        store.save({"count": 4, "prices": np.ones((2, 2))})
+    state = DynamoDBStateStore(table, "key").load()
+    assert state["count"] == 3
+    np.testing.assert_array_equal(state["prices"], np.arange(5))
+
+
+def test_concurrent_compactions_do_not_mix_states(table):
+    DynamoDBStateStore(table, "key").save({"count": 1, "prices": np.arange(3)})
+    winner = DynamoDBStateStore(table, "key")
+    loser = DynamoDBStateStore(table, "key")
+    winner.load()
+    loser.load()
+    put_item = table.put_item
+
+    class LoserTable:
+        """The winner compacts and commits right before the loser's snapshot."""
+        def __getattr__(self, name):
+            return getattr(table, name)
+
+        def put_item(self, Item, **kwargs):
+            if "#snapshot" in Item["id"]:
+                winner.save({"count": 2, "prices": np.ones((2, 2))})
+            put_item(Item, **kwargs)
+
+    loser.table = LoserTable()
+    with pytest.raises(ClientError):
+        loser.save({"count": 3, "prices": np.zeros((3, 3))})
+    assert not loser.is_current
+    state = DynamoDBStateStore(table, "key").load()
+    assert state["count"] == 2
+    np.testing.assert_array_equal(state["prices"], np.ones((2, 2)))
+    # The loser deleted its snapshot, the winner the first one
+    assert len(table.items) == 2
+
+
+def test_load_retries_when_a_compaction_deletes_the_snapshot(table):
+    DynamoDBStateStore(table, "key").save({"count": 1, "prices": np.arange(3)})
+    writer = DynamoDBStateStore(table, "key")
+    writer.load()
+    loader = DynamoDBStateStore(table, "key")
+    get_item = table.get_item
+    compactions = [{"count": 2, "prices": np.ones((2, 2))}]
+
+    class CompactingTable:
+        """The writer compacts between the loader's head and snapshot reads."""
+        def __getattr__(self, name):
+            return getattr(table, name)
+
+        def get_item(self, Key, **kwargs):
+            if "#snapshot" in Key["id"] and compactions:
+                writer.save(compactions.pop(0))
+            return get_item(Key=Key, **kwargs)
+
+    loader.table = CompactingTable()
+    state = loader.load()
+    assert state["count"] == 2 and loader.is_current
+    np.testing.assert_array_equal(state["prices"], np.ones((2, 2)))
+
+    # The snapshot is gone again at the second read
+    compactions[:] = [{"count": 3, "prices": np.zeros((3, 3))},
+                      {"count": 4, "prices": np.zeros((4, 4))}]
+    with pytest.raises(ValueError):
+        loader.load()
+    assert not loader.is_current
+    assert DynamoDBStateStore(table, "key").load()["count"] == 4
+
+
+def test_lambda_copy_has_the_store(table):
+    store_class = load_lambda_functions()["DynamoDBStateStore"]
+    for n in range(1, 6):
+        store = store_class(table, "key")
+        store.load()
+        store.save({"id": "key", "count": n, "prices": np.arange(n)})
+    state = DynamoDBStateStore(table, "key").load()
+    assert state["count"] == 5
+    np.testing.assert_array_equal(state["prices"], np.arange(5))
+    assert len(table.updates) == 4
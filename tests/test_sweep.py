@@ -0,0 +1,87 @@
+import sys
+sys.path.append(".")
+import numpy as np
+import pytest
+from src.BitSysTrade.signal_generator import (
+    RollingStatsTable, BollingerBandsSG, MovingAverageCrossoverSG, _rolling_reduce)
+from src.BitSysTrade.market import BacktestMarket
+from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.trade_executor import SpreadOrderExecutor
+from src.BitSysTrade.backtester import GridBacktester
+from src.BitSysTrade.data_generater import random_data
+
+price_data = random_data(1e7, 0.001, 3000, seed=777)
+base_param = {
+    "short_window": 20,
+    "long_window": 50,
+    "window_size": 100,
+    "num_std_dev": 1.5,
+    "reverse": 1,
+    "buy_count_limit": 5,
+    "one_order_quantity": 0.01
+}
+
+
+@pytest.mark.parametrize("integer", [True, False])
+def test_rolling_matches_rolling_reduce(integer):
+    table = RollingStatsTable()
+    values = price_data.astype(np.int64) if integer else price_data
+    for window in [1, 2, 37, 500]:
+        mean, std = table.rolling(price_data, window, integer)
+        np.testing.assert_allclose(mean, _rolling_reduce(values, window, np.mean),
+                                   rtol=1e-12)
+        # Float sums of squares cancel on short windows (error << 1 yen)
+        np.testing.assert_allclose(std, _rolling_reduce(values, window, np.std),
+                                   rtol=1e-6, atol=1e-6 if integer else 0.1)
+    mean, std = table.expanding(price_data, 50, integer)
+    np.testing.assert_allclose(mean, [np.mean(values[:i + 1]) for i in range(50)],
+                               rtol=1e-12)
+    np.testing.assert_allclose(std, [np.std(values[:i + 1]) for i in range(50)],
+                               rtol=1e-6, atol=1e-6 if integer else 0.1)
+
+
+def test_table_is_reused_and_rebuilt_for_new_prices():
+    table = RollingStatsTable()
+    stats = table.rolling(price_data, 100, True)
+    assert table.rolling(price_data, 100, True) is stats
+    other = price_data[:1000].copy()
+    assert len(table.rolling(other, 100, True)[0]) == 901
+
+    # New array object at the same address, shape and strides
+    data = price_data.copy()
+    table.rolling(data[:], 100, False)
+    data[:] = price_data[::-1]
+    mean, _ = table.rolling(data[:], 100, False)
+    np.testing.assert_allclose(mean, _rolling_reduce(data, 100, np.mean), rtol=1e-12)
+    # Equal values share the table
+    assert table.rolling(data.copy(), 100, False)[0] is mean
+
+
+def test_integer_table_refuses_overflowing_windows():
+    prices = np.array([0.0, 6e9, 0.0, 6e9])
+    assert RollingStatsTable().rolling(prices, 2, integer=True) is None
+
+
+def test_memory_budget():
+    table = RollingStatsTable(max_bytes=3 * 2 * 8 * 3000)
+    for window in range(1, 10):
+        table.rolling(price_data, window)
+    assert table._cache.current_bytes <= table.max_bytes
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+@pytest.mark.parametrize("sg_class", [BollingerBandsSG, MovingAverageCrossoverSG])
+def test_grid_sweep_matches_normal_runs(sg_class, n_jobs):
+    params = [dict(base_param, window_size=w, short_window=w // 5,
+                   num_std_dev=s, reverse=r)
+              for w in [50, 100] for s in [1.0, 2.0] for r in [1, -1]]
+    strategy = BacktestStrategy(BacktestMarket(price_data, fee_rate=0.001),
+                                sg_class(), SpreadOrderExecutor(),
+                                engine="vectorized")
+    backtester = GridBacktester(strategy)
+    expected = backtester.backtest(params, 1e6, 0.1)
+    results = backtester.backtest(params, 1e6, 0.1, n_jobs=n_jobs, sweep=True)
+    assert strategy.signal_generator.rolling_stats is None
+    assert [r["trade_count"] for r in results] == [r["trade_count"] for r in expected]
+    for result, exp in zip(results, expected):
+        assert result["total_value"] == pytest.approx(exp["total_value"])
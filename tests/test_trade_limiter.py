@@ -0,0 +1,60 @@
+import sys
+sys.path.append(".")
+import os
+import numpy as np
+import pytest
+from src.BitSysTrade.market import BacktestMarket
+from src.BitSysTrade.strategy import BacktestStrategy, TradeLimiterConfig
+from src.BitSysTrade.signal_generator import BollingerBandsSG
+from src.BitSysTrade.trade_executor import SpreadOrderExecutor
+from src.BitSysTrade.data_generater import random_data
+
+price_data = random_data(1e7, 0.001, 3000, seed=333)
+param = {
+    "window_size": 100,
+    "num_std_dev": 1.5,
+    "reverse": 1,
+    "buy_count_limit": 5,
+    "one_order_quantity": 0.01
+}
+
+
+def test_from_env():
+    config = TradeLimiterConfig.from_env({"TRADE_ENABLE": "0",
+                                          "ORDER_NUM_MAX": "10.0"})
+    assert (config.trade_enable, config.order_num_max) == (False, 10)
+    config = TradeLimiterConfig.from_env({"TRADE_ENABLE": "1"})
+    assert (config.trade_enable, config.order_num_max) == (True, 99999)
+    assert config.allows(99998) and not config.allows(99999)
+    # The Lambda must not trade when TRADE_ENABLE is missing
+    with pytest.raises(KeyError):
+        TradeLimiterConfig.from_env({"ORDER_NUM_MAX": "10"})
+
+
+def test_backtest_does_not_read_or_write_environ(monkeypatch):
+    monkeypatch.delenv("TRADE_ENABLE", raising=False)
+    monkeypatch.setenv("ORDER_NUM_MAX", "0")
+    results = []
+    for limiter in [None, TradeLimiterConfig(trade_enable=False)]:
+        market = BacktestMarket(price_data, fee_rate=0.001)
+        strategy = BacktestStrategy(market, BollingerBandsSG(),
+                                    SpreadOrderExecutor(), limiter=limiter)
+        strategy.reset_all(param, 1e6, 0.1)
+        results.append(strategy.backtest())
+    assert "TRADE_ENABLE" not in os.environ
+    assert results[0]["trade_count"] > 0
+    assert results[1]["trade_count"] == 0
+
+
+def test_open_order_count_limits_trades():
+    market = BacktestMarket(np.full(3, 100.))
+    strategy = BacktestStrategy(market, BollingerBandsSG(), SpreadOrderExecutor(),
+                                limiter=TradeLimiterConfig(order_num_max=2))
+    strategy.reset_all(param, 1e6)
+    assert strategy.trade_limiter()
+    market.place_limit_order("Buy", 1, 90)
+    market.place_limit_order("Buy", 1, 80)
+    assert market.open_order_count() == 2
+    assert not strategy.trade_limiter()
+    market.cancel_order(market.get_open_orders().get(1).order_id)
+    assert strategy.trade_limiter()
@@ -0,0 +1,97 @@
+import sys
+sys.path.append(".")
+import numpy as np
+import pytest
+from src.BitSysTrade.market import BacktestMarket
+from src.BitSysTrade.strategy import BacktestStrategy
+from src.BitSysTrade.signal_generator import (MovingAverageCrossoverSG, MACDSG,
+    BollingerBandsSG)
+from src.BitSysTrade.trade_executor import NormalExecutor, SpreadOrderExecutor
+from src.BitSysTrade.data_generater import random_data
+
+# Generate data for test
+price_data = random_data(1e7, 0.001, 5000, seed=111)
+executor_param = {
+    "buy_count_limit": 5,
+    "one_order_quantity": 0.01
+}
+signal_generators = [
+    (BollingerBandsSG, {"window_size": 100, "num_std_dev": 1.5, "reverse": 1}),
+    (MovingAverageCrossoverSG, {"short_window": 20, "long_window": 80}),
+    (MACDSG, {"short_window": 12, "long_window": 26, "signal_window": 9}),
+]
+
+
+def run_backtest(engine, signal_generator, trade_executor, param, is_fx,
+                 hold_params=[]):
+    market = BacktestMarket(price_data, fee_rate=0.001, is_fx=is_fx)
+    strategy = BacktestStrategy(market, signal_generator, trade_executor,
+                                engine=engine)
+    strategy.reset_all({**param, **executor_param}, 1e6, 0.1)
+    portfolio = strategy.backtest(hold_params=hold_params)
+    return strategy, (portfolio, market.hist, strategy.trade_executor.dynamic)
+
+
+def assert_same_result(expected, actual):
+    expected_portfolio, expected_hist, expected_dynamic = expected
+    portfolio, hist, dynamic = actual
+    assert portfolio == expected_portfolio
+    assert dynamic == expected_dynamic
+    assert hist["signals"] == expected_hist["signals"]
+    assert hist["execute_signals"] == expected_hist["execute_signals"]
+    for k in ["total_value_hist", "total_pos_hist"]:
+        assert not np.isnan(hist[k]).any()
+        np.testing.assert_array_equal(hist[k], expected_hist[k])
+
+
+@pytest.mark.parametrize("is_fx", [False, True])
+@pytest.mark.parametrize("executor_class", [NormalExecutor, SpreadOrderExecutor])
+@pytest.mark.parametrize("sg_class, param", signal_generators)
+def test_vectorized_engine_matches_loop(sg_class, param, executor_class, is_fx):
+    _, loop = run_backtest("loop", sg_class(), executor_class(), param, is_fx)
+    _, vectorized = run_backtest("vectorized", sg_class(), executor_class(),
+                                 param, is_fx)
+    assert loop[0]["trade_count"] > 0
+    assert_same_result(loop, vectorized)
+
+
+def test_vectorized_engine_hold_params():
+    sg_class, param = signal_generators[0]
+    loop, _ = run_backtest("loop", sg_class(), SpreadOrderExecutor(), param,
+                           False, hold_params=["upper_band"])
+    vectorized, _ = run_backtest("vectorized", sg_class(), SpreadOrderExecutor(),
+                                 param, False, hold_params=["upper_band"])
+    expected = np.array([np.nan if v is None else v
+                         for v in loop.hold_params["upper_band"]])
+    np.testing.assert_array_equal(vectorized.hold_params["upper_band"], expected)
+
+
+def test_vectorized_engine_falls_back_for_unknown_hold_params():
+    sg_class, param = signal_generators[0]
+    _, loop = run_backtest("loop", sg_class(), SpreadOrderExecutor(), param,
+                           False, hold_params=["buy_count"])
+    strategy, vectorized = run_backtest("vectorized", sg_class(),
+                                        SpreadOrderExecutor(), param, False,
+                                        hold_params=["buy_count"])
+    assert_same_result(loop, vectorized)
+    assert len(strategy.hold_params["buy_count"]) == len(price_data)
+
+
+class LimitOrderExecutor(NormalExecutor):
+    def execute_trade(self, price, signal):
+        if signal in ['Buy', "Sell"]:
+            offset = price * 0.0005
+            limit = price - offset if signal == 'Buy' else price + offset
+            self.market.place_limit_order(signal,
+                                          self.static["one_order_quantity"], limit)
+
+
+def test_vectorized_engine_falls_back_for_limit_order_subclass():
+    assert NormalExecutor.market_order_only
+    assert not LimitOrderExecutor.market_order_only
+    sg_class, param = signal_generators[0]
+    _, loop = run_backtest("loop", sg_class(), LimitOrderExecutor(), param, False)
+    strategy, vectorized = run_backtest("vectorized", sg_class(),
+                                        LimitOrderExecutor(), param, False)
+    assert loop[0]["trade_count"] > 0
+    assert_same_result(loop, vectorized)